@@ -32,6 +32,10 @@ itemsRecommended=100
 cutoffs="5,10,20"
 cutoffsWrite="5-10-20"
 
+# Distance between POIs (projected or haversine); it is part of the file names, so that a run in
+# another mode does not skip the files of this one
+distanceMode=projected
+
 
 # For each city (single domain, each city individually)
 
@@ -58,6 +62,11 @@ do
 
   cityCompletePOICoords=$path_inputs/${city}"_mapped_lat_lon_wrong_coordinates_by_midpoint.csv"
 
+  # Distance matrix computed once per POI file and memory-mapped by every run
+  distanceCacheDir=$path_inputs/distance_cache
+  # Columnar store of the training trails, built once per training file
+  trailCacheDir=$path_inputs/trail_cache
+
 
   recommendationFolder=${city}"_"${recFolder}
   mkdir -p $recommendationFolder
@@ -68,42 +77,14 @@ do
 
   routes_path="$path_baselines_route"/our_baselines
 
-  # ClosestNNRoute Recommender
-
-  for filter_visits in "ALLOW" "EXCLUDE"
-  do
-    for tiebreaker in "POPULARITY" "DISTANCE"
-    do
-      for recommender in "BaselineSinglePOIRecommender" "WeightedTransitionsRouteRecommender" "ClosestNNRouteRecommender" "MarkovRouteRecommender" "FeatureMarkovRouteRecommender"
-      do
-        recommendation_file=$recommendationFolder/rec_"$city"_"$recommender"_"PrevVisits"$filter_visits"_TieBreaker"$tiebreaker"_WrongCoordsByMidpoint.txt"
-
-        if [ ! -f $recommendation_file ]; then
-          echo "NO EXISTS $recommendation_file"
-          python "$routes_path"/main.py --training_file $trainFile --test_file $testfile --feat_file $cityCompletePOICoords --output_file $recommendation_file --recommender $recommender --n_items 50 --filter_visits $filter_visits --tiebreaker $tiebreaker
-        fi
-
-      done
-      wait
-
-      for neigh in "100" "200"
-      do
-        recommender="KNNRouteRecommender"
-        recommendation_file=$recommendationFolder/rec_"$city"_"$recommender"_"PrevVisits"$filter_visits"_TieBreaker"$tiebreaker"neighs"$neigh"_WrongCoordsByMidpoint.txt"
-        if [ ! -f $recommendation_file ]; then
-          python "$routes_path"/main.py --training_file $trainFile --test_file $testfile --feat_file $cityCompletePOICoords --output_file $recommendation_file --recommender $recommender --n_items 50 --filter_visits $filter_visits --tiebreaker $tiebreaker --n_neigh $neigh
-        fi
-        sleep 1
-      done
-      wait
-
-
-
-    done
-    wait
-
-  done
-  wait
+  # All recommenders and configurations in a single process: each recommender is fitted once and
+  # every PrevVisits/TieBreaker/neighbours variant is generated from the in-memory model.
+  # Existing recommendation files are skipped.
+  python "$routes_path"/main.py --training_file $trainFile --test_file $testfile --feat_file $cityCompletePOICoords \
+    --recommender BaselineSinglePOIRecommender WeightedTransitionsRouteRecommender ClosestNNRouteRecommender MarkovRouteRecommender FeatureMarkovRouteRecommender KNNRouteRecommender \
+    --filter_visits ALLOW EXCLUDE --tiebreaker POPULARITY DISTANCE --n_neigh 100 200 --n_items 50 \
+    --distance_mode $distanceMode --distance_cache_dir $distanceCacheDir --trail_cache_dir $trailCacheDir \
+    --output_pattern $recommendationFolder/rec_"$city"_"{recommender}_PrevVisits{filter_visits}_TieBreaker{tiebreaker}{neighs}_Dist${distanceMode}_WrongCoordsByMidpoint.txt"
 
 
 done # End cities
@@ -146,6 +127,12 @@ do
   recommendationFolder=${city}"_"${recFolder}
   mkdir -p $resFolder
 
+  # Ranking and order-aware route metrics of every rec file in one process (test trails loaded once)
+  python "$path_baselines_route"/our_baselines/evaluation.py --test_file $path_inputs/${city}"_mapped_trails_weather_2_minroutes_4_minPOIs_TestRouteTest.csv" \
+    --feat_file $path_inputs/${city}"_mapped_lat_lon_wrong_coordinates_by_midpoint.csv" --distance_cache_dir $path_inputs/distance_cache \
+    --rec_dir $recommendationFolder --cutoffs 5 10 20 --workers 4 \
+    --output_dir $resFolder --prefix routeev_EvTh"$evthreshold" --summary_file $resFolder/routeev_summary_C"$cutoffsWrite".txt
+
 
   # In every case -> We need to generate other training and test files, as the first column is the trail
   originaltrainFile=$path_inputs/${city}"_mapped_trails_weather_2_minroutes_4_minPOIs_TestRouteTraining.csv"
@@ -0,0 +1,205 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "our_baselines"))
+
+from synthetic_city import SIZES, generate_city
+from Recommenders import VisitFilter, TieBreaker
+import distances as dist
+from main import RECOMMENDERS, DISTANCE_CACHE_RECOMMENDERS, build_recommender
+
+# Bump when the structure of the results changes
+RESULTS_FORMAT_VERSION = 1
+
+# Metrics compared by --compare (lower is better for all of them)
+COMPARED_METRICS = ["fit_seconds", "query_p50_ms", "query_p99_ms", "peak_rss_mb", "tracemalloc_peak_mb"]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _fit(name: str, poi_df, train_df, args):
+    """
+    Fits a recommender as main.py does (including the distance cache of the recommenders that use it).
+    """
+    distance_cache = dist.calculate_distance_cache(poi_df) if name in DISTANCE_CACHE_RECOMMENDERS else None
+    return build_recommender(name, poi_df, train_df, args, args.n_neigh, distance_cache)
+
+
+def run_case(size: str, name: str, args) -> dict:
+    """
+    Benchmarks one recommender on one city size (meant to run in a fresh process, so the peak RSS is its own).
+
+    The city is generated, the recommender fitted once for the timing and (unless disabled) once
+    more under tracemalloc, and then queried from the first POI of up to args.queries test users
+    with every visit filter and tiebreaker.
+
+    Returns:
+    - dict: The measurements of the case.
+    """
+    dist.set_distance_mode(args.distance_mode)
+    n_pois, n_users, n_trails = SIZES[size]
+    poi_df, train_df, test_df = generate_city(n_pois, n_users, n_trails, args.mean_trail_length, seed=args.seed)
+    result = {"size": size, "recommender": name, "n_pois": n_pois, "n_users": n_users, "n_trails": n_trails,
+              "n_train_rows": len(train_df), "rss_after_data_mb": _peak_rss_mb()}
+
+    started = time.perf_counter()
+    recommender = _fit(name, poi_df, train_df, args)
+    result["fit_seconds"] = time.perf_counter() - started
+    result["peak_rss_after_fit_mb"] = _peak_rss_mb()
+
+    first_visits = test_df.loc[test_df.groupby("user_id", sort=False)["timestamp"].idxmin()].head(args.queries)
+    queries = list(zip(first_visits["user_id"].tolist(), first_visits["venue_id"].tolist()))
+    latencies, errors = [], 0
+    for filter_visits in VisitFilter:
+        for tiebreaker in TieBreaker:
+            for user, starting_poi in queries:
+                started = time.perf_counter()
+                try:
+                    recommender.recommend_from_poi(user, args.n_items, starting_poi, filter_visits, tiebreaker)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+    latencies = np.array(latencies) * 1000
+    result.update({
+        "queries": len(latencies),
+        "query_errors": errors,
+        "query_mean_ms": float(latencies.mean()) if len(latencies) else None,
+        "query_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "query_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        "peak_rss_mb": _peak_rss_mb()
+    })
+
+    if args.tracemalloc:
+        del recommender
+        tracemalloc.start()
+        _fit(name, poi_df, train_df, args)
+        result["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+    return result
+
+
+def _run_case_in_child(task: tuple) -> dict:
+    size, name, args = task
+    try:
+        return run_case(size, name, args)
+    except Exception as e:
+        return {"size": size, "recommender": name, "error": f"{type(e).__name__}: {e}"}
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list:
+    """
+    Compares two result files case by case.
+
+    Parameters:
+    - baseline: dict, results of the reference version.
+    - results: dict, results of the new version.
+    - threshold: float, relative increase of a metric reported as a regression.
+
+    Returns:
+    - list: (size, recommender, metric, baseline value, new value, ratio) of the regressions.
+    """
+    reference = {(case["size"], case["recommender"]): case for case in baseline["results"]}
+    regressions = []
+    for case in results["results"]:
+        old = reference.get((case["size"], case["recommender"]))
+        if old is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if old.get(metric) and case.get(metric) is not None:
+                ratio = case[metric] / old[metric]
+                if ratio > 1 + threshold:
+                    regressions.append((case["size"], case["recommender"], metric, old[metric], case[metric], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the route recommenders of main.py on synthetic cities.")
+    parser.add_argument("--sizes", type=str, nargs="+", default=["xs", "s", "m"], choices=list(SIZES), help="City sizes to run.")
+    parser.add_argument("--recommender", type=str, nargs="+", choices=RECOMMENDERS, default=RECOMMENDERS, help="Recommender(s) to benchmark.")
+    parser.add_argument("--queries", type=int, default=200, help="Test users queried (with every visit filter and tiebreaker).")
+    parser.add_argument("--n_items", type=int, default=10, help="Number of items to recommend.")
+    parser.add_argument("--n_neigh", type=int, default=100, help="Number of neighbours (for KNNRouteRecommender).")
+    parser.add_argument("--pad_neighbours", action="store_true", help="Fill the neighbourhoods of KNNRouteRecommender with zero-similarity users.")
+    parser.add_argument("--n_distance_neighbours", type=int, default=100, help="Nearest POIs linked by the distance component of WeightedTransitionsRouteRecommender (-1 links every POI).")
+    parser.add_argument("--max_order", type=int, default=3, help="Maximum context length of VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--min_context_count", type=int, default=2, help="Minimum count of the contexts of two or more POIs kept by VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--memory_budget_mb", type=float, default=256, help="Approximate memory budget (MB) for building VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--distance_mode", type=str, default=dist.PROJECTED, choices=dist.DISTANCE_MODES, help="Distance between POIs: Euclidean on coordinates projected once to float32 metres (error bound in distances.Projection) or exact haversine.")
+    parser.add_argument("--mean_trail_length", type=float, default=5.0, help="Mean number of POIs of a synthetic trail.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic cities.")
+    parser.add_argument("--max_distance_cache_pois", type=int, default=20000, help="Skip the recommenders that use the full distance matrix on larger cities.")
+    parser.add_argument("--no_tracemalloc", dest="tracemalloc", action="store_false", help="Skip the second fit under tracemalloc.")
+    parser.add_argument("--output_file", type=str, default="benchmark_results.json", help="Path to write the JSON results to.")
+    parser.add_argument("--compare", type=str, default=None, help="Results file of a previous version to report regressions against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative increase reported as a regression by --compare.")
+    args = parser.parse_args()
+
+    # Every case runs in a fresh interpreter so its peak RSS is not inflated by the previous ones
+    context = mp.get_context("spawn")
+    results = []
+    for size in args.sizes:
+        for name in dict.fromkeys(args.recommender):
+            if name in DISTANCE_CACHE_RECOMMENDERS and SIZES[size][0] > args.max_distance_cache_pois:
+                print(f"Skipping {name} on {size}: distance matrix of {SIZES[size][0]} POIs")
+                results.append({"size": size, "recommender": name, "skipped": "distance matrix too large"})
+                continue
+
+            print(f"Running {name} on {size}")
+            with context.Pool(1) as pool:
+                result = pool.apply(_run_case_in_child, ((size, name, args),))
+            results.append(result)
+            if "error" in result:
+                print(f"  failed: {result['error']}")
+            else:
+                print(f"  fit {result['fit_seconds']:.2f} s, query p50 {result['query_p50_ms']:.3f} ms, "
+                      f"p99 {result['query_p99_ms']:.3f} ms, peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    output = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": vars(args)
+        },
+        "results": results
+    }
+    with open(args.output_file, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results saved to {args.output_file}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, output, args.threshold)
+        for size, name, metric, old, new, ratio in regressions:
+            print(f"Regression {name} on {size}: {metric} {old:.4g} -> {new:.4g} (x{ratio:.2f})")
+        if not regressions:
+            print(f"No regressions above {args.threshold:.0%} against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Size ladder used by the benchmark harness: (POIs, users, trails)
+SIZES = {
+    "xs": (500, 200, 2000),
+    "s": (2000, 1000, 10000),
+    "m": (10000, 5000, 50000),
+    "l": (50000, 20000, 200000),
+    "xl": (200000, 100000, 1000000)
+}
+
+# Approximate km per degree of latitude
+KM_PER_DEGREE = 111.32
+
+
+def generate_city(n_pois: int, n_users: int, n_trails: int, mean_trail_length: float = 5.0, n_categories: int = 30,
+                  n_districts: int = 25, radius_km: float = 10.0, invalid_fraction: float = 0.005,
+                  center: tuple = (40.73, -73.99), seed: int = 0) -> tuple:
+    """
+    Generates a synthetic city with the layout of the files read by main.py.
+
+    POIs are spread around district centres with Zipf popularities and categories; a small fraction
+    has the (-1, -1) coordinates of POIs without location. Every user lives in a district and has a
+    Zipf activity. A trail starts at a POI of the user's district chosen by popularity and then, at
+    every step, moves to a POI of the same district (70%), of any district (20%) or of the same
+    category (10%). Trail lengths are 2 plus a Poisson variable, so their mean is mean_trail_length.
+    The last trail of every user with more than one trail is held out as the test set.
+
+    Parameters:
+    - n_pois: int, number of POIs.
+    - n_users: int, number of users.
+    - n_trails: int, number of trails (training and test).
+    - mean_trail_length: float, mean number of POIs of a trail (at least 2).
+    - n_categories: int, number of POI categories.
+    - n_districts: int, number of districts the POIs cluster around.
+    - radius_km: float, radius of the city.
+    - invalid_fraction: float, fraction of POIs without valid coordinates.
+    - center: tuple, (latitude, longitude) of the city centre.
+    - seed: int, seed of the random generator.
+
+    Returns:
+    - tuple: (poi_df, train_df, test_df) DataFrames with the columns of main.py
+      (venue_id, latitude, longitude, category_lvlFs and trail_id, user_id, venue_id, timestamp).
+    """
+    rng = np.random.default_rng(seed)
+
+    # POIs around the district centres
+    district_lat = center[0] + rng.uniform(-1, 1, n_districts) * radius_km / KM_PER_DEGREE
+    district_lon = center[1] + rng.uniform(-1, 1, n_districts) * radius_km / (KM_PER_DEGREE * np.cos(np.radians(center[0])))
+    poi_district = rng.integers(n_districts, size=n_pois)
+    spread = radius_km / (4 * KM_PER_DEGREE)
+    latitude = np.round(district_lat[poi_district] + rng.normal(0, spread, n_pois), 6)
+    longitude = np.round(district_lon[poi_district] + rng.normal(0, spread, n_pois), 6)
+    invalid = rng.random(n_pois) < invalid_fraction
+    latitude[invalid], longitude[invalid] = -1, -1
+
+    category_weights = 1 / np.arange(1, n_categories + 1)
+    poi_category = rng.choice(n_categories, size=n_pois, p=category_weights / category_weights.sum())
+    popularity = 1 / rng.permutation(np.arange(1, n_pois + 1)) ** 0.8
+
+    venue_ids = rng.permutation(n_pois) + 1
+    poi_df = pd.DataFrame({
+        "venue_id": venue_ids,
+        "latitude": latitude,
+        "longitude": longitude,
+        "category_lvlFs": np.array([f"Category {c}" for c in range(n_categories)])[poi_category]
+    })
+
+    # Cumulative popularity of the POIs of each group, to sample a popular POI of a group in O(log n)
+    def group_sampler(groups: np.ndarray, n_groups: int):
+        order = np.lexsort((np.arange(n_pois), groups))
+        offsets = np.searchsorted(groups[order], np.arange(n_groups + 1))
+        cumulative = np.cumsum(popularity[order])
+        starts = np.where(offsets[:-1] > 0, cumulative[offsets[:-1] - 1], 0.0)
+        ends = np.where(offsets[1:] > 0, cumulative[offsets[1:] - 1], 0.0)
+
+        def sample(group: np.ndarray) -> np.ndarray:
+            empty = offsets[group] == offsets[group + 1]
+            draws = starts[group] + rng.random(len(group)) * (ends[group] - starts[group])
+            positions = np.clip(np.searchsorted(cumulative, draws, side='right'), offsets[group], offsets[group + 1] - 1)
+            return np.where(empty, rng.integers(n_pois, size=len(group)), order[np.maximum(positions, 0)])
+        return sample
+
+    by_district = group_sampler(poi_district, n_districts)
+    by_category = group_sampler(poi_category, n_categories)
+    anywhere = group_sampler(np.zeros(n_pois, dtype=np.int64), 1)
+
+    # Trails of users with a home district and a Zipf activity
+    user_district = rng.integers(n_districts, size=n_users)
+    activity = 1 / np.arange(1, n_users + 1) ** 0.7
+    trail_user = rng.choice(n_users, size=n_trails, p=activity / activity.sum())
+    lengths = 2 + rng.poisson(max(mean_trail_length - 2, 0), n_trails)
+
+    pois = np.empty((n_trails, lengths.max()), dtype=np.int64)
+    pois[:, 0] = by_district(user_district[trail_user])
+    for step in range(1, lengths.max()):
+        move = rng.random(n_trails)
+        current = pois[:, step - 1]
+        pois[:, step] = np.where(
+            move < 0.7, by_district(poi_district[current]),
+            np.where(move < 0.9, anywhere(np.zeros(n_trails, dtype=np.int64)), by_category(poi_category[current]))
+        )
+
+    valid = np.arange(lengths.max()) < lengths[:, None]
+    trail_ids = np.repeat(np.arange(n_trails) + 1, lengths)
+    trails = pd.DataFrame({
+        "trail_id": trail_ids,
+        "user_id": np.repeat(trail_user + 1, lengths),
+        "venue_id": venue_ids[pois[valid]],
+        "timestamp": 1_600_000_000 + trail_ids * 86_400 + (np.arange(valid.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)) * 1800
+    })
+
+    # Last trail of every user with more than one trail goes to the test set
+    last_trails = trails.groupby("user_id")["trail_id"].agg(["max", "nunique"])
+    test_trails = last_trails.loc[last_trails["nunique"] > 1, "max"]
+    is_test = trails["trail_id"].isin(test_trails)
+    return poi_df, trails[~is_test].reset_index(drop=True), trails[is_test].reset_index(drop=True)
+
+
+def write_city(output_dir: str, poi_df: pd.DataFrame, train_df: pd.DataFrame, test_df: pd.DataFrame) -> tuple:
+    """
+    Writes a city as the tab-separated, headerless files read by main.py.
+
+    Returns:
+    - tuple: (feat_file, training_file, test_file) paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = tuple(os.path.join(output_dir, name) for name in ["feat.csv", "train.csv", "test.csv"])
+    for df, path in zip([poi_df, train_df, test_df], paths):
+        df.to_csv(path, sep="\t", header=False, index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic city (POIs, training and test trails).")
+    parser.add_argument("--size", type=str, default="s", choices=list(SIZES), help="Size of the city (POIs, users, trails).")
+    parser.add_argument("--mean_trail_length", type=float, default=5.0, help="Mean number of POIs of a trail.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Directory to write feat.csv, train.csv and test.csv to.")
+    args = parser.parse_args()
+
+    n_pois, n_users, n_trails = SIZES[args.size]
+    paths = write_city(args.output_dir, *generate_city(n_pois, n_users, n_trails, args.mean_trail_length, seed=args.seed))
+    print(f"City written to {', '.join(paths)}")
+
+if __name__ == "__main__":
+    main()
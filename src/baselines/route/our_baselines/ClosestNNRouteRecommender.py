@@ -1,5 +1,5 @@
 from Recommenders import BasicRouteRecommender, VisitFilter, TieBreaker
-import utils as ut
+import distances as dist
 from typing import List
 import math
 import pandas as pd
@@ -10,33 +10,27 @@ class ClosestNNRouteRecommender(BasicRouteRecommender):
     Recommender system that suggests POIs based on proximity to a starting POI and iteratively
     recommends the closest POI to the current location, with caching for distances.
     """
+    # distance_matrix is a view of the distance cache, rebuilt by _after_load
+    INPUT_ATTRIBUTES = BasicRouteRecommender.INPUT_ATTRIBUTES + ('distance_matrix',)
 
-    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame):
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, distance_cache: pd.DataFrame = None, n_neighbours: int = 64):
         super().__init__(poi_df, trail_df)
-        self.distance_cache = self._calculate_distance_cache()
+        with self._stage("distance_cache"):
+            self.distance_cache = distance_cache if distance_cache is not None else dist.calculate_distance_cache(self.poi_df)
 
-    def _calculate_distance_cache(self) -> pd.DataFrame:
-        """
-        Precomputes a distance matrix for all POIs with valid coordinates.
-
-        Returns:
-        - pd.DataFrame: A DataFrame where element (i, j) represents the distance between POI i and POI j.
-        """
-        valid_pois = self.poi_df[(self.poi_df['latitude'] != -1) & (self.poi_df['longitude'] != -1)]
-        poi_ids = valid_pois['venue_id'].values
-        latitudes = valid_pois['latitude'].values
-        longitudes = valid_pois['longitude'].values
-
-        n = len(poi_ids)
-        distance_matrix = np.zeros((n, n))
+        # Positional view of the distance cache: POI i is row/column i
+        self.poi_ids = self.distance_cache.index.to_numpy()
+        self.distance_matrix = self.distance_cache.to_numpy()
+        # Vocabulary index -> distance cache position (-1 for POIs without coordinates), and back
+        self.cache_positions = pd.Index(self.poi_ids).get_indexer(self.vocabulary.poi_ids)
+        self.vocabulary_indices = self.vocabulary.indices(self.poi_ids)
 
-        for i in range(n):
-            for j in range(i + 1, n):
-                dist = ut.haversine(latitudes[i], longitudes[i], latitudes[j], longitudes[j])
-                distance_matrix[i, j] = dist
-                distance_matrix[j, i] = dist
+        # Per-POI neighbour lists sorted nearest-first, walked before falling back to a full row
+        with self._stage("nearest_neighbours"):
+            self.neighbour_indices, self.neighbour_distances = dist.nearest_neighbours(self.distance_matrix, n_neighbours)
 
-        return pd.DataFrame(distance_matrix, index=poi_ids, columns=poi_ids)
+    def _after_load(self):
+        self.distance_matrix = self.distance_cache.to_numpy()
 
     def recommend_for_user(self, user: int, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
         pass
@@ -53,76 +47,128 @@ class ClosestNNRouteRecommender(BasicRouteRecommender):
         '''
 
     def recommend_from_poi(self, user: int, n_items: int, starting_poi: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
-        if starting_poi not in self.poi_df['venue_id'].values:
+        poi_index = self.vocabulary.index_of(starting_poi)
+        if poi_index < 0 or not self.vocabulary.in_poi_df[poi_index]:
             raise ValueError(f"Starting POI {starting_poi} does not exist in the dataset.")
 
-        user_trails = self.trail_df[self.trail_df['user_id'] == user]
-        visited_pois = user_trails['venue_id'].tolist()
-
+        visited_pois = self.visited_poi_indices(user)
 
         return self._recommend_closest(starting_poi, n_items, visited_pois, filter_visits, tiebreaker)
 
     def calculate_midpoint(self, visited_pois):
-        visited_coords = self.poi_df[self.poi_df['venue_id'].isin(visited_pois)][['latitude', 'longitude']]
-
-        x = sum(math.cos(math.radians(lat)) * math.cos(math.radians(lon)) for lat, lon in zip(visited_coords['latitude'], visited_coords['longitude']))
-        y = sum(math.cos(math.radians(lat)) * math.sin(math.radians(lon)) for lat, lon in zip(visited_coords['latitude'], visited_coords['longitude']))
-        z = sum(math.sin(math.radians(lat)) for lat in visited_coords['latitude'])
-
-        total = len(visited_coords)
-        if total == 0:
+        """
+        Returns the (latitude, longitude) midpoint of the visited venue IDs with valid coordinates, or
+        None if there are none: the centroid of the projected coordinates in the PROJECTED distance
+        mode, the normalised mean of the unit vectors otherwise.
+        """
+        indices = self.vocabulary.indices(pd.unique(np.asarray(visited_pois)))
+        indices = indices[indices >= 0]
+        indices = indices[self.vocabulary.has_coordinates[indices]]
+        if len(indices) == 0:
             return None
 
-        x /= total
-        y /= total
-        z /= total
+        if dist.distance_mode == dist.PROJECTED:
+            latitude, longitude = self.vocabulary.projection.unproject(self.vocabulary.x[indices].mean(dtype=np.float64),
+                                                                       self.vocabulary.y[indices].mean(dtype=np.float64))
+            return float(latitude), float(longitude)
+
+        lat = np.radians(self.vocabulary.latitude[indices])
+        lon = np.radians(self.vocabulary.longitude[indices])
+        x = (np.cos(lat) * np.cos(lon)).mean()
+        y = (np.cos(lat) * np.sin(lon)).mean()
+        z = np.sin(lat).mean()
 
         central_longitude = math.atan2(y, x)
         central_latitude = math.atan2(z, math.sqrt(x ** 2 + y ** 2))
         return math.degrees(central_latitude), math.degrees(central_longitude)
 
     def _recommend_closest(self, starting_poi, n_items, visited_pois, filter_visits, tiebreaker) -> List[int]:
-        all_pois = self.poi_df[['venue_id', 'latitude', 'longitude']]
-
-        # Exclude invalid POIs (-1, -1 coordinates)
-        all_pois = all_pois[(all_pois['latitude'] != -1) & (all_pois['longitude'] != -1)]
+        current_origin = self.cache_positions[self.vocabulary.index_of(starting_poi)]
+        if current_origin < 0:
+            raise ValueError(f"Starting POI {starting_poi} does not have valid coordinates.")
 
+        # Candidates are the POIs with valid coordinates that are not excluded
+        excluded = np.zeros(len(self.poi_ids), dtype=bool)
         if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
-            all_pois = all_pois[~all_pois['venue_id'].isin(visited_pois)]
+            # visited_pois holds vocabulary indices
+            visited_positions = self.cache_positions[visited_pois]
+            excluded[visited_positions[visited_positions >= 0]] = True
 
-        candidates = all_pois['venue_id'].values
         recommendations = []
         recommendations.append(starting_poi)
-        candidates = [poi for poi in candidates if poi != starting_poi]
-        current_origin = starting_poi
+        excluded[current_origin] = True
+        remaining = len(excluded) - np.count_nonzero(excluded)
 
-        while len(recommendations) < n_items:
-            closest_pois = self._find_closest_pois(current_origin, candidates)
+        while len(recommendations) < n_items and remaining > 0:
+            step_started = self._profile_clock()
+            closest_pois, n_scanned = self._find_closest_pois(current_origin, excluded)
 
             # Apply tiebreaker if there are ties
             if len(closest_pois) > 1:
                 if tiebreaker == TieBreaker.POPULARITY:
-                    closest_pois = sorted(
-                        closest_pois,
-                        key=lambda poi: self.trail_df[self.trail_df['venue_id'] == poi].shape[0],
-                        reverse=True
-                    )
+                    with self._stage("tiebreak"):
+                        closest_pois = closest_pois[self.vocabulary.popularity_order(self.vocabulary_indices[closest_pois])]
 
             closest_poi = closest_pois[0]
-            recommendations.append(closest_poi)
-            candidates = [poi for poi in candidates if poi != closest_poi]
-            if len(candidates) == 0:
-                break
+            recommendations.append(self.poi_ids[closest_poi])
+            excluded[closest_poi] = True
+            remaining -= 1
 
             # Update the origin for next iteration
             current_origin = closest_poi
+            self._record_step(step_started, n_scanned)
 
         return recommendations
 
-    def _find_closest_pois(self, origin, poi_candidates) -> List[int]:
-        valid_candidates = [poi for poi in poi_candidates if poi in self.distance_cache.columns and origin in self.distance_cache.index]
-        distances = [(poi, self.distance_cache.loc[origin, poi]) for poi in valid_candidates]
-        min_distance = min(distances, key=lambda x: x[1])[1]
+    def _find_closest_pois(self, origin: int, excluded: np.ndarray) -> tuple:
+        """
+        Finds the positions of the non-excluded POIs at minimum distance from origin, in column order.
+
+        In the HAVERSINE mode the POIs within dist.tie_bound of the minimum stored distance are
+        re-checked with utils.haversine, so the float32 rounding of the cache neither merges nor
+        splits ties.
 
-        # Return POIs with the minimum distance
-        return [poi_id for poi_id, distance in distances if distance == min_distance]
+        Returns:
+        - tuple: (positions, number of candidate POIs scanned).
+        """
+        neighbours = self.neighbour_indices[origin]
+        distances = self.neighbour_distances[origin]
+        available = ~excluded[neighbours]
+
+        if available.any():
+            bound = self._tie_bound(distances[np.argmax(available)])
+            # Ties at the last listed distance may continue past the end of the list
+            if bound < distances[-1] or len(neighbours) == len(excluded):
+                self._record_cache("neighbour_list", True)
+                return self._exact_ties(origin, neighbours[available & (distances <= bound)]), len(neighbours)
+
+        self._record_cache("neighbour_list", False)
+        candidates = np.flatnonzero(~excluded)
+        candidate_distances = self.distance_matrix[origin, candidates]
+        bound = self._tie_bound(candidate_distances.min())
+        return self._exact_ties(origin, candidates[candidate_distances <= bound]), len(neighbours) + len(candidates)
+
+    def _tie_bound(self, min_distance):
+        """
+        Largest stored distance that may tie with min_distance: itself, unless ties are re-checked.
+        """
+        if dist.distance_mode == dist.HAVERSINE:
+            return dist.tie_bound(min_distance)
+        return min_distance
+
+    def _exact_ties(self, origin: int, positions: np.ndarray) -> np.ndarray:
+        """
+        Keeps, in column order, the positions at the minimum utils.haversine distance from origin
+        (HAVERSINE mode only; the positions are returned as they are otherwise).
+        """
+        if dist.distance_mode != dist.HAVERSINE or len(positions) < 2:
+            return positions
+
+        positions = np.sort(positions)
+        # The cache mirrors the distances computed from the POI in the lower position (column order
+        # follows the vocabulary order)
+        origins = np.full(len(positions), self.vocabulary_indices[origin])
+        destinations = self.vocabulary_indices[positions]
+        distances = dist.haversine_pairs(self.vocabulary.latitude, self.vocabulary.longitude,
+                                         np.minimum(origins, destinations), np.maximum(origins, destinations))
+        return positions[distances == distances.min()]
@@ -1,174 +1,350 @@
 from Recommenders import BasicRouteRecommender, TieBreaker, VisitFilter
-import utils as ut
+import distances as dist
+import trails
 from typing import List
-from enum import Enum
+import math
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 class FeatureMarkovRouteRecommender(BasicRouteRecommender):
     """
     Recommender system based on first-order Markov chains, maximizing transitions between features of POIs.
     """
-    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, feature_column: str):
-        super().__init__(poi_df, trail_df)
+    # distance_matrix is a view of the distance cache, rebuilt by _after_load
+    INPUT_ATTRIBUTES = BasicRouteRecommender.INPUT_ATTRIBUTES + ('distance_matrix',)
 
-        # Create dictionaries for POI mapping
-        self.id_to_int = {poi_id: idx for idx, poi_id in enumerate(poi_df['venue_id'].unique())}
-        self.int_to_id = {idx: poi_id for poi_id, idx in self.id_to_int.items()}
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, feature_column: str, distance_cache: pd.DataFrame = None, grid_cell_degrees: float = 0.01):
+        """
+        Parameters:
+        - poi_df: pd.DataFrame, DataFrame containing POI information.
+        - trail_df: pd.DataFrame, DataFrame containing user trail information.
+        - feature_column: str, column of poi_df holding the POI feature (category).
+        - distance_cache: pd.DataFrame, precomputed distance matrix (computed if None).
+        - grid_cell_degrees: float, side in degrees of the cells of the spatial grid used for distance ties.
+        """
+        super().__init__(poi_df, trail_df, feature_column=feature_column)
 
         self.feature_column = feature_column
-        self.feature_transition_matrix = self._calculate_feature_transition_matrix()
-        self.poi_popularity = self._calculate_popularity()
-        self.distance_cache = self._calculate_distance_cache()
+        self.grid_cell_degrees = grid_cell_degrees
+        with self._stage("feature_transitions"):
+            self.feature_transition_matrix = self._calculate_feature_transition_matrix()
+            self.successor_feature_offsets, self.successor_features = self._calculate_successor_features()
+        with self._stage("distance_cache"):
+            self.distance_cache = distance_cache if distance_cache is not None else dist.calculate_distance_cache(self.poi_df)
+            self.distance_matrix = self.distance_cache.to_numpy()
+            # Vocabulary index -> distance cache position (-1 for POIs without coordinates)
+            self.cache_positions = self.distance_cache.index.get_indexer(self.vocabulary.poi_ids)
+            # Error bound of the cached distances relative to haversine (for the grid lower bounds)
+            located = self.cache_positions >= 0
+            self.distance_rtol, self.distance_atol_km = dist.distance_tolerance(self.vocabulary.latitude[located], self.vocabulary.longitude[located])
+        with self._stage("feature_buckets"):
+            self._build_feature_buckets()
+        with self._stage("feature_grid"):
+            self._build_feature_grid()
+
+    def _after_load(self):
+        self.distance_matrix = self.distance_cache.to_numpy()
+
+    def _calculate_feature_transition_matrix(self) -> sparse.csr_matrix:
+        """
+        Calculates the feature transition matrix for the Markov chain.
+
+        Trails are mapped to the category ids of the vocabulary; visits to POIs without feature are
+        skipped, and every other pair of consecutive visits (in trail order, repetitions included)
+        is a transition.
 
-    def _calculate_distance_cache(self) -> pd.DataFrame:
+        Returns:
+        - sparse.csr_matrix: A (n_features x n_features) matrix over the vocabulary category ids, where
+          element (i, j) is the probability of transitioning from feature i to feature j.
         """
-        Precomputes a distance matrix for all POIs with valid coordinates.
+        n_features = len(self.vocabulary.category_labels)
+        store = trails.store_of(self.trail_df, dedupe=True)
+        features = self.vocabulary.categories[self.vocabulary.indices(store.pois)]
+        feature_from, feature_to, weights = store.transitions(features, features >= 0)
+
+        # Count transitions and normalize
+        matrix = sparse.csr_matrix(
+            (weights.astype(np.float64), (feature_from, feature_to)),
+            shape=(n_features, n_features)
+        )
+        matrix.sum_duplicates()
+        row_sums = np.asarray(matrix.sum(axis=1)).ravel()
+        matrix.data /= np.repeat(row_sums, np.diff(matrix.indptr))
+
+        return matrix
+
+    def _calculate_successor_features(self) -> tuple:
+        """
+        Precomputes, for every feature, the features reached with the maximum transition probability.
 
         Returns:
-        - pd.DataFrame: A DataFrame where element (i, j) represents the distance between POI i and POI j.
+        - tuple: (offsets, features), the successors of feature i being features[offsets[i]:offsets[i + 1]].
         """
-        valid_pois = self.poi_df[(self.poi_df['latitude'] != -1) & (self.poi_df['longitude'] != -1)]
-        poi_ids = valid_pois['venue_id'].values
-        latitudes = valid_pois['latitude'].values
-        longitudes = valid_pois['longitude'].values
+        matrix = self.feature_transition_matrix
+        n_features = matrix.shape[0]
+        row_lengths = np.diff(matrix.indptr)
+        rows = np.repeat(np.arange(n_features), row_lengths)
 
-        n = len(poi_ids)
-        distance_matrix = np.zeros((n, n))
+        row_max = np.zeros(n_features)
+        non_empty = row_lengths > 0
+        row_max[non_empty] = np.maximum.reduceat(matrix.data, matrix.indptr[:-1][non_empty])
+        is_max = (matrix.data == row_max[rows]) & (matrix.data > 0)
 
-        for i in range(n):
-            for j in range(i + 1, n):
-                dist = ut.haversine(latitudes[i], longitudes[i], latitudes[j], longitudes[j])
-                distance_matrix[i, j] = dist
-                distance_matrix[j, i] = dist
+        offsets = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[is_max], minlength=n_features), out=offsets[1:])
+        return offsets, matrix.indices[is_max].astype(np.int32)
 
-        return pd.DataFrame(distance_matrix, index=poi_ids, columns=poi_ids)
+    def _build_feature_buckets(self):
+        """
+        Groups the POIs of every feature into a bucket sorted by decreasing popularity (ties by
+        vocabulary index). The POIs of feature f are bucket_pois[bucket_offsets[f]:bucket_offsets[f + 1]].
+        """
+        categories = self.vocabulary.categories
+        n_features = len(self.vocabulary.category_labels)
+        pois = np.flatnonzero(categories >= 0)
 
-    def _calculate_feature_transition_matrix(self) -> pd.DataFrame:
+        self.bucket_pois = pois[np.lexsort((pois, -self.vocabulary.popularity[pois], categories[pois]))].astype(np.int32)
+        self.bucket_offsets = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(categories[pois], minlength=n_features), out=self.bucket_offsets[1:])
+
+    def _grid_cells(self, latitudes, longitudes) -> tuple:
         """
-        Calculates the feature transition matrix for the Markov chain.
+        Returns the (latitude, longitude) cell of the grid containing each point.
+        """
+        n_lat, n_lon = int(math.ceil(180 / self.grid_cell_degrees)), int(math.ceil(360 / self.grid_cell_degrees))
+        lat_cells = np.clip(np.floor((np.asarray(latitudes) + 90) / self.grid_cell_degrees), 0, n_lat - 1).astype(np.int64)
+        lon_cells = np.clip(np.floor((np.asarray(longitudes) + 180) / self.grid_cell_degrees), 0, n_lon - 1).astype(np.int64)
+        return lat_cells, lon_cells
 
-        Returns:
-        - pd.DataFrame: A DataFrame where rows and columns represent features,
-          and values represent probabilities of transitioning between features.
+    def _grid_keys(self, features, lat_cells, lon_cells) -> np.ndarray:
+        n_lat, n_lon = int(math.ceil(180 / self.grid_cell_degrees)), int(math.ceil(360 / self.grid_cell_degrees))
+        return (np.asarray(features, dtype=np.int64) * n_lat + lat_cells) * n_lon + lon_cells
+
+    def _build_feature_grid(self):
         """
-        # Extract features from the POI dataframe
-        poi_features = self.poi_df[[self.feature_column, 'venue_id']].dropna()
-        transitions = []
+        Builds a spatial grid per feature over the POIs in the distance cache.
 
-        # Iterate over trails to collect transitions between features
-        for _, trail_data in self.trail_df.groupby('trail_id'):
-            pois_in_trail = trail_data['venue_id'].tolist()
+        The non-empty cells are identified by a key combining feature, latitude cell and longitude cell;
+        grid_keys holds them sorted, and the POIs of cell grid_keys[i] are
+        grid_pois[grid_offsets[i]:grid_offsets[i + 1]], in vocabulary order. The cells of feature f are
+        the slice grid_feature_offsets[f]:grid_feature_offsets[f + 1] of grid_keys, and
+        grid_feature_bounds[f] holds their (min lat cell, max lat cell, min lon cell, max lon cell).
+        """
+        vocabulary = self.vocabulary
+        n_features = len(vocabulary.category_labels)
+        pois = np.flatnonzero((vocabulary.categories >= 0) & (self.cache_positions >= 0))
+        features = vocabulary.categories[pois]
+        lat_cells, lon_cells = self._grid_cells(vocabulary.latitude[pois], vocabulary.longitude[pois])
+        keys = self._grid_keys(features, lat_cells, lon_cells)
+
+        order = np.lexsort((pois, keys))
+        self.grid_pois = pois[order].astype(np.int32)
+        self.grid_keys, starts = np.unique(keys[order], return_index=True)
+        self.grid_offsets = np.append(starts, len(pois)).astype(np.int64)
+
+        cell_features = features[order][starts]
+        self.grid_feature_offsets = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_features, minlength=n_features), out=self.grid_feature_offsets[1:])
+
+        self.grid_feature_bounds = np.zeros((n_features, 4), dtype=np.int64)
+        self.grid_feature_max_latitude = np.zeros(n_features)
+        if len(pois) > 0:
+            self.grid_feature_bounds[:, [0, 2]] = np.iinfo(np.int64).max
+            self.grid_feature_bounds[:, [1, 3]] = np.iinfo(np.int64).min
+            np.minimum.at(self.grid_feature_bounds[:, 0], features, lat_cells)
+            np.maximum.at(self.grid_feature_bounds[:, 1], features, lat_cells)
+            np.minimum.at(self.grid_feature_bounds[:, 2], features, lon_cells)
+            np.maximum.at(self.grid_feature_bounds[:, 3], features, lon_cells)
+            np.maximum.at(self.grid_feature_max_latitude, features, np.abs(vocabulary.latitude[pois]))
+
+    def _grid_lower_bound(self, rings: int, cos_latitude: float) -> float:
+        """
+        Lower bound (in km) of the distance from the origin to any point more than rings cells away from
+        the origin cell, in latitude or in longitude. cos_latitude is a lower bound of the cosine of the
+        latitude of both points.
+        """
+        span = math.radians(min(rings * self.grid_cell_degrees, 180.0))
+        lat_bound = dist.EARTH_RADIUS_KM * span
+        lon_bound = 2 * dist.EARTH_RADIUS_KM * math.asin(min(1.0, cos_latitude * math.sin(span / 2)))
+        return min(lat_bound, lon_bound)
 
-            # Map POIs in the trail to their features
-            features_in_trail = poi_features[poi_features['venue_id'].isin(pois_in_trail)][self.feature_column].tolist()
+    def _closest_in_feature(self, feature: int, origin: int, excluded: np.ndarray) -> tuple:
+        """
+        Finds the non-excluded POI of a feature closest to POI origin (ties by vocabulary index).
 
-            # Collect transitions between consecutive features
-            transitions.extend(zip(features_in_trail, features_in_trail[1:]))
+        The grid cells are visited in square rings around the origin cell until every POI not visited
+        yet is provably farther than the best one found; when a ring has more cells than the feature
+        has POIs, the remaining POIs are scanned at once. In the HAVERSINE mode the POIs whose stored
+        distance may tie with the best one are re-checked with utils.haversine (see _exact_closest).
 
-        # Count transitions and normalize
-        transition_df = pd.DataFrame(transitions, columns=['from', 'to'])
-        transition_counts = transition_df.groupby(['from', 'to']).size().unstack(fill_value=0)
-        feature_transition_matrix = transition_counts.div(transition_counts.sum(axis=1), axis=0).fillna(0)
+        Returns:
+        - tuple: (distance, poi), or (inf, -1) if every POI of the feature is excluded.
+        """
+        first_cell, last_cell = self.grid_feature_offsets[feature], self.grid_feature_offsets[feature + 1]
+        best_distance, best_poi = np.inf, -1
+        if first_cell == last_cell:
+            return best_distance, best_poi
+
+        origin_position = self.cache_positions[origin]
+        n_pois = self.grid_offsets[last_cell] - self.grid_offsets[first_cell]
+        lat_min, lat_max, lon_min, lon_max = self.grid_feature_bounds[feature]
+        origin_lat, origin_lon = self._grid_cells(self.vocabulary.latitude[origin], self.vocabulary.longitude[origin])
+        max_rings = max(origin_lat - lat_min, lat_max - origin_lat, origin_lon - lon_min, lon_max - origin_lon, 0)
+        cos_latitude = math.cos(math.radians(max(self.grid_feature_max_latitude[feature], abs(self.vocabulary.latitude[origin]))))
+
+        # POIs considered so far and their stored distances (only kept to re-check ties)
+        exact = dist.distance_mode == dist.HAVERSINE
+        considered_pois, considered_distances = [], []
+
+        def consider(pois: np.ndarray):
+            nonlocal best_distance, best_poi
+            pois = pois[~excluded[pois]]
+            if len(pois) == 0:
+                return
+            distances = self.distance_matrix[origin_position, self.cache_positions[pois]]
+            best = np.lexsort((pois, distances))[0]
+            if distances[best] < best_distance or (distances[best] == best_distance and pois[best] < best_poi):
+                best_distance, best_poi = distances[best], pois[best]
+            if exact:
+                considered_pois.append(pois)
+                considered_distances.append(distances)
+
+        for ring in range(max_rings + 1):
+            if 8 * ring > n_pois:
+                # The ring would visit more cells than there are POIs: scan the whole feature instead
+                self._record_cache("grid_rings", False)
+                consider(self.grid_pois[self.grid_offsets[first_cell]:self.grid_offsets[last_cell]])
+                if exact and best_poi >= 0:
+                    return self._exact_closest(origin, np.concatenate(considered_pois), np.concatenate(considered_distances), best_distance)
+                return best_distance, best_poi
+
+            if ring == 0:
+                lat_cells, lon_cells = np.array([origin_lat]), np.array([origin_lon])
+            else:
+                side = np.arange(-ring, ring + 1)
+                inner = side[1:-1]
+                lat_cells = np.concatenate([np.full(len(side), origin_lat - ring), np.full(len(side), origin_lat + ring), origin_lat + inner, origin_lat + inner])
+                lon_cells = np.concatenate([origin_lon + side, origin_lon + side, np.full(len(inner), origin_lon - ring), np.full(len(inner), origin_lon + ring)])
+            inside = (lat_cells >= lat_min) & (lat_cells <= lat_max) & (lon_cells >= lon_min) & (lon_cells <= lon_max)
+
+            keys = self._grid_keys(feature, lat_cells[inside], lon_cells[inside])
+            cells = first_cell + np.searchsorted(self.grid_keys[first_cell:last_cell], keys)
+            cells = cells[(cells < last_cell) & (self.grid_keys[np.minimum(cells, last_cell - 1)] == keys)]
+            if len(cells) > 0:
+                starts, lengths = self.grid_offsets[cells], self.grid_offsets[cells + 1] - self.grid_offsets[cells]
+                positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+                consider(self.grid_pois[positions])
+
+            # Unvisited POIs lie more than `ring` cells away; stored distances carry a small error (rounding or projection)
+            bound = self._grid_lower_bound(ring, cos_latitude)
+            farthest = dist.tie_bound(best_distance, self.distance_rtol, self.distance_atol_km) if exact else best_distance
+            if farthest < bound * (1 - self.distance_rtol) - self.distance_atol_km:
+                break
 
-        return feature_transition_matrix
+        self._record_cache("grid_rings", True)
+        if exact and best_poi >= 0:
+            return self._exact_closest(origin, np.concatenate(considered_pois), np.concatenate(considered_distances), best_distance)
+        return best_distance, best_poi
 
-    def _calculate_popularity(self) -> pd.Series:
+    def _exact_closest(self, origin: int, pois: np.ndarray, distances: np.ndarray, min_distance: float) -> tuple:
         """
-        Calculates the popularity of each POI based on visits.
+        Re-checks with utils.haversine the POIs whose stored (float32) distance from origin may tie with
+        min_distance, since the rounding merges distances that differ in the last float64 bits.
 
         Returns:
-        - pd.Series: A series with POI IDs as the index and visit counts as values.
+        - tuple: (distance, poi), the exact float64 distance of the closest POI (ties by vocabulary index).
         """
-        return self.trail_df['venue_id'].value_counts()
+        near = distances <= dist.tie_bound(min_distance, self.distance_rtol, self.distance_atol_km)
+        pois = pois[near]
+        # The original cache computed every distance from the POI earlier in poi_df (vocabulary order)
+        origins = np.full(len(pois), origin)
+        exact = dist.haversine_pairs(self.vocabulary.latitude, self.vocabulary.longitude,
+                                     np.minimum(origins, pois), np.maximum(origins, pois))
+        best = np.lexsort((pois, exact))[0]
+        return exact[best], pois[best]
 
     def recommend_for_user(self, user: int, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
-        user_trails = self.trail_df[self.trail_df['user_id'] == user]
-        visited_pois = set(user_trails['venue_id'].tolist())
+        with self._stage("user_history"):
+            last_poi = self.last_visited_poi(user)
 
-        if user_trails.empty:
+        if last_poi is None:
             return []
 
-        last_poi = user_trails['venue_id'].iloc[-1]
-        last_feature = self.poi_df[self.poi_df['venue_id'] == last_poi][self.feature_column].iloc[0]
-
-        return self._recommend_from_feature(last_feature, n_items, filter_visits, tiebreaker, visited_pois, )
+        return self._recommend_from_feature(n_items, filter_visits, tiebreaker, self.visited_poi_indices(user), last_poi)
 
     def recommend_from_poi(self, user: int, n_items: int, starting_poi: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
-        if starting_poi not in self.id_to_int:
+        poi_index = self.vocabulary.index_of(starting_poi)
+        if poi_index < 0 or not self.vocabulary.in_poi_df[poi_index]:
             raise ValueError(f"Starting POI {starting_poi} does not exist in the dataset.")
 
-        starting_feature = self.poi_df[self.poi_df['venue_id'] == starting_poi][self.feature_column].iloc[0]
-        user_trails = self.trail_df[self.trail_df['user_id'] == user]
-        visited_pois = set(user_trails['venue_id'].tolist())
-
-
         # Continue recommending based on features
         recommendations = self._recommend_from_feature(
-            starting_feature, n_items - 1, filter_visits, tiebreaker, visited_pois, starting_poi
+            n_items - 1, filter_visits, tiebreaker, self.visited_poi_indices(user), starting_poi
         )
 
         return recommendations
 
-    def _recommend_from_feature(self, feature: str, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker, visited_pois: set, starting_poi: int) -> List[int]:
+    def _recommend_from_feature(self, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker, visited_indices: np.ndarray, starting_poi: int) -> List[int]:
+        """
+        Walks the feature chain from the feature of starting_poi, picking at every step the best POI
+        among the buckets of the most probable next features.
+
+        visited_indices holds the vocabulary indices of the POIs the user visited in training.
+        """
         recommendations = []
         recommendations.append(starting_poi) # Always insert the starting POI
-        current_feature = feature
-        next_poi = starting_poi 
+        current_poi = self.vocabulary.index_of(starting_poi)
+        if current_poi < 0:
+            return recommendations
+        current_feature = self.vocabulary.categories[current_poi]
+
+        # Already recommended POIs (and previous visits, with the visit filter) cannot be recommended
+        excluded = np.zeros(len(self.vocabulary), dtype=bool)
+        excluded[current_poi] = True
+        if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
+            excluded[visited_indices] = True
+
         while len(recommendations) < n_items - 1:
-            if current_feature not in self.feature_transition_matrix.index:
+            if current_feature < 0:
                 break  # No outgoing transitions from this feature
 
-            # Get the transition probabilities for the current feature
-            transition_probs = self.feature_transition_matrix.loc[current_feature]
-            max_prob = transition_probs.max()
+            step_started = self._profile_clock()
+            # Features with the highest transition probability
+            candidate_features = self.successor_features[self.successor_feature_offsets[current_feature]:self.successor_feature_offsets[current_feature + 1]]
 
-            if max_prob == 0:
+            if len(candidate_features) == 0:
                 break  # No valid transitions
 
-            # Get features with the highest transition probability
-            candidate_features = transition_probs[transition_probs == max_prob].index
-
-            # Map features to POIs
-            candidate_pois = self.poi_df[self.poi_df[self.feature_column].isin(candidate_features)].copy()
-
-            # Exclude already recommended POIs
-            candidate_pois = candidate_pois[~candidate_pois['venue_id'].isin(recommendations)]
-
-            # Apply VisitFilter
-            if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
-                candidate_pois = candidate_pois[~candidate_pois['venue_id'].isin(visited_pois)]
-
-            if candidate_pois.empty:
+            # Resolve ties at POI level: best non-excluded POI of each candidate bucket
+            best_pois = []
+            if tiebreaker == TieBreaker.DISTANCE:
+                if self.cache_positions[current_poi] < 0:
+                    raise ValueError(f"POI {self.vocabulary.poi_ids[current_poi]} is not in the distance cache.")
+                best = [self._closest_in_feature(feature, current_poi, excluded) for feature in candidate_features]
+                best_distances = np.array([distance for distance, poi in best if poi >= 0])
+                best_pois = np.array([poi for _, poi in best if poi >= 0], dtype=np.int64)
+                if len(best_pois) > 0:
+                    best_pois = best_pois[np.lexsort((best_pois, best_distances))]
+            else:
+                for feature in candidate_features:
+                    bucket = self.bucket_pois[self.bucket_offsets[feature]:self.bucket_offsets[feature + 1]]
+                    available = np.flatnonzero(~excluded[bucket])
+                    if len(available) > 0:
+                        best_pois.append(bucket[available[0]])
+                best_pois = np.array(best_pois, dtype=np.int64)
+                if len(best_pois) > 0:
+                    best_pois = best_pois[np.lexsort((best_pois, -self.vocabulary.popularity[best_pois]))]
+
+            if len(best_pois) == 0:
                 break
 
-            # Resolve ties at POI level
-            if tiebreaker == TieBreaker.POPULARITY:
-                candidate_pois['popularity'] = candidate_pois['venue_id'].map(lambda poi: self.poi_popularity.get(poi, 0))
-                candidate_pois = candidate_pois.sort_values(by='popularity', ascending=False)
-            elif tiebreaker == TieBreaker.DISTANCE:
-                # Filter POIs to ensure they exist in the distance cache
-                candidate_pois = candidate_pois[
-                    (candidate_pois['venue_id'].isin(self.distance_cache.columns)) &
-                    (candidate_pois['venue_id'].isin(self.distance_cache.index))
-                ]
-
-                if candidate_pois.empty:
-                    break
-
-                candidate_pois['distance'] = candidate_pois['venue_id'].map(
-                    lambda poi: self.distance_cache.loc[next_poi, poi]
-                ).copy()
-                candidate_pois = candidate_pois.sort_values(by='distance')
-
             # Select the next POI
-            next_poi = candidate_pois.iloc[0]['venue_id']
-            next_feature = candidate_pois.iloc[0][self.feature_column]
+            next_poi = best_pois[0]
 
-            recommendations.append(next_poi)
-            visited_pois.add(next_poi)
-            current_feature = next_feature
+            recommendations.append(self.vocabulary.poi_ids[next_poi])
+            excluded[next_poi] = True
+            current_poi, current_feature = next_poi, self.vocabulary.categories[next_poi]
+            self._record_step(step_started, len(candidate_features))
 
         return recommendations
-
-
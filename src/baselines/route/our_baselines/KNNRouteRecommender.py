@@ -2,7 +2,7 @@ from Recommenders import BasicRouteRecommender, TieBreaker, VisitFilter
 from typing import List
 import numpy as np
 import pandas as pd
-from collections import defaultdict
+from scipy import sparse
 import utils as ut
 from tqdm import tqdm
 
@@ -10,40 +10,113 @@ from tqdm import tqdm
 class KNNRouteRecommender(BasicRouteRecommender):
     """
     KNN-based route recommender using user similarities and iterative POI recommendations.
+
+    Only users with positive similarity are neighbours. The original implementation took the k
+    largest entries of a dense similarity row, so users with zero similarity filled the neighbourhood
+    when there were fewer than k similar ones; their successors scored 0 but still kept routes going
+    after the similar neighbours ran out of successors. Without them a route can end earlier, unless
+    pad_neighbours is set.
     """
-    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, k: int):
+    BEAM_SEARCH = True
+    INCREMENTAL_UPDATE = True
+
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, k: int, block_size: int = 1024, pad_neighbours: bool = False):
+        """
+        Args:
+            poi_df (pd.DataFrame): The POIs.
+            trail_df (pd.DataFrame): The training trails.
+            k (int): Number of neighbours of every user.
+            block_size (int): Users per block of the similarity computation.
+            pad_neighbours (bool): Whether to fill the neighbourhoods with fewer than k users with
+                zero-similarity users (by user index), whose successors score 0, as the original
+                implementation did (its choice among them followed np.argsort and is not reproduced).
+        """
         super().__init__(poi_df, trail_df)
         self.k = k
+        self.pad_neighbours = pad_neighbours
+        # Number of neighbours stored per user (k can be lowered after fitting)
+        self.max_k = k
         user_ids = self.trail_df['user_id'].unique()
         self.user_uidx_map = {user_id: idx for idx, user_id in enumerate(user_ids)}
         self.uidx_user_map = {idx: user_id for user_id, idx in self.user_uidx_map.items()}
-        self.user_similarity_matrix = self._calculate_user_similarity_matrix()
-        self.poi_popularity = self._calculate_popularity()
+        self.block_size = block_size
+        with self._stage("user_similarity"):
+            self.user_similarity_matrix = self._calculate_user_similarity_matrix()
+        with self._stage("successor_index"):
+            self._build_successor_index()
 
 
-    def _calculate_user_similarity_matrix(self) -> np.ndarray:
+    def _calculate_user_similarity_matrix(self) -> sparse.csr_matrix:
+        """
+        Calculates the Jaccard similarity between the sets of POIs visited by each pair of users,
+        keeping only the k most similar neighbours of every user.
+
+        Returns:
+            sparse.csr_matrix: A float32 (n_users x n_users) matrix whose row i holds the (at most k)
+            neighbours of user i with positive similarity, ordered by decreasing similarity (ties by
+            user index). A user is never its own neighbour.
+        """
         n_users = len(self.user_uidx_map)
-        similarity_matrix = np.zeros((n_users, n_users))   
-        user_pois = self.trail_df.groupby('user_id')['venue_id'].apply(set)
+        counts, indices, similarities = self._similarity_rows(np.arange(n_users))
+        indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return sparse.csr_matrix((similarities, indices, indptr), shape=(n_users, n_users))
 
-        for i in tqdm(range(n_users), desc="Calculating user similarities"):
-            pois_i = user_pois[self.uidx_user_map[i]]
-            for j in range(i + 1, n_users):
-                pois_j = user_pois[self.uidx_user_map[j]]
+    def _user_pois(self) -> sparse.csr_matrix:
+        """
+        Returns the binary user x POI matrix (repeated visits count once), taken from the visited index.
+        Users are indexed in order of first appearance in trail_df, as in user_uidx_map.
+        """
+        return sparse.csr_matrix(
+            (np.ones(len(self.visited_values), dtype=np.int32), self.visited_values, self.visited_offsets),
+            shape=(len(self.user_uidx_map), len(self.vocabulary))
+        )
 
-                if pois_i and pois_j:
-                    intersection = len(pois_i & pois_j)
-                    if intersection == 0:
-                        similarity = 0
-                    else:
-                        union = len(pois_i | pois_j)
-                        similarity = intersection / union if union > 0 else 0
-                else:
-                    similarity = 0
+    def _similarity_rows(self, rows: np.ndarray) -> tuple:
+        """
+        Calculates the max_k nearest neighbours of some users.
 
-                similarity_matrix[i, j] = similarity_matrix[j, i] = similarity
+        Intersections come from the product of the binary user x POI matrix with its transpose and
+        unions from the number of POIs of each user. Users are processed in blocks of block_size
+        rows, so only one block of pairwise intersections is held in memory at a time.
 
-        return similarity_matrix
+        Args:
+            rows (np.ndarray): Indices of the users.
+
+        Returns:
+            tuple: (counts, indices, similarities), the number of neighbours of each user and the neighbours
+            with positive similarity (float32), ordered by decreasing similarity (ties by user index),
+            concatenated in the order of rows.
+        """
+        user_pois = self._user_pois()
+        degrees = np.diff(user_pois.indptr)
+        user_pois_t = user_pois.T.tocsr()
+
+        indices, similarities, counts = [], [], np.zeros(len(rows), dtype=np.int64)
+        for start in tqdm(range(0, len(rows), self.block_size), desc="Calculating user similarities"):
+            stop = min(start + self.block_size, len(rows))
+            intersections = (user_pois[rows[start:stop]] @ user_pois_t).tocoo()
+
+            block_rows = intersections.row + start
+            users = rows[block_rows]
+            cols = intersections.col
+            keep = users != cols
+            block_rows, users, cols, inter = block_rows[keep], users[keep], cols[keep], intersections.data[keep]
+            similarity = inter / (degrees[users] + degrees[cols] - inter)
+
+            # Top-k per user: sort by (row, -similarity, col) and keep the first k entries of each row
+            order = np.lexsort((cols, -similarity, block_rows))
+            block_rows, cols, similarity = block_rows[order], cols[order], similarity[order]
+            row_starts = np.searchsorted(block_rows, block_rows, side='left')
+            top_k = (np.arange(len(block_rows)) - row_starts) < self.max_k
+
+            indices.append(cols[top_k].astype(np.int32))
+            similarities.append(similarity[top_k].astype(np.float32))
+            counts[start:stop] = np.bincount(block_rows[top_k] - start, minlength=stop - start)
+
+        return (counts,
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+                np.concatenate(similarities) if similarities else np.zeros(0, dtype=np.float32))
 
 
     '''
@@ -87,14 +160,185 @@ class KNNRouteRecommender(BasicRouteRecommender):
         return similarity_matrix
     '''
 
-    def _calculate_popularity(self) -> pd.Series:
+    def _build_successor_index(self):
+        """
+        Builds an inverted index from each POI to the (user, next POI) pairs observed in training trails.
+
+        For every trail, only the first occurrence of each POI contributes, with the POI that follows it.
+        The pairs of POI p are stored in positions successor_offsets[p]:successor_offsets[p + 1] of
+        successor_users and successor_pois, ordered by user index and, within a user, by the order in
+        which the user's trails appear in trail_df. POIs are indexed by the shared vocabulary.
+        """
+        poi_codes, user_codes, next_pois = self._successor_entries(self.trail_df)
+        n_pois = len(self.vocabulary)
+        self.successor_offsets = np.zeros(n_pois + 1, dtype=np.int64)
+        np.cumsum(np.bincount(poi_codes, minlength=n_pois), out=self.successor_offsets[1:])
+        self.successor_users = user_codes.astype(np.int32)
+        self.successor_pois = next_pois.astype(np.int32)
+
+    def _successor_entries(self, trail_df: pd.DataFrame) -> tuple:
+        """
+        Extracts the (POI, user, next POI) entries of the successor index from some trails.
+
+        Returns:
+            tuple: (poi_codes, user_codes, next_pois), aligned arrays sorted by POI, user and trail order.
         """
-        Calculates the popularity of each POI based on visits.
+        trail_codes, _ = pd.factorize(trail_df['trail_id'])
+        poi_codes = self.vocabulary.indices(trail_df['venue_id'])
+        user_codes = trail_df['user_id'].map(self.user_uidx_map).to_numpy()
+        n_pois = len(self.vocabulary)
+
+        # Rows grouped by trail, keeping their order within each trail
+        order = np.argsort(trail_codes, kind='stable')
+        trail_codes, poi_codes, user_codes = trail_codes[order], poi_codes[order], user_codes[order]
+
+        # Successor of each row within its trail (-1 for the last POI of a trail)
+        next_pois = np.full(len(poi_codes), -1, dtype=np.int64)
+        same_trail = trail_codes[:-1] == trail_codes[1:]
+        next_pois[:-1][same_trail] = poi_codes[1:][same_trail]
+
+        # Only the first occurrence of a POI in a trail is used
+        _, first_rows = np.unique(trail_codes.astype(np.int64) * n_pois + poi_codes, return_index=True)
+        first_rows = first_rows[next_pois[first_rows] >= 0]
+
+        entries = first_rows[np.lexsort((trail_codes[first_rows], user_codes[first_rows], poi_codes[first_rows]))]
+        return poi_codes[entries], user_codes[entries], next_pois[entries]
+
+    def _update(self, new_trail_df: pd.DataFrame, n_new_pois: int):
+        """
+        Adds new trails to the successor index and recomputes the neighbours of the users whose
+        similarities changed: the users of the new trails and every user sharing a POI with them.
+        """
+        for user in pd.unique(new_trail_df['user_id']):
+            if user not in self.user_uidx_map:
+                self.uidx_user_map[len(self.user_uidx_map)] = user
+                self.user_uidx_map[user] = len(self.user_uidx_map)
+        n_users, n_pois = len(self.user_uidx_map), len(self.vocabulary)
+
+        # Successor index: the new entries go after the old ones of the same (POI, user)
+        poi_codes, user_codes, next_pois = self._successor_entries(new_trail_df)
+        old_pois = np.repeat(np.arange(len(self.successor_offsets) - 1), np.diff(self.successor_offsets))
+        poi_codes = np.concatenate([old_pois, poi_codes])
+        user_codes = np.concatenate([self.successor_users, user_codes])
+        order = np.lexsort((user_codes, poi_codes))
+        self.successor_offsets = np.zeros(n_pois + 1, dtype=np.int64)
+        np.cumsum(np.bincount(poi_codes, minlength=n_pois), out=self.successor_offsets[1:])
+        self.successor_users = user_codes[order].astype(np.int32)
+        self.successor_pois = np.concatenate([self.successor_pois, next_pois])[order].astype(np.int32)
+
+        # Users whose Jaccard similarities changed
+        user_pois = self._user_pois()
+        touched = np.unique(new_trail_df['user_id'].map(self.user_uidx_map).to_numpy())
+        touched_pois = np.unique(user_pois[touched].indices)
+        affected = np.unique(user_pois.T.tocsr()[touched_pois].indices)
+
+        similarity = self.user_similarity_matrix
+        indptr = ut.append_empty_rows(similarity.indptr, n_users - similarity.shape[0])
+        counts, indices, similarities = self._similarity_rows(affected)
+        indptr, (indices, similarities) = ut.replace_rows(indptr, [similarity.indices, similarity.data], affected, counts, [indices, similarities])
+        self.user_similarity_matrix = sparse.csr_matrix((similarities, indices, indptr), shape=(n_users, n_users))
+
+    def _score_successors(self, poi_index: int, neighbor_ranks: np.ndarray, similarities: np.ndarray, excluded: np.ndarray) -> tuple:
+        """
+        Scores the successors of a POI by the summed similarity of the neighbours that made each transition.
+
+        Args:
+            poi_index (int): Index of the current POI.
+            neighbor_ranks (np.ndarray): Rank of every user among the neighbours (-1 if not a neighbour).
+            similarities (np.ndarray): Similarity of each neighbour, by rank.
+            excluded (np.ndarray): Mask of the POIs that cannot be recommended.
 
         Returns:
-            pd.Series: A series with POI IDs as the index and visit counts as values.
+            tuple: (pois, scores), the candidate POI indices in the order they are first reached
+            (neighbours by decreasing similarity, then trail order) and their scores.
         """
-        return self.trail_df['venue_id'].value_counts()
+        start, stop = self.successor_offsets[poi_index], self.successor_offsets[poi_index + 1]
+        ranks = neighbor_ranks[self.successor_users[start:stop]]
+        next_pois = self.successor_pois[start:stop]
+
+        keep = (ranks >= 0) & ~excluded[next_pois]
+        ranks, next_pois = ranks[keep], next_pois[keep]
+
+        # Entries are stored by user, then trail: a stable sort by rank yields the neighbour scan order
+        order = np.argsort(ranks, kind='stable')
+        ranks, next_pois = ranks[order], next_pois[order]
+
+        pois, first_seen, inverse = np.unique(next_pois, return_index=True, return_inverse=True)
+        scores = np.bincount(inverse, weights=similarities[ranks], minlength=len(pois))
+
+        order = np.argsort(first_seen)
+        return pois[order], scores[order]
+
+    def _neighbors(self, user_index: int) -> tuple:
+        """
+        Returns the rank of every user among the k nearest neighbours of a user (-1 if not a neighbour)
+        and the similarity of each neighbour, by rank. With pad_neighbours, the users after the
+        stored neighbours are the first other users (by index) with zero similarity.
+        """
+        # Neighbours are stored sorted by decreasing similarity, so the first k are the k nearest
+        # (k may have been lowered after fitting)
+        start, stop = self.user_similarity_matrix.indptr[user_index], self.user_similarity_matrix.indptr[user_index + 1]
+        stop = min(stop, start + self.k)
+        neighbor_ranks = np.full(len(self.user_uidx_map), -1, dtype=np.int64)
+        neighbor_ranks[self.user_similarity_matrix.indices[start:stop]] = np.arange(stop - start)
+        similarities = self.user_similarity_matrix.data[start:stop].astype(np.float64)
+
+        n_missing = self.k - (stop - start)
+        if self.pad_neighbours and n_missing > 0:
+            others = neighbor_ranks < 0
+            others[user_index] = False
+            padding = np.flatnonzero(others)[:n_missing]
+            neighbor_ranks[padding] = np.arange(stop - start, stop - start + len(padding))
+            similarities = np.concatenate([similarities, np.zeros(len(padding))])
+        return neighbor_ranks, similarities
+
+    def _beam_state(self, user: int) -> tuple:
+        return self._neighbors(self.user_uidx_map[user])
+
+    def _step_scores(self, current_pois: np.ndarray, state: tuple) -> sparse.csr_matrix:
+        """
+        Scores the successors of each current POI by the summed similarity of the neighbours that made
+        each transition (the scores of _score_successors, for all the current POIs at once). Only POIs
+        with valid coordinates are scored.
+        """
+        neighbor_ranks, similarities = state
+        lengths, positions = ut.row_positions(self.successor_offsets, current_pois)
+        rows = np.repeat(np.arange(len(current_pois)), lengths)
+        ranks = neighbor_ranks[self.successor_users[positions]]
+        next_pois = self.successor_pois[positions]
+
+        keep = (ranks >= 0) & self.vocabulary.has_coordinates[next_pois]
+        scores = sparse.csr_matrix(
+            (similarities[ranks[keep]], (rows[keep], next_pois[keep])),
+            shape=(len(current_pois), len(self.vocabulary))
+        )
+        scores.sum_duplicates()
+        return scores
+
+    def _beam_excluded(self, user: int, filter_visits: VisitFilter) -> np.ndarray:
+        return super()._beam_excluded(user, filter_visits) | ~self.vocabulary.has_coordinates
+
+    def _beam_rank(self, routes: np.ndarray, beams: np.ndarray, pois: np.ndarray, tiebreaker: TieBreaker, state: tuple) -> tuple:
+        """
+        Ranks the candidates by the tiebreaker, then by the order in which the neighbours reach them
+        (as in _score_successors). Unlike recommend_from_poi, distance ties from a POI without
+        coordinates do not raise: all the candidates are at an infinite distance.
+        """
+        neighbor_ranks, _ = state
+        n_pois = len(self.vocabulary)
+        lengths, positions = ut.row_positions(self.successor_offsets, routes[:, -1])
+        rows = np.repeat(np.arange(len(routes), dtype=np.int64), lengths)
+        ranks = neighbor_ranks[self.successor_users[positions]]
+        keep = ranks >= 0
+        rows, ranks, positions = rows[keep], ranks[keep], positions[keep]
+
+        # Neighbours by rank, then trail order: the position of the first entry of a POI is its scan order
+        order = np.lexsort((positions, ranks, rows))
+        keys, first_seen = np.unique(rows[order] * n_pois + self.successor_pois[positions[order]], return_index=True)
+        seen_order = first_seen[np.searchsorted(keys, beams * n_pois + pois)]
+
+        ties, ended = super()._beam_rank(routes, beams, pois, tiebreaker, state)
+        return (seen_order,) + ties, ended
 
     def recommend_from_poi(self, user: int, n_items: int, starting_poi: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
         """
@@ -111,68 +355,54 @@ class KNNRouteRecommender(BasicRouteRecommender):
             List[int]: A list of recommended POI IDs.
         """
         recommendations = []
-        visited_pois = set()
         user_index = self.user_uidx_map[user]
 
         # Add the starting POI to recommendations
         recommendations.append(starting_poi)
-        visited_pois.add(starting_poi)
 
         current_poi = starting_poi
 
-        similarities = self.user_similarity_matrix[user_index]
-        neighbor_indices = np.argsort(similarities)[::-1][:self.k]
+        neighbor_ranks, similarities = self._neighbors(user_index)
 
-        all_pois = self.poi_df[['venue_id', 'latitude', 'longitude']]
-        all_pois = all_pois[(all_pois['latitude'] != -1) & (all_pois['longitude'] != -1)]
-        
+        # Only POIs with valid coordinates that have not been recommended yet (nor visited, with the
+        # visit filter) are candidates (successors must have valid coordinates to be recommended)
+        excluded = ~self.vocabulary.has_coordinates
         if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
-            all_pois = all_pois[~all_pois['venue_id'].isin(visited_pois)]
+            excluded[self.visited_poi_indices(user)] = True
+        current_index = self.vocabulary.index_of(starting_poi)
+        if current_index >= 0:
+            excluded[current_index] = True
 
-
-        candidates = all_pois['venue_id'].values
         while len(recommendations) < n_items:
-            scores = {}
-            # Find k nearest neighbors
-            
-
-            for neighbor_idx in neighbor_indices:
-                neighbor_id = self.uidx_user_map[neighbor_idx]
-                # neighbor_id = self.trail_df['user_id'].unique()[neighbor_idx]
-                neighbor_trails = self.trail_df[self.trail_df['user_id'] == neighbor_id]
-
-                for trail_id in neighbor_trails['trail_id'].unique():
-                    trail_pois = neighbor_trails[neighbor_trails['trail_id'] == trail_id]['venue_id'].tolist()
-
-                    if current_poi in trail_pois:
-                        poi_index = trail_pois.index(current_poi)
-                        if poi_index < len(trail_pois) - 1:
-                            next_poi = trail_pois[poi_index + 1]
-                            if next_poi not in visited_pois and next_poi in candidates:
-                                scores[next_poi] = scores.get(next_poi, 0) + similarities[neighbor_idx]
-
-            if not scores:
+            if current_index < 0:
                 break
 
-            # Select the next POI based on scores
-            max_score = max(scores.values())
-            max_score_pois = [poi for poi, score in scores.items() if score == max_score]
-            
+            step_started = self._profile_clock()
+            n_scanned = self.successor_offsets[current_index + 1] - self.successor_offsets[current_index]
+            pois, scores = self._score_successors(current_index, neighbor_ranks, similarities, excluded)
+
+            if len(pois) == 0:
+                break
+
+            # Select the next POI based on scores (candidates in the order they were first reached)
+            max_score_pois = pois[scores == scores.max()]
+
             if len(max_score_pois) > 1:
-                if tiebreaker == TieBreaker.POPULARITY:
-                    next_poi = max(max_score_pois, key=lambda poi: self.poi_popularity.get(poi, 0))
-                elif tiebreaker == TieBreaker.DISTANCE:
-                    current_coords = self.poi_df[self.poi_df['venue_id'] == current_poi][['latitude', 'longitude']].iloc[0]
-                    next_poi = min(max_score_pois,
-                                   key=lambda poi: ut.haversine(current_coords['latitude'], current_coords['longitude'],
-                                   self.poi_df[self.poi_df['venue_id'] == poi]['latitude'].iloc[0],
-                                   self.poi_df[self.poi_df['venue_id'] == poi]['longitude'].iloc[0]
-                ))
-            else:
-                next_poi = max_score_pois[0]
+                with self._stage("tiebreak"):
+                    if tiebreaker == TieBreaker.POPULARITY:
+                        max_score_pois = max_score_pois[self.vocabulary.popularity_order(max_score_pois)]
+                    elif tiebreaker == TieBreaker.DISTANCE:
+                        if not self.vocabulary.in_poi_df[current_index]:
+                            raise ValueError(f"POI {current_poi} has no coordinates.")
+                        distances = self.vocabulary.distances_from(current_index, max_score_pois)
+                        max_score_pois = max_score_pois[self.vocabulary.distance_order(max_score_pois, distances)]
+
+            next_index = max_score_pois[0]
+            next_poi = self.vocabulary.poi_ids[next_index]
 
             recommendations.append(next_poi)
-            visited_pois.add(next_poi)
-            current_poi = next_poi
+            excluded[next_index] = True
+            current_poi, current_index = next_poi, next_index
+            self._record_step(step_started, n_scanned)
 
         return recommendations
@@ -1,88 +1,221 @@
 from Recommenders import BasicRouteRecommender, VisitFilter, TieBreaker
+import distances as dist
 import utils as ut
+import trails
 from typing import List
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 class MarkovRouteRecommender(BasicRouteRecommender):
     """
     Recommender system based on first-order Markov chains with precomputed distance caching.
     """
-    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame):
+    BEAM_SEARCH = True
+    INCREMENTAL_UPDATE = True
+
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, distance_cache: pd.DataFrame = None):
         super().__init__(poi_df, trail_df)
 
-        # Create dictionaries for POI mapping
-        self.id_to_int = {poi_id: idx for idx, poi_id in enumerate(poi_df['venue_id'].unique())}
-        self.int_to_id = {idx: poi_id for poi_id, idx in self.id_to_int.items()}
+        # Calculate transition matrix and distance cache
+        with self._stage("transition_counts"):
+            self.transition_counts = self._count_transitions(self.trail_df)
+            self.transition_matrix = self._normalize_rows(self.transition_counts)
+        with self._stage("distance_cache"):
+            self.distance_cache = distance_cache if distance_cache is not None else dist.calculate_distance_cache(self.poi_df)
+
+        # Max-probability successors of every POI, already ordered for each tiebreaker
+        num_pois = len(self.vocabulary)
+        with self._stage("successor_tables"):
+            lengths, self.successors_by_popularity, self.successors_by_distance = self._calculate_successor_tables(np.arange(num_pois))
+        self.successor_offsets = np.zeros(num_pois + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.successor_offsets[1:])
 
-        # Calculate transition matrix, popularity, and distance cache
-        self.transition_matrix = self._calculate_transition_matrix()
-        self.poi_popularity = self._calculate_popularity()
-        self.distance_cache = self._calculate_distance_cache()
+        # Rows whose probabilities and successors are recomputed before the next query (after update)
+        self.stale_rows = np.zeros(num_pois, dtype=bool)
 
-    def _calculate_transition_matrix(self) -> np.ndarray:
+    def _count_transitions(self, trail_df: pd.DataFrame) -> sparse.csr_matrix:
         """
-        Calculates the transition matrix for the Markov chain.
+        Counts the transitions of the trails for the Markov chain.
 
         Returns:
-        - np.ndarray: A square matrix where element (i, j) represents the probability of transitioning
-          from POI i to POI j.
+        - sparse.csr_matrix: A square matrix over the vocabulary indices where element (i, j) is the number
+          of transitions from POI i to POI j. Only POIs of poi_df take part in transitions.
         """
-        num_pois = len(self.id_to_int)
-        matrix = np.zeros((num_pois, num_pois))
-
-        for _, trail_data in self.trail_df.groupby('trail_id'):
-            transitions = zip(trail_data['venue_id'], trail_data['venue_id'][1:])
-
-            for poi_from, poi_to in transitions:
-                if poi_from in self.id_to_int and poi_to in self.id_to_int:
-                    matrix[self.id_to_int[poi_from], self.id_to_int[poi_to]] += 1
+        num_pois = len(self.vocabulary)
 
-        # Normalize rows to probabilities
-        matrix = matrix / matrix.sum(axis=1, keepdims=True)
-        matrix[np.isnan(matrix)] = 0  # Handle rows with no outgoing transitions
+        poi_from, poi_to, weights = trails.store_of(trail_df, dedupe=True).transitions()
+        rows = self.vocabulary.indices(poi_from)
+        cols = self.vocabulary.indices(poi_to)
+        known = self.vocabulary.in_poi_df[rows] & self.vocabulary.in_poi_df[cols]
 
+        # Duplicated (from, to) pairs are summed into counts
+        matrix = sparse.csr_matrix(
+            (weights[known].astype(np.float64), (rows[known], cols[known])),
+            shape=(num_pois, num_pois)
+        )
+        matrix.sum_duplicates()
         return matrix
 
-    def _calculate_popularity(self) -> pd.Series:
+    @staticmethod
+    def _normalize_rows(counts: sparse.csr_matrix) -> sparse.csr_matrix:
         """
-        Calculates the popularity of each POI based on visits.
+        Normalizes the rows of a count matrix to probabilities.
 
         Returns:
-        - pd.Series: A series with POI IDs as the index and visit counts as values.
+        - sparse.csr_matrix: Matrix with the structure of counts where element (i, j) represents the probability
+          of transitioning from POI i to POI j; rows with no outgoing transitions are empty.
         """
-        return self.trail_df['venue_id'].value_counts()
+        matrix = counts.copy()
+        row_sums = np.asarray(matrix.sum(axis=1)).ravel()
+        matrix.data /= np.repeat(row_sums, np.diff(matrix.indptr))
+        return matrix
 
-    def _calculate_distance_cache(self) -> pd.DataFrame:
+    def _calculate_successor_tables(self, rows: np.ndarray) -> tuple:
         """
-        Precomputes a distance matrix for all POIs with valid coordinates.
+        Computes, for some POIs, the POIs reached from them with the maximum transition probability.
+
+        The successors of each POI are ordered by decreasing popularity and by increasing distance from
+        the POI respectively (ties in POI index order). Successors without coordinates are placed last in
+        the distance ordering, and in the HAVERSINE mode the distances are those of utils.haversine.
+
+        Parameters:
+        - rows: np.ndarray, vocabulary indices of the POIs.
 
         Returns:
-        - pd.DataFrame: A DataFrame where element (i, j) represents the distance between POI i and POI j.
+        - tuple: (lengths, by_popularity, by_distance) NumPy arrays: the number of successors of each POI
+          and the successors of all the POIs concatenated in the order of rows, in each ordering.
         """
-        valid_pois = self.poi_df[(self.poi_df['latitude'] != -1) & (self.poi_df['longitude'] != -1)]
-        poi_ids = valid_pois['venue_id'].values
-        latitudes = valid_pois['latitude'].values
-        longitudes = valid_pois['longitude'].values
-
-        n = len(poi_ids)
-        distance_matrix = np.zeros((n, n))
+        matrix = self.transition_matrix[rows]
+        num_rows = len(rows)
+        row_lengths = np.diff(matrix.indptr)
+        local_rows = np.repeat(np.arange(num_rows), row_lengths)
+
+        row_max = np.zeros(num_rows)
+        non_empty = row_lengths > 0
+        row_max[non_empty] = np.maximum.reduceat(matrix.data, matrix.indptr[:-1][non_empty])
+
+        is_max = matrix.data == row_max[local_rows]
+        local_rows, cols = local_rows[is_max], matrix.indices[is_max]
+        lengths = np.bincount(local_rows, minlength=num_rows)
+
+        popularity = self.vocabulary.popularity
+        by_popularity = cols[np.lexsort((cols, -popularity[cols], local_rows))]
+
+        # Distances between each POI and its successors, infinite when either lacks coordinates
+        cache_positions = self.distance_cache.index.get_indexer(self.vocabulary.poi_ids)
+        has_coordinates = cache_positions >= 0
+        sources = rows[local_rows]
+        distances = np.full(len(sources), np.inf)
+        located = has_coordinates[sources] & has_coordinates[cols]
+        if dist.distance_mode == dist.HAVERSINE:
+            # Exact distances, as the float32 cache can merge distinct distances into ties (the cache mirrors
+            # the distances computed from the POI first in vocabulary order)
+            distances[located] = dist.haversine_pairs(
+                self.vocabulary.latitude, self.vocabulary.longitude,
+                np.minimum(sources[located], cols[located]), np.maximum(sources[located], cols[located])
+            )
+        else:
+            distances[located] = self.distance_cache.to_numpy()[cache_positions[sources[located]], cache_positions[cols[located]]]
+        by_distance = cols[np.lexsort((cols, ~has_coordinates[cols], distances, local_rows))]
+
+        return lengths, by_popularity.astype(np.int32), by_distance.astype(np.int32)
+
+    def _update(self, new_trail_df: pd.DataFrame, n_new_pois: int):
+        """
+        Adds the transitions of new trails to the counts and marks the rows to recompute: the rows with
+        new transitions and the rows with a successor whose popularity changed (for the tiebreaker).
+        """
+        num_pois = len(self.vocabulary)
+        counts, matrix = self.transition_counts, self.transition_matrix
+        if n_new_pois:
+            indptr = ut.append_empty_rows(counts.indptr, n_new_pois)
+            counts = sparse.csr_matrix((counts.data, counts.indices, indptr), shape=(num_pois, num_pois))
+            matrix = sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(num_pois, num_pois))
+            self.successor_offsets = ut.append_empty_rows(self.successor_offsets, n_new_pois)
+            self.stale_rows = np.concatenate([self.stale_rows, np.zeros(n_new_pois, dtype=bool)])
+
+        new_counts = self._count_transitions(new_trail_df)
+        self.transition_counts = counts + new_counts
+        self.transition_counts.sort_indices()
+
+        visited = np.zeros(num_pois, dtype=bool)
+        visited[self.vocabulary.indices(new_trail_df['venue_id'])] = True
+        entry_rows = np.repeat(np.arange(num_pois), np.diff(self.transition_counts.indptr))
+        stale_rows = self.stale_rows | (np.diff(new_counts.indptr) > 0)
+        stale_rows[entry_rows[visited[self.transition_counts.indices]]] = True
+
+        # Rows that are not stale keep their structure: copy their probabilities to the new structure
+        data = self.transition_counts.data.copy()
+        data[~stale_rows[entry_rows]] = matrix.data[~stale_rows[np.repeat(np.arange(num_pois), np.diff(matrix.indptr))]]
+        self.transition_matrix = sparse.csr_matrix((data, self.transition_counts.indices, self.transition_counts.indptr), shape=(num_pois, num_pois))
+        self.stale_rows = stale_rows
+
+    def _refresh_stale_rows(self):
+        """
+        Recomputes the probabilities and successors of the rows marked by update.
+        """
+        if not self.stale_rows.any():
+            return
+
+        with self._stage("refresh_stale_rows"):
+            rows = np.flatnonzero(self.stale_rows)
+            lengths, positions = ut.row_positions(self.transition_counts.indptr, rows)
+            counts = self.transition_counts.data[positions]
+            non_empty = lengths > 0
+            row_sums = np.add.reduceat(counts, (np.cumsum(lengths) - lengths)[non_empty]) if len(counts) else counts
+            data = self.transition_matrix.data.copy()
+            data[positions] = counts / np.repeat(row_sums, lengths[non_empty])
+            self.transition_matrix = sparse.csr_matrix((data, self.transition_matrix.indices, self.transition_matrix.indptr), shape=self.transition_matrix.shape)
+
+            lengths, by_popularity, by_distance = self._calculate_successor_tables(rows)
+            self.successor_offsets, (self.successors_by_popularity, self.successors_by_distance) = ut.replace_rows(
+                self.successor_offsets, [self.successors_by_popularity, self.successors_by_distance], rows, lengths, [by_popularity, by_distance]
+            )
+            self.stale_rows = np.zeros(len(self.stale_rows), dtype=bool)
+
+    def _step_scores(self, current_pois: np.ndarray, state) -> sparse.csr_matrix:
+        """
+        Log transition probabilities from each current POI, so a route scores its log probability.
+        """
+        self._refresh_stale_rows()
+        scores = self.transition_matrix[current_pois]
+        scores.data = np.log(scores.data)
+        return scores
 
-        for i in range(n):
-            for j in range(i + 1, n):
-                dist = ut.haversine(latitudes[i], longitudes[i], latitudes[j], longitudes[j])
-                distance_matrix[i, j] = dist
-                distance_matrix[j, i] = dist
+    def _beam_route_length(self, n_items: int) -> int:
+        return n_items - 1
 
-        return pd.DataFrame(distance_matrix, index=poi_ids, columns=poi_ids)
+    def _beam_rank(self, routes: np.ndarray, beams: np.ndarray, pois: np.ndarray, tiebreaker: TieBreaker, state) -> tuple:
+        """
+        Ranks the candidates by their position among the max-probability successors ordered by the
+        tiebreaker, and ends the beams that _recommend_from_poi stops: those whose max-probability
+        successors are all taken, and, with the distance tiebreaker, those whose first one of several
+        lacks coordinates.
+        """
+        ordered_successors = self.successors_by_distance if tiebreaker == TieBreaker.DISTANCE else self.successors_by_popularity
+        last = routes[:, -1]
+        ranks = ut.row_ranks(self.successor_offsets, ordered_successors, last, beams, pois)
+
+        is_successor = ranks < len(ordered_successors)
+        n_candidates = np.bincount(beams[is_successor], minlength=len(routes))
+        first = np.full(len(routes), len(ordered_successors), dtype=np.int64)
+        np.minimum.at(first, beams[is_successor], ranks[is_successor])
+
+        ended = n_candidates == 0
+        if tiebreaker == TieBreaker.DISTANCE:
+            several = n_candidates > 1
+            first_poi = ordered_successors[self.successor_offsets[last[several]] + first[several]]
+            ended[several] = ~self.vocabulary.has_coordinates[first_poi]
+        return (ranks,), ended
 
     def recommend_for_user(self, user: int, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
-        user_trails = self.trail_df[self.trail_df['user_id'] == user]
-        if user_trails.empty:
+        with self._stage("user_history"):
+            last_poi = self.last_visited_poi(user)
+        if last_poi is None:
             return []
 
-        last_poi = user_trails['venue_id'].iloc[-1]
-        return self._recommend_from_poi(last_poi, n_items, filter_visits, tiebreaker, last_poi)
+        return self._recommend_from_poi(last_poi, n_items, filter_visits, tiebreaker, self.visited_poi_indices(user))
 
     def recommend_from_poi(self, user: int, n_items: int, starting_poi: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
         """
@@ -90,83 +223,62 @@ class MarkovRouteRecommender(BasicRouteRecommender):
         
         The starting POI is guaranteed to be the first recommendation.
         """
-        if starting_poi not in self.id_to_int:
+        poi_index = self.vocabulary.index_of(starting_poi)
+        if poi_index < 0 or not self.vocabulary.in_poi_df[poi_index]:
             raise ValueError(f"Starting POI {starting_poi} does not exist in the dataset.")
 
-        # Ensure the starting POI is always the first recommendation
-        user_trails = self.trail_df[self.trail_df['user_id'] == user]
-        visited_pois = set(user_trails['venue_id'].tolist())
-
         # Continue recommending based on Markov chain logic
         recommendations = self._recommend_from_poi(
-            starting_poi, n_items, filter_visits, tiebreaker, visited_pois
+            starting_poi, n_items, filter_visits, tiebreaker, self.visited_poi_indices(user)
         )
 
         return recommendations
 
-    def _recommend_from_poi(self, poi: int, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker, visited_pois:set) -> List[int]:
+    def _recommend_from_poi(self, poi: int, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker, visited_indices: np.ndarray) -> List[int]:
         """
         Core logic for recommending POIs from a specific starting POI.
+
+        visited_indices holds the vocabulary indices of the POIs the user visited in training.
         """
+        self._refresh_stale_rows()
         recommendations = []
         recommendations.append(poi)
 
-        current_poi = poi
+        current_poi = self.vocabulary.index_of(poi)
+        if current_poi < 0:
+            return recommendations
 
-        while len(recommendations) < n_items - 1:
-            if current_poi not in self.id_to_int:
-                break
-
-            poi_index = self.id_to_int[current_poi]
-            transition_probs = self.transition_matrix[poi_index]
-            max_prob = np.max(transition_probs)
+        # Already recommended POIs (and previous visits, with the visit filter) cannot be recommended
+        excluded = np.zeros(len(self.vocabulary), dtype=bool)
+        excluded[current_poi] = True
+        if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
+            excluded[visited_indices] = True
 
-            if max_prob == 0:
-                break  # No valid transitions
+        ordered_successors = self.successors_by_distance if tiebreaker == TieBreaker.DISTANCE else self.successors_by_popularity
 
-            # Get POIs with the highest transition probability
-            candidate_indices = np.where(transition_probs == max_prob)[0]
-            candidate_pois = [self.int_to_id[idx] for idx in candidate_indices]
+        while len(recommendations) < n_items - 1:
+            step_started = self._profile_clock()
+            start, stop = self.successor_offsets[current_poi], self.successor_offsets[current_poi + 1]
 
-            # Exclude already recommended POIs
-            candidate_pois = [poi for poi in candidate_pois if poi not in recommendations]
+            if start == stop:
+                break  # No valid transitions
 
-            # Apply VisitFilter
-            if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
-                candidate_pois = [poi for poi in candidate_pois if poi not in visited_pois]
+            # POIs with the highest transition probability, already ordered by the tiebreaker
+            candidates = ordered_successors[start:stop]
+            candidates = candidates[~excluded[candidates]]
 
-            if not candidate_pois:
+            if len(candidates) == 0:
                 break
 
-            # Resolve ties at POI level
-            if len(candidate_pois) > 1:
-                if tiebreaker == TieBreaker.POPULARITY:
-                    candidate_pois = sorted(
-                        candidate_pois,
-                        key=lambda poi: self.poi_popularity.get(poi, 0),
-                        reverse=True
-                    )
-                elif tiebreaker == TieBreaker.DISTANCE:
-                    # Filter POIs to ensure they exist in the distance cache
-                    candidate_pois = [
-                        poi for poi in candidate_pois
-                        if poi in self.distance_cache.columns and poi in self.distance_cache.index
-                    ]
-
-                    if not candidate_pois:
-                        break
-
-                    candidate_pois = sorted(
-                        candidate_pois,
-                        key=lambda poi: self.distance_cache.loc[current_poi, poi]
-                    )
-
-            if not candidate_pois:
-                break
+            # Distance ties are only resolved among POIs with coordinates, which come first
+            if len(candidates) > 1 and tiebreaker == TieBreaker.DISTANCE:
+                if not self.vocabulary.has_coordinates[candidates[0]]:
+                    break
 
-            next_poi = candidate_pois[0]
-            recommendations.append(next_poi)
-            visited_pois.add(next_poi)
+            next_poi = candidates[0]
+            recommendations.append(self.vocabulary.poi_ids[next_poi])
+            excluded[next_poi] = True
             current_poi = next_poi
+            self._record_step(step_started, stop - start)
 
         return recommendations
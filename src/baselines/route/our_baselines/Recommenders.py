@@ -1,6 +1,14 @@
+import os
+import time
+import numpy as np
 import pandas as pd
 from enum import Enum
-from typing import List
+from typing import List, Set
+from scipy import sparse
+import distances as dist
+import persistence
+import profiling
+from vocabulary import PoiVocabulary
 
 
 
@@ -22,16 +30,191 @@ class BasicRouteRecommender:
     """
     A basic route recommender system.
     """
-    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame):
+    # Attributes that are inputs of the model rather than fitted state: never saved, passed again to load
+    INPUT_ATTRIBUTES = ('poi_df', 'trail_df', 'distance_cache')
+
+    # Whether the recommender implements _step_scores (and so recommend_beam_search); the _beam_* hooks
+    # apply the route rules of its recommend_from_poi, so that a beam of width 1 gives the same routes
+    BEAM_SEARCH = False
+
+    # Whether the recommender implements _update (and so update)
+    INCREMENTAL_UPDATE = False
+
+    # Beam search used by recommend_batch (a width of 1 keeps the greedy recommend_from_poi) and
+    # wall-clock budget in seconds per query (None for no limit); set on the instance to change them
+    beam_width = 1
+    beam_time_budget = None
+
+    # profiling.Profiler receiving the stage timings, step latencies and cache hits of every
+    # recommender (None disables the instrumentation); set on the class to profile all of them
+    profiler = None
+
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, visited_bitset: bool = False, feature_column: str = 'category_lvlFs'):
         """
         Initializes the recommender with mappings and dataframes.
         
         Parameters:
         - poi_df: pd.DataFrame, DataFrame containing POI information.
         - trail_df: pd.DataFrame, DataFrame containing user trail information.
+        - visited_bitset: bool, whether to also build a dense user x POI bitset of visits.
+        - feature_column: str, column of poi_df holding the POI category (for the vocabulary).
         """
         self.poi_df = poi_df
         self.trail_df = trail_df
+        with self._stage("vocabulary"):
+            self.vocabulary = PoiVocabulary(poi_df, trail_df, feature_column)
+        with self._stage("visited_index"):
+            self._build_visited_index(visited_bitset)
+
+    def _stage(self, name: str):
+        """
+        Returns a context manager timing a stage of the recommender (a fit sub-step, a filter...) in
+        the profiler, under the name <class>.<name>; a no-op when profiling is off.
+        """
+        if self.profiler is None:
+            return profiling.NO_STAGE
+        return self.profiler.stage(f"{type(self).__name__}.{name}")
+
+    def _profile_clock(self) -> float:
+        """
+        Returns the start time of a query or route step for the profiler (0 when profiling is off).
+        """
+        return time.perf_counter() if self.profiler is not None else 0.0
+
+    def _record_step(self, started: float, n_candidates: int, name: str = "step"):
+        """
+        Records the latency of a route step started at started (see _profile_clock) and the number of
+        candidate POIs it scanned, under the name <class>.<name>.
+        """
+        if self.profiler is not None:
+            self.profiler.record_step(f"{type(self).__name__}.{name}", time.perf_counter() - started, n_candidates)
+
+    def _record_cache(self, name: str, hit: bool):
+        """
+        Counts a hit (or a miss) of a cache of the recommender, under the name <class>.<name>.
+        """
+        if self.profiler is not None:
+            self.profiler.record_cache(f"{type(self).__name__}.{name}", hit)
+
+    def _build_visited_index(self, visited_bitset: bool):
+        """
+        Builds a CSR-style index from each user to the distinct POIs visited in trail_df.
+
+        POIs are indexed by the shared vocabulary. The POIs of the user with index u are stored,
+        sorted, in positions visited_offsets[u]:visited_offsets[u + 1] of visited_values.
+        """
+        user_codes, user_ids = pd.factorize(self.trail_df['user_id'])
+        poi_codes = self.vocabulary.indices(self.trail_df['venue_id'])
+        self.visited_user_index = {user: idx for idx, user in enumerate(user_ids)}
+        self._set_visited_pairs(user_codes, poi_codes, visited_bitset)
+        self.last_visits = self._last_visits(user_codes, poi_codes, np.full(len(user_ids), -1, dtype=self.visited_values.dtype))
+
+    @staticmethod
+    def _last_visits(user_codes: np.ndarray, poi_codes: np.ndarray, last_visits: np.ndarray) -> np.ndarray:
+        """
+        Sets, in last_visits (indexed by user index), the POI of the last row of every user in the aligned
+        arrays of user and POI indices.
+        """
+        users, from_end = np.unique(user_codes[::-1], return_index=True)
+        last_visits[users] = poi_codes[len(poi_codes) - 1 - from_end]
+        return last_visits
+
+    def _set_visited_pairs(self, user_codes: np.ndarray, poi_codes: np.ndarray, visited_bitset: bool):
+        """
+        Stores the visited index from aligned arrays of user indices (into visited_user_index) and POI indices.
+        """
+        n_users, n_pois = len(self.visited_user_index), len(self.vocabulary)
+
+        pairs = np.unique(user_codes.astype(np.int64) * n_pois + poi_codes)
+        index_dtype = np.int32 if max(len(pairs), n_pois) < np.iinfo(np.int32).max else np.int64
+        self.visited_values = (pairs % max(n_pois, 1)).astype(index_dtype)
+        self.visited_offsets = np.zeros(n_users + 1, dtype=index_dtype)
+        np.cumsum(np.bincount(pairs // max(n_pois, 1), minlength=n_users), out=self.visited_offsets[1:])
+
+        # Optional packed bitset: bit p of row u is set if user u visited POI p
+        self.visited_bitset = None
+        if visited_bitset:
+            bits = np.zeros((n_users, n_pois), dtype=bool)
+            bits[np.repeat(np.arange(n_users), np.diff(self.visited_offsets)), self.visited_values] = True
+            self.visited_bitset = np.packbits(bits, axis=1)
+
+    def _update_visited_index(self, new_trail_df: pd.DataFrame):
+        """
+        Adds the visits of new trails to the visited index (new users are indexed after the known ones).
+        """
+        for user in pd.unique(new_trail_df['user_id']):
+            self.visited_user_index.setdefault(user, len(self.visited_user_index))
+
+        old_users = np.repeat(np.arange(len(self.visited_offsets) - 1), np.diff(self.visited_offsets))
+        new_users = new_trail_df['user_id'].map(self.visited_user_index).to_numpy()
+        new_pois = self.vocabulary.indices(new_trail_df['venue_id'])
+        self._set_visited_pairs(
+            np.concatenate([old_users, new_users]),
+            np.concatenate([self.visited_values, new_pois]),
+            self.visited_bitset is not None
+        )
+
+        # The new rows come after the old ones
+        last_visits = np.full(len(self.visited_user_index), -1, dtype=self.visited_values.dtype)
+        last_visits[:len(self.last_visits)] = self.last_visits
+        self.last_visits = self._last_visits(new_users, new_pois, last_visits)
+
+    def visited_poi_indices(self, user: int) -> np.ndarray:
+        """
+        Returns the vocabulary indices of the distinct POIs visited by a user in trail_df.
+
+        Parameters:
+        - user: int, the user ID.
+
+        Returns:
+        - np.ndarray: Sorted POI indices (empty if the user has no trails).
+        """
+        user_index = self.visited_user_index.get(user)
+        if user_index is None:
+            return self.visited_values[:0]
+        return self.visited_values[self.visited_offsets[user_index]:self.visited_offsets[user_index + 1]]
+
+    def visited_pois(self, user: int) -> Set[int]:
+        """
+        Returns the set of venue IDs visited by a user in trail_df.
+
+        Parameters:
+        - user: int, the user ID.
+
+        Returns:
+        - Set[int]: The visited venue IDs (empty if the user has no trails).
+        """
+        return set(self.vocabulary.poi_ids[self.visited_poi_indices(user)].tolist())
+
+    def has_visited(self, user: int, poi: int) -> bool:
+        """
+        Checks whether a user visited a POI in trail_df, using the bitset if it was built.
+
+        Parameters:
+        - user: int, the user ID.
+        - poi: int, the venue ID.
+
+        Returns:
+        - bool: True if the user visited the POI.
+        """
+        user_index = self.visited_user_index.get(user)
+        poi_index = self.vocabulary.index_of(poi)
+        if user_index is None or poi_index < 0:
+            return False
+        if self.visited_bitset is not None:
+            return bool(self.visited_bitset[user_index, poi_index >> 3] & (0x80 >> (poi_index & 7)))
+        visited = self.visited_poi_indices(user)
+        position = np.searchsorted(visited, poi_index)
+        return position < len(visited) and visited[position] == poi_index
+
+    def last_visited_poi(self, user: int):
+        """
+        Returns the venue ID of the last row of a user in trail_df, or None if the user has no trails.
+        """
+        user_index = self.visited_user_index.get(user)
+        if user_index is None:
+            return None
+        return self.vocabulary.poi_ids[self.last_visits[user_index]].item()
 
     def recommend_for_user(self, user: int, n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
         """
@@ -62,3 +245,338 @@ class BasicRouteRecommender:
         """
         pass
 
+    def recommend_batch(self, users: List[int], starting_pois: List[int], n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[List[int]]:
+        """
+        Recommends routes for several users at once, each starting from its own POI.
+
+        Subclasses may override this method with a vectorised implementation; the default one
+        calls recommend_from_poi for every user (recommend_beam_search when beam_width > 1). Users
+        whose recommendation fails are reported and get an empty route, so one failure does not
+        abort the whole batch.
+
+        Parameters:
+        - users: List[int], the user IDs to recommend POIs for.
+        - starting_pois: List[int], the starting POI of each user (aligned with users).
+        - n_items: int, the number of POIs to recommend per user.
+        - filter_visits: VisitFilter, whether to exclude previously visited POIs.
+        - tiebreaker: TieBreaker, strategy for resolving ties.
+
+        Returns:
+        - List[List[int]]: The recommended POI IDs of each user, in the order of users.
+        """
+        recommendations = []
+        for user, starting_poi in zip(users, starting_pois):
+            started = self._profile_clock()
+            try:
+                if self.beam_width > 1:
+                    recommendations.append(self.recommend_beam_search(user, n_items, starting_poi, filter_visits, tiebreaker))
+                else:
+                    recommendations.append(self.recommend_from_poi(user, n_items, starting_poi, filter_visits, tiebreaker))
+            except Exception as e:
+                print(f"Error processing user {user}: {e}")
+                recommendations.append([])
+            if self.profiler is not None:
+                self.profiler.record_latency(f"{type(self).__name__}.query", time.perf_counter() - started)
+        return recommendations
+
+    def update(self, new_trail_df: pd.DataFrame):
+        """
+        Adds new trails to the fitted model in place, without refitting it.
+
+        The trails are appended to trail_df, venue IDs not seen before are appended to the vocabulary
+        (as POIs without a row in poi_df) and the popularity and visited index are updated; _update
+        then applies the new trails to the state of each recommender. When the new trail IDs sort
+        after the old ones (as when trails are appended to the training file) the model is the one a
+        refit on all the trails gives, except for the vocabulary order of the new venue IDs.
+
+        Parameters:
+        - new_trail_df: pd.DataFrame, the new trails, with the columns of trail_df.
+
+        Raises:
+        - NotImplementedError: If the recommender does not support incremental updates.
+        - ValueError: If a trail of new_trail_df is already in trail_df.
+        """
+        if not self.INCREMENTAL_UPDATE:
+            raise NotImplementedError(f"{type(self).__name__} does not support incremental updates.")
+        if new_trail_df['trail_id'].isin(self.trail_df['trail_id']).any():
+            raise ValueError("new_trail_df contains trails that are already in trail_df")
+
+        with self._stage("update"):
+            n_new_pois = self.vocabulary.extend(new_trail_df['venue_id'])
+            poi_codes = self.vocabulary.indices(new_trail_df['venue_id'])
+            self.vocabulary.popularity = self.vocabulary.popularity + np.bincount(poi_codes, minlength=len(self.vocabulary))
+            self._update_visited_index(new_trail_df)
+            self.trail_df = pd.concat([self.trail_df, new_trail_df], ignore_index=True)
+            self._update(new_trail_df, n_new_pois)
+
+    def _update(self, new_trail_df: pd.DataFrame, n_new_pois: int):
+        """
+        Applies new trails to the fitted state of the recommender (called by update once trail_df,
+        the vocabulary and the visited index include them).
+
+        Parameters:
+        - new_trail_df: pd.DataFrame, the new trails.
+        - n_new_pois: int, number of POIs appended to the vocabulary.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support incremental updates.")
+
+    def _beam_state(self, user: int):
+        """
+        Returns the per-query state passed to _step_scores (None unless the scores depend on the user).
+
+        Parameters:
+        - user: int, the user ID to recommend POIs for.
+        """
+        return None
+
+    def _step_scores(self, current_pois: np.ndarray, state) -> sparse.csr_matrix:
+        """
+        Scores the possible next POIs of several partial routes in one pass.
+
+        Parameters:
+        - current_pois: np.ndarray, vocabulary index of the last POI of each route.
+        - state: the value returned by _beam_state for the user.
+
+        Returns:
+        - sparse.csr_matrix: A (len(current_pois) x n_pois) matrix whose row i holds the score of every
+          possible successor of route i. The score of a route is the sum of the scores of its steps.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support beam search.")
+
+    def _beam_route_length(self, n_items: int) -> int:
+        """
+        Returns the length (starting POI included) of the routes of recommend_from_poi for n_items.
+        """
+        return n_items
+
+    def _beam_excluded(self, user: int, filter_visits: VisitFilter) -> np.ndarray:
+        """
+        Returns the mask of the POIs that recommend_from_poi never recommends to the user.
+        """
+        excluded = np.zeros(len(self.vocabulary), dtype=bool)
+        if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
+            excluded[self.visited_poi_indices(user)] = True
+        return excluded
+
+    def _beam_rank(self, routes: np.ndarray, beams: np.ndarray, pois: np.ndarray, tiebreaker: TieBreaker, state) -> tuple:
+        """
+        Ranks the extensions of the beams that tie on score, and ends the beams that recommend_from_poi
+        would stop.
+
+        Parameters:
+        - routes: np.ndarray, the beams (one route of vocabulary indices per row).
+        - beams: np.ndarray, the beam of each candidate extension.
+        - pois: np.ndarray, the POI of each candidate extension (neither excluded nor in its beam).
+        - tiebreaker: TieBreaker, strategy for resolving ties.
+        - state: the value returned by _beam_state for the user.
+
+        Returns:
+        - tuple: (ties, ended), a tuple of np.lexsort keys over the candidates (the last one first, lower
+          keys preferred) and the mask of the beams that cannot be extended.
+        """
+        if tiebreaker == TieBreaker.POPULARITY:
+            ties = -self.vocabulary.popularity[pois].astype(np.float64)
+        else:
+            # Distance from the last POI of the beam; POIs without coordinates go last
+            last = routes[beams, -1]
+            located = self.vocabulary.has_coordinates[last] & self.vocabulary.has_coordinates[pois]
+            ties = np.full(len(pois), np.inf)
+            ties[located] = self.vocabulary.pair_distances(last[located], pois[located])
+        return (ties,), np.zeros(len(routes), dtype=bool)
+
+    def recommend_beam_search(self, user: int, n_items: int, starting_poi: int, filter_visits: VisitFilter, tiebreaker: TieBreaker,
+                              beam_width: int = None, time_budget: float = None) -> List[int]:
+        """
+        Recommends a route starting from a specific POI with a beam search over _step_scores.
+
+        At every step the successors of all the beams are scored in one call to _step_scores and the
+        beam_width best extensions (by route score, then by the score of the step, then by _beam_rank)
+        are kept. A route never repeats a POI, and the route length, the excluded POIs and the beams
+        that stop follow the _beam_* hooks, so a width of 1 gives the route of recommend_from_poi.
+        Routes that cannot be extended drop out, so the result is the best scored route among the
+        longest ones reached. Once the time budget is spent the search goes on
+        with a single beam, which completes the best route found so far greedily.
+
+        Parameters:
+        - user: int, the user ID to recommend POIs for.
+        - n_items: int, the number of POIs to recommend.
+        - starting_poi: int, the POI to start recommendations from.
+        - filter_visits: VisitFilter, whether to exclude previously visited POIs.
+        - tiebreaker: TieBreaker, strategy for resolving ties.
+        - beam_width: int, number of routes kept at every step (defaults to self.beam_width).
+        - time_budget: float, wall-clock seconds for the query (defaults to self.beam_time_budget; None for no limit).
+
+        Returns:
+        - List[int]: A list of recommended POI IDs, starting with starting_poi.
+        """
+        started = time.perf_counter()
+        beam_width = self.beam_width if beam_width is None else beam_width
+        time_budget = self.beam_time_budget if time_budget is None else time_budget
+
+        start_index = self.vocabulary.index_of(starting_poi)
+        if start_index < 0:
+            return [starting_poi]
+
+        excluded = self._beam_excluded(user, filter_visits)
+        state = self._beam_state(user)
+        route_length = self._beam_route_length(n_items)
+
+        # One row per beam (vocabulary indices), sorted by decreasing score
+        routes = np.array([[start_index]], dtype=np.int64)
+        scores = np.zeros(1)
+
+        while routes.shape[1] < route_length:
+            if time_budget is not None and time.perf_counter() - started > time_budget:
+                beam_width = 1
+
+            step_started = self._profile_clock()
+            candidates = self._step_scores(routes[:, -1], state).tocoo()
+            beams, pois = candidates.row.astype(np.int64), candidates.col.astype(np.int64)
+
+            keep = ~excluded[pois] & ~(routes[beams] == pois[:, None]).any(axis=1)
+            beams, pois, steps = beams[keep], pois[keep], candidates.data[keep]
+            ties, ended = self._beam_rank(routes, beams, pois, tiebreaker, state)
+            keep = ~ended[beams]
+            beams, pois, steps, ties = beams[keep], pois[keep], steps[keep], tuple(key[keep] for key in ties)
+            if len(beams) == 0:
+                break
+            totals = scores[beams] + steps
+
+            # The step score separates extensions whose route scores only tie by rounding
+            best = np.lexsort((pois, beams) + ties + (-steps, -totals))[:beam_width]
+            routes = np.column_stack([routes[beams[best]], pois[best]])
+            scores = totals[best]
+            self._record_step(step_started, candidates.nnz, "beam_step")
+
+        return [starting_poi] + self.vocabulary.poi_ids[routes[0, 1:]].tolist()
+
+    def save(self, path: str):
+        """
+        Saves the fitted state of the recommender to a directory.
+
+        NumPy arrays, scipy sparse matrices, Series, DataFrames, dicts and the vocabulary are stored as arrays in an
+        uncompressed arrays.npz (so that load can memory-map them); scalar attributes, the class
+        name and the hash of the dataset the model was fitted on go to manifest.json. The input
+        DataFrames (INPUT_ATTRIBUTES) are not saved.
+
+        Parameters:
+        - path: str, directory to save the model to (created if needed).
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays, layout, params = {}, {}, {}
+
+        def store(key: str, values) -> bool:
+            arrays[key], is_object = persistence.to_storable_array(values)
+            return is_object
+
+        for name, value in vars(self).items():
+            if name in self.INPUT_ATTRIBUTES:
+                continue
+            if value is None or isinstance(value, (bool, int, float, str)):
+                params[name] = value
+            elif isinstance(value, (np.integer, np.floating)):
+                params[name] = value.item()
+            elif isinstance(value, np.ndarray):
+                layout[name] = {'kind': 'array', 'object': store(name, value)}
+            elif isinstance(value, PoiVocabulary):
+                layout[name] = {'kind': 'vocabulary', 'object': {array: store(f"{name}.{array}", getattr(value, array)) for array in value.ARRAYS}}
+            elif sparse.issparse(value):
+                value = value.tocsr()
+                for component in ['data', 'indices', 'indptr']:
+                    store(f"{name}.{component}", getattr(value, component))
+                layout[name] = {'kind': 'sparse', 'shape': list(value.shape)}
+            elif isinstance(value, pd.Series):
+                layout[name] = {'kind': 'series', 'object': [store(f"{name}.index", value.index), store(f"{name}.values", value.to_numpy())]}
+            elif isinstance(value, pd.DataFrame):
+                layout[name] = {'kind': 'frame', 'object': [store(f"{name}.index", value.index), store(f"{name}.columns", value.columns),
+                                                            store(f"{name}.values", value.to_numpy())]}
+            elif isinstance(value, dict):
+                layout[name] = {'kind': 'dict', 'object': [store(f"{name}.keys", list(value.keys())), store(f"{name}.values", list(value.values()))]}
+            else:
+                raise TypeError(f"Cannot save attribute {name} of type {type(value).__name__}")
+
+        persistence.save_arrays(os.path.join(path, persistence.ARRAYS_FILE), arrays)
+        persistence.write_manifest(path, {
+            'format_version': persistence.MODEL_FORMAT_VERSION,
+            'class': type(self).__name__,
+            'dataset_hash': persistence.dataset_hash(self.poi_df, self.trail_df),
+            'uses_distance_cache': hasattr(self, 'distance_cache'),
+            'distance_mode': dist.distance_mode,
+            'params': params,
+            'layout': layout
+        })
+
+    @classmethod
+    def load(cls, path: str, poi_df: pd.DataFrame, trail_df: pd.DataFrame, distance_cache: pd.DataFrame = None, mmap: bool = True):
+        """
+        Loads a recommender saved with save, without refitting it.
+
+        Parameters:
+        - path: str, directory the model was saved to.
+        - poi_df: pd.DataFrame, the POI DataFrame the model was fitted on.
+        - trail_df: pd.DataFrame, the trail DataFrame the model was fitted on.
+        - distance_cache: pd.DataFrame, distance cache for the recommenders that use one (computed if None).
+        - mmap: bool, whether to memory-map the stored arrays (read-only) instead of reading them.
+
+        Returns:
+        - BasicRouteRecommender: The loaded recommender.
+
+        Raises:
+        - ValueError: If there is no model in path, or it was saved by another class, another format
+          version or fitted on another dataset or distance mode.
+        """
+        manifest = persistence.read_manifest(path)
+        if manifest is None:
+            raise ValueError(f"No saved model in {path}")
+        if manifest['class'] != cls.__name__:
+            raise ValueError(f"{path} contains a {manifest['class']}, not a {cls.__name__}")
+        if manifest['format_version'] != persistence.MODEL_FORMAT_VERSION:
+            raise ValueError(f"{path} was saved with model format {manifest['format_version']}")
+        if manifest['dataset_hash'] != persistence.dataset_hash(poi_df, trail_df):
+            raise ValueError(f"{path} was fitted on a different dataset")
+        if manifest.get('distance_mode') != dist.distance_mode:
+            raise ValueError(f"{path} was fitted with the {manifest.get('distance_mode')} distance mode")
+
+        arrays = persistence.load_arrays(os.path.join(path, persistence.ARRAYS_FILE), mmap)
+
+        def restore(key: str, is_object: bool) -> np.ndarray:
+            return persistence.from_storable_array(arrays[key], is_object)
+
+        recommender = cls.__new__(cls)
+        recommender.poi_df = poi_df
+        recommender.trail_df = trail_df
+        if manifest['uses_distance_cache']:
+            recommender.distance_cache = distance_cache if distance_cache is not None else dist.calculate_distance_cache(poi_df)
+
+        for name, value in manifest['params'].items():
+            setattr(recommender, name, value)
+
+        for name, entry in manifest['layout'].items():
+            kind = entry['kind']
+            if kind == 'array':
+                value = restore(name, entry['object'])
+            elif kind == 'sparse':
+                value = sparse.csr_matrix((arrays[f"{name}.data"], arrays[f"{name}.indices"], arrays[f"{name}.indptr"]), shape=tuple(entry['shape']))
+            elif kind == 'vocabulary':
+                value = PoiVocabulary.from_arrays({array: restore(f"{name}.{array}", is_object) for array, is_object in entry['object'].items()})
+            elif kind == 'series':
+                index_object, values_object = entry['object']
+                value = pd.Series(restore(f"{name}.values", values_object), index=restore(f"{name}.index", index_object), copy=False)
+            elif kind == 'frame':
+                index_object, columns_object, values_object = entry['object']
+                value = pd.DataFrame(restore(f"{name}.values", values_object), index=restore(f"{name}.index", index_object),
+                                     columns=restore(f"{name}.columns", columns_object), copy=False)
+            else:
+                keys_object, values_object = entry['object']
+                value = dict(zip(restore(f"{name}.keys", keys_object).tolist(), restore(f"{name}.values", values_object).tolist()))
+            setattr(recommender, name, value)
+
+        recommender._after_load()
+        return recommender
+
+    def _after_load(self):
+        """
+        Hook called by load once every saved attribute is restored, to rebuild the attributes
+        derived from the inputs (e.g. views of the distance cache) that save does not store.
+        """
+        pass
@@ -0,0 +1,239 @@
+from Recommenders import BasicRouteRecommender, VisitFilter, TieBreaker
+from collections import defaultdict
+from typing import List
+import numpy as np
+import pandas as pd
+import trails
+
+# Approximate bytes held by the build dictionaries per stored entry (a context or one of its successors)
+BUILD_ENTRY_BYTES = 200
+
+
+class VariableOrderMarkovRouteRecommender(BasicRouteRecommender):
+    """
+    Recommender system based on a variable-order Markov chain stored as a prediction suffix tree.
+
+    Every node of the tree is a context (the last POIs of a route, up to max_order of them) with the
+    counts of the POIs that followed it in the training trails. The children of a node extend its
+    context one POI further into the past, so the longest known context of a route is found by
+    walking down from the root with the route read backwards. When a context has no usable
+    successor the model backs off to the shorter contexts on the way back to the root. The root
+    counts every visit, including the first POI of each trail, so its successors are the POIs by
+    popularity (number of visits) rather than by number of transitions into them.
+    """
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, max_order: int = 3, min_count: int = 2, memory_budget_mb: float = 256):
+        """
+        Parameters:
+        - poi_df: pd.DataFrame, DataFrame containing POI information.
+        - trail_df: pd.DataFrame, DataFrame containing user trail information.
+        - max_order: int, maximum number of previous POIs a context can hold.
+        - min_count: int, contexts longer than one POI observed fewer times than this are pruned.
+        - memory_budget_mb: float, approximate memory the contexts may take while the tree is built;
+          when it is exceeded the least frequent long contexts are pruned.
+        """
+        super().__init__(poi_df, trail_df)
+        self.max_order = max_order
+        self.min_count = min_count
+        self.memory_budget_mb = memory_budget_mb
+        with self._stage("count_contexts"):
+            contexts = self._count_contexts()
+        with self._stage("build_tree"):
+            self._build_tree(contexts)
+
+    def _count_contexts(self) -> dict:
+        """
+        Counts the successors of every context in one streaming pass over the trails.
+
+        Trails are read from the trail store (by trail id, rows of the same trail keep their order). Whenever the
+        build dictionaries exceed the memory budget, contexts of two or more POIs seen fewer times
+        than a threshold are dropped and the threshold doubles; a dropped context starts counting
+        again from zero if it reappears. The empty and single-POI contexts are never pruned, so if
+        they alone exceed the budget the next pruning is delayed until the entries grow by half.
+
+        Every visit is counted under the empty context, even the first of a trail (which has no
+        longer context), so the counts of the empty context are the visit counts of the POIs.
+
+        Returns:
+        - dict: Mapping from a context (tuple of vocabulary indices, most recent last) to a dict
+          {next POI index: count}.
+        """
+        store = trails.store_of(self.trail_df)
+        pois = self.vocabulary.indices(store.pois).tolist()
+        trail_starts = np.zeros(len(pois), dtype=bool)
+        trail_starts[store.offsets[:-1]] = True
+        trail_starts = trail_starts.tolist()
+
+        max_entries = max(1, int(self.memory_budget_mb * 2 ** 20 / BUILD_ENTRY_BYTES))
+        prune_at = max_entries
+        threshold = self.min_count
+        contexts = defaultdict(lambda: defaultdict(int))
+        totals = defaultdict(int)
+        n_entries = 0
+
+        history = []
+        for row, poi in enumerate(pois):
+            if trail_starts[row]:
+                history = []
+
+            for length in range(min(self.max_order, len(history)) + 1):
+                context = tuple(history[len(history) - length:])
+                successors = contexts[context]
+                n_entries += (len(successors) == 0) + (poi not in successors)
+                successors[poi] += 1
+                totals[context] += 1
+
+            history.append(poi)
+            if len(history) > self.max_order:
+                history.pop(0)
+
+            if n_entries > prune_at:
+                pruned = [context for context in contexts if len(context) > 1 and totals[context] < threshold]
+                for context in pruned:
+                    n_entries -= 1 + len(contexts[context])
+                    del contexts[context]
+                    del totals[context]
+                threshold *= 2
+                prune_at = max(max_entries, n_entries + n_entries // 2)
+
+        # Final count-based pruning (the empty and single-POI contexts are always kept)
+        return {
+            context: successors for context, successors in contexts.items()
+            if len(context) <= 1 or totals[context] >= self.min_count
+        }
+
+    def _build_tree(self, contexts: dict):
+        """
+        Stores the contexts as a suffix tree in flat arrays.
+
+        Node 0 is the root (the empty context). Node ids grow with the context length, so the parent of
+        a node always has a smaller id. The child of node p that extends its context with POI x (one
+        step further into the past) is child_nodes[i] where child_keys[i] == p * n_pois + x; child_keys
+        is sorted. The successors of node n are successor_pois[successor_offsets[n]:successor_offsets[n + 1]]
+        (sorted by POI index) with their counts in successor_counts.
+        """
+        n_pois = len(self.vocabulary)
+
+        # Every suffix of a kept context must be a node for the tree walk to reach it
+        nodes = set(contexts)
+        nodes.add(())
+        for context in list(nodes):
+            for start in range(1, len(context)):
+                nodes.add(context[start:])
+        nodes = sorted(nodes, key=lambda context: (len(context), context))
+        node_ids = {context: idx for idx, context in enumerate(nodes)}
+
+        child_keys = np.array([node_ids[context[1:]] * n_pois + context[0] for context in nodes[1:]], dtype=np.int64)
+        child_nodes = np.arange(1, len(nodes), dtype=np.int32)
+        order = np.argsort(child_keys, kind='stable')
+        self.child_keys, self.child_nodes = child_keys[order], child_nodes[order]
+        self.node_depths = np.array([len(context) for context in nodes], dtype=np.int32)
+
+        lengths = np.array([len(contexts.get(context, ())) for context in nodes], dtype=np.int64)
+        self.successor_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.successor_offsets[1:])
+        self.successor_pois = np.zeros(self.successor_offsets[-1], dtype=np.int32)
+        self.successor_counts = np.zeros(self.successor_offsets[-1], dtype=np.int64)
+        for node, context in enumerate(nodes):
+            successors = contexts.get(context)
+            if successors:
+                start, stop = self.successor_offsets[node], self.successor_offsets[node + 1]
+                pois = np.fromiter(successors.keys(), dtype=np.int32, count=len(successors))
+                counts = np.fromiter(successors.values(), dtype=np.int64, count=len(successors))
+                order = np.argsort(pois)
+                self.successor_pois[start:stop], self.successor_counts[start:stop] = pois[order], counts[order]
+
+    def _context_path(self, route: List[int]) -> List[int]:
+        """
+        Returns the nodes of the longest known context of a route, from the root to the deepest node.
+
+        Parameters:
+        - route: List[int], vocabulary indices of the route so far (most recent last).
+        """
+        n_pois = len(self.vocabulary)
+        path = [0]
+        for poi in reversed(route[-self.max_order:]):
+            key = path[-1] * n_pois + poi
+            position = np.searchsorted(self.child_keys, key)
+            if position == len(self.child_keys) or self.child_keys[position] != key:
+                break
+            path.append(int(self.child_nodes[position]))
+        return path
+
+    def predict_next(self, route: List[int], excluded: np.ndarray, tiebreaker: TieBreaker) -> int:
+        """
+        Predicts the next POI of a route from its longest context with a non-excluded successor.
+
+        Parameters:
+        - route: List[int], vocabulary indices of the route so far (most recent last).
+        - excluded: np.ndarray, mask of the POIs that cannot be predicted.
+        - tiebreaker: TieBreaker, strategy for resolving ties between the most frequent successors.
+
+        Returns:
+        - int: Vocabulary index of the next POI, or -1 if no context has a usable successor.
+        """
+        step_started = self._profile_clock()
+        path = self._context_path(route)
+        n_scanned = 0
+        for node in reversed(path):
+            start, stop = self.successor_offsets[node], self.successor_offsets[node + 1]
+            n_scanned += stop - start
+            pois, counts = self.successor_pois[start:stop], self.successor_counts[start:stop]
+            available = ~excluded[pois]
+            if not available.any():
+                continue  # Back off to a shorter context
+
+            # Whether the deepest context of the route answered (a miss means a back-off)
+            self._record_cache("deepest_context", node == path[-1])
+            pois, counts = pois[available], counts[available]
+            candidates = pois[counts == counts.max()]
+            if len(candidates) > 1:
+                with self._stage("tiebreak"):
+                    if tiebreaker == TieBreaker.POPULARITY:
+                        candidates = candidates[self.vocabulary.popularity_order(candidates)]
+                    elif tiebreaker == TieBreaker.DISTANCE:
+                        # From a POI without coordinates every distance is infinite (as in the Markov
+                        # successor tables): the candidates keep their order, located ones first
+                        distances = np.full(len(candidates), np.inf)
+                        if self.vocabulary.has_coordinates[route[-1]]:
+                            distances = self.vocabulary.distances_from(route[-1], candidates)
+                        candidates = candidates[self.vocabulary.distance_order(candidates, distances)]
+            self._record_step(step_started, n_scanned)
+            return int(candidates[0])
+        self._record_step(step_started, n_scanned)
+        return -1
+
+    def recommend_from_poi(self, user: int, n_items: int, starting_poi: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
+        """
+        Recommends POIs starting from a specific POI, conditioning every step on the longest known context.
+
+        Parameters:
+        - user: int, the user ID to recommend POIs for.
+        - n_items: int, the number of POIs to recommend.
+        - starting_poi: int, the POI to start recommendations from.
+        - filter_visits: VisitFilter, whether to exclude previously visited POIs.
+        - tiebreaker: TieBreaker, strategy for resolving ties.
+
+        Returns:
+        - List[int]: A list of recommended POI IDs.
+        """
+        recommendations = [starting_poi]
+        current_poi = self.vocabulary.index_of(starting_poi)
+        if current_poi < 0:
+            return recommendations
+
+        excluded = np.zeros(len(self.vocabulary), dtype=bool)
+        excluded[current_poi] = True
+        if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
+            excluded[self.visited_poi_indices(user)] = True
+
+        route = [current_poi]
+        while len(recommendations) < n_items:
+            next_poi = self.predict_next(route, excluded, tiebreaker)
+            if next_poi < 0:
+                break
+
+            recommendations.append(self.vocabulary.poi_ids[next_poi])
+            excluded[next_poi] = True
+            route.append(next_poi)
+
+        return recommendations
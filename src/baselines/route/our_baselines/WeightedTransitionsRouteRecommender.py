@@ -1,93 +1,440 @@
 from Recommenders import BasicRouteRecommender, TieBreaker, VisitFilter
-from typing import List, Dict
+from typing import List
+import time
 import pandas as pd
 import numpy as np
-from collections import defaultdict
-from tqdm import tqdm
+from scipy import sparse
 import utils as ut
+import distances as dist
+import trails
 
 class WeightedTransitionsRouteRecommender(BasicRouteRecommender):
     """
     Random Walk-based recommender system for POI recommendation.
+
+    The POI graph combines distance, transition and category weights. Routes follow by default the
+    heaviest edge not yet taken at every step; with walk_restart set, the POIs are scored with a
+    personalised random walk with restart from each starting POI and routes follow the edge to the
+    best-scored POI instead (in recommend_from_poi and recommend_batch, replacing the beam search).
     """
-    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame):
+    BEAM_SEARCH = True
+    INCREMENTAL_UPDATE = True
+    # walk_operator caches _walk_operator until the adjacency changes: not saved, rebuilt on demand
+    INPUT_ATTRIBUTES = BasicRouteRecommender.INPUT_ATTRIBUTES + ('walk_operator',)
+
+    # Personalised random walk with restart scoring the routes (None keeps the greedy or beam routes):
+    # probability of jumping back to the starting POI, convergence tolerance (L1 change of the scores of
+    # every start), iteration cap and number of starting POIs iterated together; set on the instance to change them
+    walk_restart = None
+    walk_tolerance = 1e-6
+    walk_max_iterations = 100
+    walk_batch_size = 64
+
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, n_distance_neighbours: int = 100, distance_radius: float = None):
+        """
+        Args:
+            poi_df (pd.DataFrame): DataFrame containing POI information.
+            trail_df (pd.DataFrame): DataFrame containing user trail information.
+            n_distance_neighbours (int): Number of nearest POIs linked by the distance component (None links every POI).
+            distance_radius (float): Maximum distance in km of the POIs linked by the distance component (None for no limit).
+        """
         super().__init__(poi_df, trail_df)
-        self.distance_weights = defaultdict(lambda: defaultdict(float))
-        self.transition_weights = defaultdict(lambda: defaultdict(float))
-        self.category_weights = defaultdict(lambda: defaultdict(float))
-        self.poi_popularity = self._calculate_popularity()
+        self.n_distance_neighbours = n_distance_neighbours
+        self.distance_radius = distance_radius
         self._build_poi_graph_components()
+        with self._stage("adjacency"):
+            self._build_adjacency()
+
+        # Rows of the adjacency that are recomputed before the next query (after update)
+        self.stale_rows = np.zeros(len(self.vocabulary), dtype=bool)
+        self.walk_operator = None
+
+    def _after_load(self):
+        self.walk_operator = None
 
     def _build_poi_graph_components(self):
         """
         Constructs individual weight components for the POI graph: distance, transitions, and categories.
+
+        Each component is a sparse.csr_matrix over the indices of the shared POI vocabulary.
+        """
+        vocabulary = self.vocabulary
+        num_pois = len(vocabulary)
+
+        with_coords = np.flatnonzero(vocabulary.has_coordinates)
+
+        # Compute distance weights (inverse distance) between each POI and its nearest POIs
+        with self._stage("distance_graph"):
+            distance_graph, min_distance, max_distance = dist.sparse_distance_graph(
+                vocabulary.latitude[with_coords], vocabulary.longitude[with_coords],
+                k=self.n_distance_neighbours, radius=self.distance_radius
+            )
+            distance_graph = distance_graph.tocoo()
+            self.distance_weights = sparse.csr_matrix(
+                (1 / distance_graph.data, (with_coords[distance_graph.row], with_coords[distance_graph.col])),
+                shape=(num_pois, num_pois)
+            )
+
+            # Normalize distance weights (the distance bounds cover every pair, not only the linked ones)
+            if min_distance is not None and max_distance > min_distance:
+                min_weight, max_weight = 1 / max_distance, 1 / min_distance
+                self.distance_weights.data = (self.distance_weights.data - min_weight) / (max_weight - min_weight)
+
+        # Compute transition and category transition counts
+        with self._stage("transition_counts"):
+            self.n_transitions = 0
+            self.transition_counts, self.category_counts, self.transition_order = self._add_transitions(
+                self.trail_df, self._empty_matrix(), self._empty_matrix(), self._empty_matrix()
+            )
+            self.transition_weights = self._normalize_counts(self.transition_counts)
+            self.category_weights = self._normalize_counts(self.category_counts)
+
+    def _empty_matrix(self) -> sparse.csr_matrix:
+        num_pois = len(self.vocabulary)
+        return sparse.csr_matrix((num_pois, num_pois))
+
+    def _add_transitions(self, trail_df: pd.DataFrame, transition_counts: sparse.csr_matrix, category_counts: sparse.csr_matrix,
+                         transition_order: sparse.csr_matrix) -> tuple:
+        """
+        Adds the transitions of some trails to the transition and category transition counts.
+
+        Args:
+            trail_df (pd.DataFrame): The trails, placed after the n_transitions transitions already counted.
+            transition_counts (sparse.csr_matrix): Counts of the (from, to) transitions so far.
+            category_counts (sparse.csr_matrix): Counts of the transitions between POIs that both have a category so far.
+            transition_order (sparse.csr_matrix): Position (starting at 1) of the first observation of every transition so far.
+
+        Returns:
+            tuple: (transition_counts, category_counts, transition_order) with the new transitions.
+        """
+        vocabulary = self.vocabulary
+        num_pois = len(vocabulary)
+
+        poi_from, poi_to, weights = trails.store_of(trail_df, dedupe=True).transitions()
+        poi_from, poi_to = vocabulary.indices(poi_from), vocabulary.indices(poi_to)
+        transition_counts = transition_counts + self._count_transitions(poi_from, poi_to, weights, num_pois)
+
+        # First observation of every transition, in trail order (used to keep the original candidate order);
+        # the transitions already seen keep their position
+        pair_keys, first_seen = np.unique(poi_from.astype(np.int64) * num_pois + poi_to, return_index=True)
+        new_order = sparse.csr_matrix(
+            (first_seen.astype(np.float64) + 1 + self.n_transitions, (pair_keys // num_pois, pair_keys % num_pois)),
+            shape=(num_pois, num_pois)
+        )
+        transition_order = transition_order + new_order - new_order.multiply(transition_order > 0)
+        self.n_transitions += len(poi_from)
+
+        # Compute category transition counts (only between POIs that both have a category)
+        with_category = (vocabulary.categories[poi_from] >= 0) & (vocabulary.categories[poi_to] >= 0)
+        category_counts = category_counts + self._count_transitions(poi_from[with_category], poi_to[with_category], weights[with_category], num_pois)
+
+        return transition_counts.tocsr(), category_counts.tocsr(), transition_order.tocsr()
+
+    @staticmethod
+    def _normalize_counts(counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        Min-max normalises transition counts to weights.
+        """
+        weights = counts.copy()
+        # Counts start at 1, so the minimum count is 1 whenever there is any transition
+        if weights.nnz > 0 and weights.data.max() > 1:
+            weights.data = (weights.data - 1) / (weights.data.max() - 1)
+        return weights
+
+    @staticmethod
+    def _count_transitions(poi_from: np.ndarray, poi_to: np.ndarray, weights: np.ndarray, num_pois: int) -> sparse.csr_matrix:
         """
-        max_distance, min_distance = 0, float('inf')
-        max_transitions, min_transitions = 0, float('inf')
-        max_category_transitions, min_category_transitions = 0, float('inf')
-
-        poi_with_coords = self.poi_df[(self.poi_df['latitude'] != -1) & (self.poi_df['longitude'] != -1)]
-
-        # Compute distance weights
-        for i, poi_i in tqdm(poi_with_coords.iterrows(), desc="Computing distances", total=len(poi_with_coords)):
-            for j, poi_j in poi_with_coords.iloc[i + 1:].iterrows():  # Start from i + 1 to avoid redundant calculations
-                dist = ut.haversine(poi_i['latitude'], poi_i['longitude'], poi_j['latitude'], poi_j['longitude'])
-                if dist > 0:
-                    weight = 1 / dist
-                    self.distance_weights[poi_i['venue_id']][poi_j['venue_id']] += weight
-                    self.distance_weights[poi_j['venue_id']][poi_i['venue_id']] += weight  # Symmetry
-                    max_distance = max(max_distance, weight)
-                    min_distance = min(min_distance, weight)
-
-        # Compute transition weights
-        for _, trail_data in tqdm(self.trail_df.groupby('trail_id'), desc="Computing transitions"):
-            pois = trail_data['venue_id'].tolist()
-            for i in range(len(pois) - 1):
-                self.transition_weights[pois[i]][pois[i + 1]] += 1
-                max_transitions = max(max_transitions, self.transition_weights[pois[i]][pois[i + 1]])
-                min_transitions = min(min_transitions, self.transition_weights[pois[i]][pois[i + 1]])
-
-        # Compute category transition weights
-        if 'category_lvlFs' in self.poi_df.columns:
-            for _, trail_data in tqdm(self.trail_df.groupby('trail_id'), desc="Computing category transitions"):
-                pois = trail_data['venue_id'].tolist()
-                for i in range(len(pois) - 1):
-                    category_i = self.poi_df[self.poi_df['venue_id'] == pois[i]]['category_lvlFs'].iloc[0]
-                    category_j = self.poi_df[self.poi_df['venue_id'] == pois[i + 1]]['category_lvlFs'].iloc[0]
-                    if pd.notna(category_i) and pd.notna(category_j):
-                        self.category_weights[pois[i]][pois[i + 1]] += 1
-                        max_category_transitions = max(max_category_transitions, self.category_weights[pois[i]][pois[i + 1]])
-                        min_category_transitions = min(min_category_transitions, self.category_weights[pois[i]][pois[i + 1]])
-
-        # Normalize weights
-        for poi, neighbors in self.distance_weights.items():
-            for neighbor in neighbors:
-                if max_distance > min_distance:
-                    neighbors[neighbor] = (neighbors[neighbor] - min_distance) / (max_distance - min_distance)
-
-        for poi, neighbors in self.transition_weights.items():
-            for neighbor in neighbors:
-                if max_transitions > min_transitions:
-                    neighbors[neighbor] = (neighbors[neighbor] - min_transitions) / (max_transitions - min_transitions)
-
-        for poi, neighbors in self.category_weights.items():
-            for neighbor in neighbors:
-                if max_category_transitions > min_category_transitions:
-                    neighbors[neighbor] = (neighbors[neighbor] - min_category_transitions) / (max_category_transitions - min_category_transitions)
-
-    def _calculate_popularity(self) -> pd.Series:
-        """
-        Calculates the popularity of each POI based on visits.
+        Counts the (from, to) transitions, each with its weight (the count of its trail), into a sparse matrix.
+        """
+        counts = sparse.csr_matrix(
+            (weights.astype(np.float64), (poi_from, poi_to)),
+            shape=(num_pois, num_pois)
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def _build_adjacency(self):
+        """
+        Sums the three weight components into a single adjacency and sorts every row for each tiebreaker
+        (see _adjacency_rows). The ordered columns of row i are stored in positions
+        adjacency.indptr[i]:indptr[i + 1] of adjacency_by_popularity and adjacency_by_distance.
+        """
+        num_pois = len(self.vocabulary)
+        lengths, cols, combined, self.adjacency_by_popularity, self.adjacency_by_distance = self._adjacency_rows(np.arange(num_pois))
+        indptr = np.zeros(num_pois + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        self.adjacency = sparse.csr_matrix((combined, cols, indptr), shape=(num_pois, num_pois))
+
+    def _adjacency_rows(self, rows: np.ndarray) -> tuple:
+        """
+        Computes some rows of the adjacency, summing the three weight components, and sorts them for each tiebreaker.
+
+        Rows are ordered by decreasing combined weight, then by the tiebreaker key (decreasing popularity,
+        or increasing normalised distance weight with unlinked POIs last), then by the order in which the
+        neighbours were first seen: distance neighbours in POI order, followed by transition-only neighbours
+        in trail order.
+
+        Args:
+            rows (np.ndarray): Vocabulary indices of the rows.
 
         Returns:
-            pd.Series: A series with POI IDs as the index and visit counts as values.
+            tuple: (lengths, cols, combined, by_popularity, by_distance), the number of neighbours of each row,
+            their columns (increasing) and combined weights, and the columns in each tiebreaker order, all
+            concatenated in the order of rows.
+        """
+        num_pois = len(self.vocabulary)
+        components = [self.distance_weights[rows], self.transition_weights[rows], self.category_weights[rows]]
+
+        # Union of the neighbours of the three components
+        keys = np.unique(np.concatenate([
+            (component.tocoo().row.astype(np.int64) * num_pois + component.tocoo().col) for component in components
+        ]))
+        local_rows, cols = keys // num_pois, keys % num_pois
+
+        def aligned(component: sparse.csr_matrix) -> tuple:
+            component = component.tocoo()
+            values, present = np.zeros(len(keys)), np.zeros(len(keys), dtype=bool)
+            positions = np.searchsorted(keys, component.row.astype(np.int64) * num_pois + component.col)
+            values[positions], present[positions] = component.data, True
+            return values, present
+
+        distance_weight, has_distance = aligned(components[0])
+        transition_weight, _ = aligned(components[1])
+        category_weight, _ = aligned(components[2])
+        transition_order, _ = aligned(self.transition_order[rows])
+        combined = distance_weight + transition_weight + category_weight
+
+        # Order in which each neighbour was first added to the combined weights
+        seen_order = np.where(has_distance, cols, num_pois + transition_order)
+        popularity = self.vocabulary.popularity
+        distance_key = np.where(has_distance, distance_weight, np.inf)
+
+        lengths = np.bincount(local_rows, minlength=len(rows))
+        by_popularity = cols[np.lexsort((seen_order, -popularity[cols], -combined, local_rows))].astype(np.int32)
+        by_distance = cols[np.lexsort((seen_order, distance_key, -combined, local_rows))].astype(np.int32)
+        return lengths, cols.astype(np.int32), combined, by_popularity, by_distance
+
+    def _update(self, new_trail_df: pd.DataFrame, n_new_pois: int):
+        """
+        Adds the transitions of new trails to the counts and marks the adjacency rows to recompute: the rows
+        with new transitions and the rows with a neighbour whose popularity changed (for the tiebreaker), or
+        every row if the maximum count of a component changed (it normalises all the weights).
         """
-        return self.trail_df['venue_id'].value_counts()
+        num_pois = len(self.vocabulary)
+        if n_new_pois:
+            def resized(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+                return sparse.csr_matrix((matrix.data, matrix.indices, ut.append_empty_rows(matrix.indptr, n_new_pois)), shape=(num_pois, num_pois))
+
+            self.distance_weights, self.transition_counts, self.category_counts, self.transition_order, self.adjacency = [
+                resized(matrix) for matrix in [self.distance_weights, self.transition_counts, self.category_counts, self.transition_order, self.adjacency]
+            ]
+            self.stale_rows = np.concatenate([self.stale_rows, np.zeros(n_new_pois, dtype=bool)])
+
+        def max_counts() -> list:
+            return [counts.data.max() if counts.nnz > 0 else 0 for counts in [self.transition_counts, self.category_counts]]
+
+        old_max = max_counts()
+        self.transition_counts, self.category_counts, self.transition_order = self._add_transitions(
+            new_trail_df, self.transition_counts, self.category_counts, self.transition_order
+        )
+
+        stale_rows = self.stale_rows.copy()
+        if max_counts() != old_max:
+            stale_rows[:] = True
+        else:
+            poi_from, _, _ = trails.store_of(new_trail_df, dedupe=True).transitions()
+            stale_rows[self.vocabulary.indices(poi_from)] = True
+            visited = np.zeros(num_pois, dtype=bool)
+            visited[self.vocabulary.indices(new_trail_df['venue_id'])] = True
+            entry_rows = np.repeat(np.arange(num_pois), np.diff(self.adjacency.indptr))
+            stale_rows[entry_rows[visited[self.adjacency.indices]]] = True
+        self.stale_rows = stale_rows
+        self.walk_operator = None
+
+    def _refresh_stale_rows(self):
+        """
+        Recomputes the weights and the adjacency rows marked by update.
+        """
+        if not self.stale_rows.any():
+            return
+
+        with self._stage("refresh_stale_rows"):
+            self.transition_weights = self._normalize_counts(self.transition_counts)
+            self.category_weights = self._normalize_counts(self.category_counts)
+
+            rows = np.flatnonzero(self.stale_rows)
+            lengths, cols, combined, by_popularity, by_distance = self._adjacency_rows(rows)
+            indptr, (indices, data, self.adjacency_by_popularity, self.adjacency_by_distance) = ut.replace_rows(
+                self.adjacency.indptr, [self.adjacency.indices, self.adjacency.data, self.adjacency_by_popularity, self.adjacency_by_distance],
+                rows, lengths, [cols, combined, by_popularity, by_distance]
+            )
+            self.adjacency = sparse.csr_matrix((data, indices, indptr), shape=self.adjacency.shape)
+            self.stale_rows = np.zeros(len(self.stale_rows), dtype=bool)
+            self.walk_operator = None
+
+    def _step_scores(self, current_pois: np.ndarray, state) -> sparse.csr_matrix:
+        """
+        Combined weights of the edges leaving each current POI.
+        """
+        self._refresh_stale_rows()
+        return self.adjacency[current_pois]
+
+    def _beam_rank(self, routes: np.ndarray, beams: np.ndarray, pois: np.ndarray, tiebreaker: TieBreaker, state) -> tuple:
+        """
+        Ranks the candidates by their position in the adjacency row of their beam's last POI ordered
+        by the tiebreaker (see _adjacency_rows), as recommend_from_poi does.
+        """
+        ordered_neighbors = self.adjacency_by_popularity if tiebreaker == TieBreaker.POPULARITY else self.adjacency_by_distance
+        ranks = ut.row_ranks(self.adjacency.indptr, ordered_neighbors, routes[:, -1], beams, pois)
+        return (ranks,), np.zeros(len(routes), dtype=bool)
+
+    def _walk_operator(self) -> sparse.csr_matrix:
+        """
+        Transposed transition operator of the random walk: the combined adjacency with every row
+        normalised to sum 1 (rows without edges stay empty), in float32. Built once and kept in
+        walk_operator until update changes the adjacency.
+        """
+        self._refresh_stale_rows()
+        if self.walk_operator is None:
+            out_weights = np.asarray(self.adjacency.sum(axis=1)).ravel()
+            scale = np.divide(1.0, out_weights, out=np.zeros_like(out_weights), where=out_weights > 0)
+            self.walk_operator = (sparse.diags(scale) @ self.adjacency).T.tocsr().astype(np.float32)
+        return self.walk_operator
+
+    def walk_scores(self, start_indices: np.ndarray, operator: sparse.csr_matrix = None) -> np.ndarray:
+        """
+        Scores the POIs by a personalised random walk with restart from each of several starting POIs.
+
+        At every step the walk follows an edge with probability proportional to its combined weight,
+        and jumps back to its starting POI with probability walk_restart (or when it reaches a POI
+        without edges). The scores are the stationary distribution of the walk, found by power
+        iteration for all the starting POIs at once, one sparse x dense product per iteration:
+
+            scores = (1 - walk_restart) * P^T scores + (mass not walked) * e_start
+
+        until the L1 change of every column falls below walk_tolerance, or walk_max_iterations. The
+        iteration runs in float32 (a third of the float64 product time), so tolerances much below
+        1e-6 only add iterations.
+
+        Args:
+            start_indices (np.ndarray): Vocabulary indices of the starting POIs.
+            operator (sparse.csr_matrix): Operator built by _walk_operator (built if None).
+
+        Returns:
+            np.ndarray: A (number of POIs, len(start_indices)) float32 matrix whose column j, summing to 1, scores the walk from start_indices[j].
+
+        Raises:
+            ValueError: If walk_restart is not in (0, 1].
+        """
+        restart = self.walk_restart
+        if restart is None or not 0 < restart <= 1:
+            raise ValueError(f"walk_restart must be in (0, 1], got {restart}")
+        operator = self._walk_operator() if operator is None else operator
+
+        columns = np.arange(len(start_indices))
+        scores = np.zeros((len(self.vocabulary), len(start_indices)), dtype=np.float32)
+        scores[start_indices, columns] = 1.0
+        for _ in range(self.walk_max_iterations):
+            walked = operator @ scores
+            walked *= np.float32(1 - restart)
+            # The restart mass and the mass stuck at POIs without edges go back to the start
+            walked[start_indices, columns] += (1 - walked.sum(axis=0, dtype=np.float64)).astype(np.float32)
+            change = np.abs(walked - scores).sum(axis=0).max(initial=0.0)
+            scores = walked
+            if change < self.walk_tolerance:
+                break
+        return scores
+
+    def recommend_batch(self, users: List[int], starting_pois: List[int], n_items: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[List[int]]:
+        """
+        Recommends routes for several users at once; with walk_restart set, from the random walk scores.
+
+        The walk scores (see walk_scores) are computed once per distinct starting POI, walk_batch_size
+        starting POIs at a time. Every route then moves, at each step, to the neighbour of the current
+        POI (not excluded) with the highest score from the starting POI, resolving equal scores by the
+        adjacency order of the tiebreaker. Without walk_restart, routes are those of
+        BasicRouteRecommender.recommend_batch.
+
+        Args:
+            users (List[int]): The user IDs to recommend POIs for.
+            starting_pois (List[int]): The starting POI of each user (aligned with users).
+            n_items (int): The number of POIs to recommend per user.
+            filter_visits (VisitFilter): Whether to exclude previously visited POIs.
+            tiebreaker (TieBreaker): Strategy for resolving ties.
+
+        Returns:
+            List[List[int]]: The recommended POI IDs of each user, in the order of users.
+        """
+        if self.walk_restart is None:
+            return super().recommend_batch(users, starting_pois, n_items, filter_visits, tiebreaker)
+
+        with self._stage("walk_operator"):
+            operator = self._walk_operator()
+        ordered_neighbors = self.adjacency_by_popularity if tiebreaker == TieBreaker.POPULARITY else self.adjacency_by_distance
+
+        start_indices = self.vocabulary.indices(starting_pois)
+        distinct, columns = np.unique(start_indices, return_inverse=True)
+        recommendations = [None] * len(users)
+        for first in range(0, len(distinct), self.walk_batch_size):
+            batch = distinct[first:first + self.walk_batch_size]
+            located = np.flatnonzero(batch >= 0)
+            scores = np.zeros((len(self.vocabulary), len(batch)), dtype=np.float32)
+            with self._stage("random_walk"):
+                scores[:, located] = self.walk_scores(batch[located], operator)
+
+            for position in np.flatnonzero((columns >= first) & (columns < first + len(batch))):
+                started = self._profile_clock()
+                user = users[position]
+                try:
+                    recommendations[position] = self._walk_route(
+                        user, n_items, starting_pois[position], batch[columns[position] - first],
+                        scores[:, columns[position] - first], filter_visits, ordered_neighbors
+                    )
+                except Exception as e:
+                    print(f"Error processing user {user}: {e}")
+                    recommendations[position] = []
+                if self.profiler is not None:
+                    self.profiler.record_latency(f"{type(self).__name__}.query", time.perf_counter() - started)
+        return recommendations
+
+    def _walk_route(self, user: int, n_items: int, starting_poi: int, start_index: int, scores: np.ndarray, filter_visits: VisitFilter,
+                    ordered_neighbors: np.ndarray) -> List[int]:
+        """
+        Decodes the route of a user from the walk scores of its starting POI (see recommend_batch).
+        """
+        recommendations = [starting_poi]
+        if start_index < 0:
+            return recommendations
+
+        excluded = np.zeros(len(self.vocabulary), dtype=bool)
+        if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
+            excluded[self.visited_poi_indices(user)] = True
+        excluded[start_index] = True
+
+        current_poi = start_index
+        while len(recommendations) < n_items:
+            step_started = self._profile_clock()
+            start, stop = self.adjacency.indptr[current_poi], self.adjacency.indptr[current_poi + 1]
+            neighbors = ordered_neighbors[start:stop]
+            neighbors = neighbors[~excluded[neighbors]]
+            if len(neighbors) == 0:
+                break
+
+            # argmax keeps the first of equal scores, i.e. the adjacency order of the tiebreaker
+            next_poi = neighbors[np.argmax(scores[neighbors])]
+            recommendations.append(self.vocabulary.poi_ids[next_poi])
+            excluded[next_poi] = True
+            current_poi = next_poi
+            self._record_step(step_started, stop - start)
+
+        return recommendations
 
     def recommend_from_poi(self, user: int, n_items: int, starting_poi: int, filter_visits: VisitFilter, tiebreaker: TieBreaker) -> List[int]:
         """
         Recommends POIs starting from a specific POI using a random walk strategy.
 
+        With walk_restart set, the route follows the walk scores from starting_poi, as in recommend_batch.
+
         Args:
             user (int): The user ID for which to generate recommendations.
             n_items (int): The number of POIs to recommend.
@@ -99,65 +446,44 @@ class WeightedTransitionsRouteRecommender(BasicRouteRecommender):
             List[int]: A list of recommended POI IDs.
         """
         recommendations = [starting_poi]
-        visited_pois = set(recommendations)
+        current_poi = self.vocabulary.index_of(starting_poi)
+        if current_poi < 0:
+            return recommendations
 
-        # Get user's visited POIs from training if filter_visits is enabled
-        user_visited_pois = set()
-        if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
-            user_visited_pois = set(self.trail_df[self.trail_df['user_id'] == user]['venue_id'])
+        if self.walk_restart is not None:
+            with self._stage("walk_operator"):
+                operator = self._walk_operator()
+            with self._stage("random_walk"):
+                scores = self.walk_scores(np.array([current_poi]), operator)[:, 0]
+            ordered_neighbors = self.adjacency_by_popularity if tiebreaker == TieBreaker.POPULARITY else self.adjacency_by_distance
+            return self._walk_route(user, n_items, starting_poi, current_poi, scores, filter_visits, ordered_neighbors)
 
-        current_poi = starting_poi
+        self._refresh_stale_rows()
+        excluded = np.zeros(len(self.vocabulary), dtype=bool)
 
-        while len(recommendations) < n_items:
-            combined_weights = defaultdict(float)
-
-            # Combine weights from all components
-            for neighbor, weight in self.distance_weights.get(current_poi, {}).items():
-                combined_weights[neighbor] += weight
+        # Get user's visited POIs from training if filter_visits is enabled
+        if filter_visits == VisitFilter.EXCLUDE_PREVIOUS_VISITS:
+            excluded[self.visited_poi_indices(user)] = True
 
-            for neighbor, weight in self.transition_weights.get(current_poi, {}).items():
-                combined_weights[neighbor] += weight
+        ordered_neighbors = self.adjacency_by_popularity if tiebreaker == TieBreaker.POPULARITY else self.adjacency_by_distance
 
-            for neighbor, weight in self.category_weights.get(current_poi, {}).items():
-                combined_weights[neighbor] += weight
+        excluded[current_poi] = True
 
-            # Filter neighbors if required
-            combined_weights = {
-                poi: weight for poi, weight in combined_weights.items()
-                if poi not in visited_pois and poi not in user_visited_pois
-            }
+        while len(recommendations) < n_items:
+            step_started = self._profile_clock()
+            # Neighbours are sorted by combined weight and tiebreaker: take the first one not excluded
+            start, stop = self.adjacency.indptr[current_poi], self.adjacency.indptr[current_poi + 1]
+            neighbors = ordered_neighbors[start:stop]
+            available = np.flatnonzero(~excluded[neighbors])
 
-            if not combined_weights:
+            if len(available) == 0:
                 break
 
-            # Get maximum weight
-            max_weight = max(combined_weights.values())
-
-            # Resolve ties
-            candidates = [poi for poi, weight in combined_weights.items() if weight == max_weight]
-            if len(candidates) == 0:
-                return recommendations
-
-            if len(candidates) > 1:
-                if tiebreaker == TieBreaker.POPULARITY:
-                    candidates.sort(key=lambda poi: self.poi_popularity.get(poi, 0), reverse=True)
-                elif tiebreaker == TieBreaker.DISTANCE:
-                    candidates.sort(
-                        key=lambda poi: self.distance_weights[current_poi].get(poi, float('inf'))
-                    )
-
-                    '''
-                    candidates.sort(key=lambda poi: ut.haversine(
-                        current_coords['latitude'], current_coords['longitude'],
-                        self.poi_df[self.poi_df['venue_id'] == poi]['latitude'].iloc[0],
-                        self.poi_df[self.poi_df['venue_id'] == poi]['longitude'].iloc[0]
-                    ) if poi in self.poi_df['venue_id'].values else float('inf'))
-                    '''
-
-            next_poi = candidates[0]
+            next_poi = neighbors[available[0]]
 
-            recommendations.append(next_poi)
-            visited_pois.add(next_poi)
+            recommendations.append(self.vocabulary.poi_ids[next_poi])
+            excluded[next_poi] = True
             current_poi = next_poi
+            self._record_step(step_started, stop - start)
 
         return recommendations
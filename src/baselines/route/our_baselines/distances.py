@@ -0,0 +1,504 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import utils as ut
+
+# Same Earth radius (in km) used by utils.haversine
+EARTH_RADIUS_KM = 6371.0
+
+# Every entry returned by pairwise_haversine satisfies
+#   |d - utils.haversine(...)| <= DISTANCE_RTOL * utils.haversine(...) + DISTANCE_ATOL_KM
+# The trigonometry follows utils.haversine in float64 and only the stored result is rounded to
+# float32 (relative rounding error 2**-24), so both bounds are loose upper limits. The rounding
+# does merge distinct distances into exact ties (and NumPy's arcsin may differ from the C
+# library's by an ulp), so in the HAVERSINE mode the recommenders re-check the POIs within
+# tie_bound of a minimum with haversine_pairs before breaking ties.
+DISTANCE_RTOL = 1e-6
+DISTANCE_ATOL_KM = 1e-9
+
+DEFAULT_BLOCK_SIZE = 2048
+
+# Bump when the on-disk layout of the distance cache changes
+CACHE_FORMAT_VERSION = 2
+
+# Distance modes: exact haversine, or Euclidean distances between the POIs projected once to
+# float32 metres (see Projection for the error bound)
+HAVERSINE = "haversine"
+PROJECTED = "projected"
+DISTANCE_MODES = (PROJECTED, HAVERSINE)
+
+# Mode used by the distance caches, the sparse distance graph and the vocabulary distances (see set_distance_mode)
+distance_mode = PROJECTED
+
+
+def set_distance_mode(mode: str):
+    """
+    Sets the distance mode of every distance computed from now on (PROJECTED or HAVERSINE).
+
+    Raises:
+    - ValueError: If the mode is unknown.
+    """
+    global distance_mode
+    if mode not in DISTANCE_MODES:
+        raise ValueError(f"Unknown distance mode {mode}, expected one of {DISTANCE_MODES}")
+    distance_mode = mode
+
+
+class Projection:
+    """
+    Equirectangular projection of a set of points to float32 metres, centred on their bounding box.
+
+    x = R * cos(lat0) * (lon - lon0) and y = R * (lat - lat0) (in radians), where (lat0, lon0) is
+    the centre of the bounding box, so distances are plain Euclidean norms. For two points of the
+    set the Euclidean distance d_p and the haversine distance d satisfy
+
+      |d_p - d| <= rtol * d + atol_km
+
+    with rtol = max |cos(lat0) / cos(lat) - 1| over the latitudes of the bounding box (the error of
+    the fixed east-west scale) plus (extent / R) ** 2 (the curvature over the bounding box diagonal
+    extent), and atol_km covering the float32 rounding of the centred coordinates. For a city
+    40 km across at 40 degrees of latitude, rtol is about 0.3%.
+    """
+    def __init__(self, latitudes, longitudes):
+        """
+        Parameters:
+        - latitudes: array-like, latitudes in degrees of the points (with valid coordinates) to project.
+        - longitudes: array-like, longitudes in degrees.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if len(latitudes) == 0:
+            latitudes = longitudes = np.zeros(1)
+
+        self.origin_latitude = (latitudes.min() + latitudes.max()) / 2
+        self.origin_longitude = (longitudes.min() + longitudes.max()) / 2
+        self.scale = np.cos(np.radians(self.origin_latitude))
+
+        # Cosine over the latitude band: extreme at its edges, or 1 at the equator if it crosses it
+        edges = np.cos(np.radians([latitudes.min(), latitudes.max()]))
+        if latitudes.min() < 0 < latitudes.max():
+            edges = np.append(edges, 1.0)
+        extent_km = EARTH_RADIUS_KM * np.hypot(np.radians(np.ptp(latitudes)), self.scale * np.radians(np.ptp(longitudes)))
+        self.rtol = float(np.max(np.abs(self.scale / edges - 1)) + (extent_km / EARTH_RADIUS_KM) ** 2)
+        self.atol_km = float(extent_km * 2 ** -20)
+
+    def project(self, latitudes, longitudes) -> tuple:
+        """
+        Returns the (x, y) float32 coordinates in metres of several points.
+        """
+        metres_per_radian = EARTH_RADIUS_KM * 1000
+        x = metres_per_radian * self.scale * np.radians(np.asarray(longitudes, dtype=np.float64) - self.origin_longitude)
+        y = metres_per_radian * np.radians(np.asarray(latitudes, dtype=np.float64) - self.origin_latitude)
+        return x.astype(np.float32), y.astype(np.float32)
+
+    def unproject(self, x, y) -> tuple:
+        """
+        Returns the (latitude, longitude) in degrees of projected points.
+        """
+        metres_per_radian = EARTH_RADIUS_KM * 1000
+        latitudes = self.origin_latitude + np.degrees(np.asarray(y, dtype=np.float64) / metres_per_radian)
+        longitudes = self.origin_longitude + np.degrees(np.asarray(x, dtype=np.float64) / (metres_per_radian * self.scale))
+        return latitudes, longitudes
+
+
+def distance_tolerance(latitudes, longitudes) -> tuple:
+    """
+    Returns the (rtol, atol_km) bound of the distances between the given points in the current mode,
+    relative to their haversine distances.
+    """
+    if distance_mode == PROJECTED:
+        projection = Projection(latitudes, longitudes)
+        return max(projection.rtol, DISTANCE_RTOL), max(projection.atol_km, DISTANCE_ATOL_KM)
+    return DISTANCE_RTOL, DISTANCE_ATOL_KM
+
+
+def valid_coordinates_mask(poi_df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns a boolean mask of the POIs with valid coordinates (not -1, -1).
+
+    Parameters:
+    - poi_df: pd.DataFrame, DataFrame with 'latitude' and 'longitude' columns.
+
+    Returns:
+    - np.ndarray: Boolean array aligned with the rows of poi_df.
+    """
+    return ((poi_df['latitude'] != -1) & (poi_df['longitude'] != -1)).to_numpy()
+
+
+def haversine_from(latitude: float, longitude: float, latitudes, longitudes) -> np.ndarray:
+    """
+    Computes the haversine distances (in km) from one point to several points.
+
+    The operations follow utils.haversine, so the results match it to the last few ulps.
+
+    Parameters:
+    - latitude: float, latitude of the origin in degrees.
+    - longitude: float, longitude of the origin in degrees.
+    - latitudes: array-like, latitudes of the destinations in degrees.
+    - longitudes: array-like, longitudes of the destinations in degrees.
+
+    Returns:
+    - np.ndarray: float64 distances, aligned with the destinations.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    d_lat = (latitudes - latitude) * np.pi / 180.0
+    d_lon = (longitudes - longitude) * np.pi / 180.0
+    a = np.sin(d_lat / 2) ** 2 + np.sin(d_lon / 2) ** 2 * np.cos(latitude * np.pi / 180.0) * np.cos(latitudes * np.pi / 180.0)
+    return EARTH_RADIUS_KM * (2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))))
+
+
+def haversine_pairs(latitudes, longitudes, first, second) -> np.ndarray:
+    """
+    Computes the haversine distances (in km) from POIs first to POIs second with utils.haversine itself.
+
+    The results are bit-identical to the per-pair loops the distance caches replaced, which the
+    vectorised functions only match to the last ulp. It costs one Python call per pair, so it is meant
+    for re-checking small groups of tied POIs.
+
+    Parameters:
+    - latitudes: array-like, latitudes of the POIs in degrees.
+    - longitudes: array-like, longitudes of the POIs in degrees.
+    - first: array-like, positions of the origins in latitudes/longitudes.
+    - second: array-like, positions of the destinations, aligned with first.
+
+    Returns:
+    - np.ndarray: float64 distances, aligned with first and second.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    first, second = np.asarray(first), np.asarray(second)
+    return np.fromiter(
+        map(ut.haversine, latitudes[first].tolist(), longitudes[first].tolist(), latitudes[second].tolist(), longitudes[second].tolist()),
+        dtype=np.float64, count=len(first)
+    )
+
+
+def tie_bound(min_distance: float, rtol: float = DISTANCE_RTOL, atol_km: float = DISTANCE_ATOL_KM) -> float:
+    """
+    Returns the largest stored distance of a POI that may be as close as the POI stored at min_distance,
+    for stored distances within rtol * d + atol_km of the exact distances d.
+    """
+    return (float(min_distance) + atol_km) / (1 - rtol) * (1 + rtol) + atol_km
+
+
+def haversine_blocks(latitudes, longitudes, block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Yields the rows of the all-pairs haversine distance matrix (in km), block_size rows at a time.
+
+    Parameters:
+    - latitudes: array-like, latitudes in degrees.
+    - longitudes: array-like, longitudes in degrees.
+    - block_size: int, number of rows computed at once.
+
+    Yields:
+    - tuple: (start, stop, block), where block is the float64 (stop - start, n) slice of the matrix.
+      Element (i, j) follows the operations of utils.haversine from POI i to POI j.
+    """
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    cos_lat = np.cos(lat * np.pi / 180.0)
+
+    n = len(lat)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        d_lat = (lat[None, :] - lat[start:stop, None]) * np.pi / 180.0
+        d_lon = (lon[None, :] - lon[start:stop, None]) * np.pi / 180.0
+        a = np.sin(d_lat / 2) ** 2 + np.sin(d_lon / 2) ** 2 * cos_lat[start:stop, None] * cos_lat[None, :]
+        # Rounding can push a marginally above 1 for antipodal points
+        np.clip(a, 0.0, 1.0, out=a)
+        yield start, stop, EARTH_RADIUS_KM * (2 * np.arcsin(np.sqrt(a)))
+
+
+def projected_blocks(latitudes, longitudes, block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Yields the rows of the all-pairs projected distance matrix (in km), block_size rows at a time.
+
+    The points are projected once (see Projection) and every block is a float32 Euclidean norm.
+
+    Yields:
+    - tuple: (start, stop, block), where block is the float32 (stop - start, n) slice of the matrix.
+    """
+    x, y = Projection(latitudes, longitudes).project(latitudes, longitudes)
+
+    n = len(x)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = np.hypot(x[None, :] - x[start:stop, None], y[None, :] - y[start:stop, None])
+        block *= np.float32(1e-3)
+        yield start, stop, block
+
+
+def distance_blocks(latitudes, longitudes, block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Yields the rows of the all-pairs distance matrix (in km) in the current distance mode, block_size rows at a time.
+    """
+    if distance_mode == PROJECTED:
+        return projected_blocks(latitudes, longitudes, block_size)
+    return haversine_blocks(latitudes, longitudes, block_size)
+
+
+def pairwise_distances(latitudes, longitudes, block_size: int = DEFAULT_BLOCK_SIZE, dtype=np.float32, out: np.ndarray = None) -> np.ndarray:
+    """
+    Computes the all-pairs distance matrix (in km) in the current distance mode, as pairwise_haversine.
+    """
+    n = len(latitudes)
+    distance_matrix = np.empty((n, n), dtype=dtype) if out is None else out
+
+    for start, stop, block in distance_blocks(latitudes, longitudes, block_size):
+        distance_matrix[start:stop] = block
+
+    return distance_matrix
+
+
+def pairwise_haversine(latitudes, longitudes, block_size: int = DEFAULT_BLOCK_SIZE, dtype=np.float32, out: np.ndarray = None) -> np.ndarray:
+    """
+    Computes the all-pairs haversine distance matrix (in km) with NumPy broadcasting.
+
+    The matrix is filled in blocks of block_size rows, so the float64 temporaries never
+    exceed block_size x n elements regardless of the number of POIs.
+
+    Parameters:
+    - latitudes: array-like, latitudes in degrees.
+    - longitudes: array-like, longitudes in degrees.
+    - block_size: int, number of rows computed at once.
+    - dtype: NumPy dtype of the returned matrix.
+    - out: np.ndarray, optional (n, n) array (e.g. a np.memmap) to write the distances into.
+
+    Returns:
+    - np.ndarray: A symmetric (n, n) matrix where element (i, j) is the distance between POI i and POI j.
+    """
+    n = len(latitudes)
+    distance_matrix = np.empty((n, n), dtype=dtype) if out is None else out
+
+    for start, stop, block in haversine_blocks(latitudes, longitudes, block_size):
+        distance_matrix[start:stop] = block
+
+    return distance_matrix
+
+
+def sparse_distance_graph(latitudes, longitudes, k: int = None, radius: float = None, block_size: int = DEFAULT_BLOCK_SIZE) -> tuple:
+    """
+    Builds a sparse graph linking every POI to its k nearest POIs and/or the POIs within a radius.
+
+    Only pairs at a positive distance (in the current distance mode) are linked. The full distance
+    matrix is never held in memory: rows are computed and pruned block by block.
+
+    In the HAVERSINE mode the distances of the links and the bounds are those of utils.haversine,
+    evaluated from the POI in the lower position (as the original per-pair loop did), so they are
+    bit-identical to it; this costs one Python call per link.
+
+    Parameters:
+    - latitudes: array-like, latitudes in degrees.
+    - longitudes: array-like, longitudes in degrees.
+    - k: int, maximum number of neighbours per POI (None keeps every neighbour).
+    - radius: float, maximum distance in km (None for no limit).
+    - block_size: int, number of rows computed at once.
+
+    Returns:
+    - tuple: (graph, min_distance, max_distance), where graph is a (n, n) float64 sparse.csr_matrix
+      of distances, and min_distance/max_distance are the smallest and largest positive distances
+      over all pairs (including the pruned ones), or None if there are none.
+    """
+    n = len(latitudes)
+    if n == 0:
+        return sparse.csr_matrix((0, 0)), None, None
+
+    exact = distance_mode == HAVERSINE
+    rows, cols, values = [], [], []
+    min_distance, max_distance = np.inf, -np.inf
+    # Pairs whose exact distance may be the minimum or the maximum (HAVERSINE mode)
+    bound_rows, bound_cols = [], []
+
+    for start, stop, block in distance_blocks(latitudes, longitudes, block_size):
+        positive = block > 0
+        if positive.any():
+            min_distance = min(min_distance, block[positive].min())
+            max_distance = max(max_distance, block[positive].max())
+            if exact:
+                max_bound = (max_distance - DISTANCE_ATOL_KM) / (1 + DISTANCE_RTOL) * (1 - DISTANCE_RTOL) - DISTANCE_ATOL_KM
+                near_bounds = positive & ((block <= tie_bound(min_distance)) | (block >= max_bound))
+                block_rows, block_cols = np.nonzero(near_bounds)
+                bound_rows.append(block_rows + start)
+                bound_cols.append(block_cols)
+
+        block[~positive] = np.inf
+        if radius is not None:
+            block[block > radius] = np.inf
+
+        if k is not None and k < n:
+            kept = np.argpartition(block, k - 1, axis=1)[:, :k]
+        else:
+            kept = np.broadcast_to(np.arange(n), block.shape)
+        kept_distances = np.take_along_axis(block, kept, axis=1)
+        linked = np.isfinite(kept_distances)
+
+        rows.append(np.broadcast_to(np.arange(start, stop)[:, None], kept.shape)[linked])
+        cols.append(kept[linked])
+        values.append(kept_distances[linked])
+
+    rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+    if exact:
+        values = haversine_pairs(latitudes, longitudes, np.minimum(rows, cols), np.maximum(rows, cols))
+    graph = sparse.csr_matrix((values, (rows, cols)), shape=(n, n))
+    graph.sort_indices()
+
+    if not np.isfinite(min_distance):
+        return graph, None, None
+    if exact:
+        bound_rows, bound_cols = np.concatenate(bound_rows), np.concatenate(bound_cols)
+        bounds = haversine_pairs(latitudes, longitudes, np.minimum(bound_rows, bound_cols), np.maximum(bound_rows, bound_cols))
+        bounds = bounds[bounds > 0]
+        if len(bounds) == 0:
+            return graph, None, None
+        return graph, float(bounds.min()), float(bounds.max())
+    return graph, float(min_distance), float(max_distance)
+
+
+def calculate_distance_cache(poi_df: pd.DataFrame, block_size: int = DEFAULT_BLOCK_SIZE) -> pd.DataFrame:
+    """
+    Precomputes a distance matrix for all POIs with valid coordinates, in the current distance mode.
+
+    Parameters:
+    - poi_df: pd.DataFrame, DataFrame with 'venue_id', 'latitude' and 'longitude' columns.
+    - block_size: int, number of rows computed at once.
+
+    Returns:
+    - pd.DataFrame: A DataFrame where element (i, j) represents the distance between POI i and POI j.
+    """
+    valid_pois = poi_df[valid_coordinates_mask(poi_df)]
+    poi_ids = valid_pois['venue_id'].values
+
+    distance_matrix = pairwise_distances(valid_pois['latitude'].values, valid_pois['longitude'].values, block_size)
+
+    return pd.DataFrame(distance_matrix, index=poi_ids, columns=poi_ids)
+
+
+def file_content_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Computes a SHA-1 digest of the content of a file.
+
+    Parameters:
+    - file_path: str, path to the file.
+    - chunk_size: int, number of bytes read at once.
+
+    Returns:
+    - str: Hexadecimal digest of the file content.
+    """
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_paths(cache_dir: str, key: str) -> tuple:
+    prefix = os.path.join(cache_dir, f"distances_v{CACHE_FORMAT_VERSION}_{distance_mode}_{key}")
+    return prefix + ".f32", prefix + ".poi_ids.npy"
+
+
+def _open_distance_memmap(matrix_path: str, ids_path: str):
+    """
+    Maps a stored distance matrix read-only, or returns None if it is missing or incomplete.
+    """
+    if not (os.path.exists(matrix_path) and os.path.exists(ids_path)):
+        return None
+
+    poi_ids = np.load(ids_path, allow_pickle=False)
+    n = len(poi_ids)
+    if os.path.getsize(matrix_path) != n * n * np.dtype(np.float32).itemsize:
+        return None
+
+    if n == 0:
+        return pd.DataFrame(np.zeros((0, 0), dtype=np.float32), index=poi_ids, columns=poi_ids)
+
+    distance_matrix = np.memmap(matrix_path, dtype=np.float32, mode='r', shape=(n, n))
+    return pd.DataFrame(distance_matrix, index=poi_ids, columns=poi_ids, copy=False)
+
+
+def load_distance_cache(feat_file: str, poi_df: pd.DataFrame, cache_dir: str, block_size: int = DEFAULT_BLOCK_SIZE) -> pd.DataFrame:
+    """
+    Returns the distance cache of the POIs in feat_file, backed by a read-only np.memmap.
+
+    The matrix is stored in cache_dir as a packed float32 file plus a sidecar with the
+    venue ids of its rows, keyed by the distance mode and the content hash of feat_file. If no stored matrix
+    exists it is computed once and written atomically, so later and concurrent runs
+    map the same file (and share its pages) instead of recomputing it.
+
+    Parameters:
+    - feat_file: str, path to the POI feature file poi_df was read from.
+    - poi_df: pd.DataFrame, DataFrame with 'venue_id', 'latitude' and 'longitude' columns.
+    - cache_dir: str, directory where the distance matrices are stored.
+    - block_size: int, number of rows computed at once.
+
+    Returns:
+    - pd.DataFrame: A DataFrame where element (i, j) represents the distance between POI i and POI j.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    matrix_path, ids_path = _cache_paths(cache_dir, file_content_hash(feat_file))
+
+    distance_cache = _open_distance_memmap(matrix_path, ids_path)
+    if distance_cache is not None:
+        return distance_cache
+
+    valid_pois = poi_df[valid_coordinates_mask(poi_df)]
+    poi_ids = valid_pois['venue_id'].to_numpy()
+    n = len(poi_ids)
+
+    # Write under process-unique names and rename, so readers never see a partial file
+    suffix = f".tmp{os.getpid()}"
+    with open(ids_path + suffix, 'wb') as f:
+        np.save(f, poi_ids, allow_pickle=False)
+
+    if n > 0:
+        out = np.memmap(matrix_path + suffix, dtype=np.float32, mode='w+', shape=(n, n))
+        pairwise_distances(valid_pois['latitude'].values, valid_pois['longitude'].values, block_size, out=out)
+        out.flush()
+        del out
+    else:
+        open(matrix_path + suffix, 'wb').close()
+
+    os.replace(ids_path + suffix, ids_path)
+    os.replace(matrix_path + suffix, matrix_path)
+
+    return _open_distance_memmap(matrix_path, ids_path)
+
+
+def nearest_neighbours(distance_matrix: np.ndarray, k: int, block_size: int = DEFAULT_BLOCK_SIZE) -> tuple:
+    """
+    Precomputes, for every row of a distance matrix, its k closest columns sorted nearest-first.
+
+    Rows are sorted by (distance, column index), so POIs at the same distance keep the
+    order of the matrix columns. Every column strictly closer than the last listed
+    distance is guaranteed to be in the list; columns tied with the last listed distance
+    may have been cut off, so callers needing every tie at that distance must fall back
+    to the full row.
+
+    Parameters:
+    - distance_matrix: np.ndarray, (n, n) distance matrix (may be a np.memmap).
+    - k: int, number of neighbours kept per row (capped at n).
+    - block_size: int, number of rows processed at once.
+
+    Returns:
+    - tuple: (indices, distances), two (n, k) arrays of int32 column indices and their distances.
+    """
+    n = distance_matrix.shape[0]
+    k = min(k, n)
+    indices = np.empty((n, k), dtype=np.int32)
+    distances = np.empty((n, k), dtype=distance_matrix.dtype)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = np.asarray(distance_matrix[start:stop])
+        if k < n:
+            part = np.argpartition(block, k - 1, axis=1)[:, :k]
+        else:
+            part = np.broadcast_to(np.arange(n), block.shape)
+        part_distances = np.take_along_axis(block, part, axis=1)
+        order = np.lexsort((part, part_distances), axis=-1)
+        indices[start:stop] = np.take_along_axis(part, order, axis=1)
+        distances[start:stop] = np.take_along_axis(part_distances, order, axis=1)
+
+    return indices, distances
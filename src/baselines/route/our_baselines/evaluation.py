@@ -0,0 +1,368 @@
+import argparse
+import glob
+import multiprocessing as mp
+import os
+from typing import List
+import numpy as np
+import pandas as pd
+import distances as dist
+
+# Cutoffs of the route evaluation (as in the evaluation scripts)
+DEFAULT_CUTOFFS = [5, 10, 20]
+
+# Codes of the padding of the route matrices (never equal to each other nor to a POI code)
+NO_POI = -1
+NO_TEST_POI = -2
+
+
+def precision_at(hits: np.ndarray, k: int) -> np.ndarray:
+    """
+    Precision of every route at cutoff k: relevant POIs among the first k, divided by k.
+
+    The denominator is k even for routes shorter than k (their missing positions count as misses),
+    as precision in Utils/metrics.py gives over a list of k recommendations.
+
+    Parameters:
+    - hits: np.ndarray, (n_users x max_cutoff) boolean matrix of the relevant positions of each route.
+    - k: int, the cutoff.
+    """
+    return hits[:, :k].sum(axis=1) / k
+
+
+def recall_at(hits: np.ndarray, n_relevant: np.ndarray, k: int) -> np.ndarray:
+    """
+    Recall of every route at cutoff k: relevant POIs among the first k, divided by the relevant POIs of the user.
+
+    The denominator is max(n_relevant, 1): a user without relevant POIs has no hits and gets 0 instead of
+    a division by zero (test users always have one, so this only guards other inputs).
+    """
+    return hits[:, :k].sum(axis=1) / np.maximum(n_relevant, 1)
+
+
+def ndcg_at(hits: np.ndarray, n_relevant: np.ndarray, k: int) -> np.ndarray:
+    """
+    Binary nDCG of every route at cutoff k (the ideal ranking places min(n_relevant, k) relevant POIs first).
+
+    The ideal DCG is cut at k, as in RankSys. ndcg in Utils/metrics.py does not cut it (it places all
+    the relevant POIs), so its values are lower for users with more than k relevant POIs.
+    """
+    discounts = 1 / np.log2(np.arange(k) + 2)
+    # Users without relevant POIs have no hits: any positive ideal DCG gives them 0
+    ideal = np.concatenate([[1.0], np.cumsum(discounts)])[np.minimum(n_relevant, k)]
+    return (hits[:, :k] * discounts).sum(axis=1) / ideal
+
+
+def ordered_pair_counts(test_positions: np.ndarray) -> np.ndarray:
+    """
+    Counts the pairs of recommended POIs that keep the order of the test route.
+
+    Parameters:
+    - test_positions: np.ndarray, (n_users x max_cutoff) position of each recommended POI in the test
+      route of the user (-1 if it is not in it).
+
+    Returns:
+    - np.ndarray: (n_users x max_cutoff) matrix whose column k - 1 holds the number of pairs i < j < k
+      of recommended POIs, both in the test route, with the POI i before the POI j in the test route.
+    """
+    earlier, later = test_positions[:, :, None], test_positions[:, None, :]
+    in_order = (earlier >= 0) & (earlier < later) & np.triu(np.ones((test_positions.shape[1],) * 2, dtype=bool), 1)
+    return np.cumsum(in_order.sum(axis=1), axis=1)
+
+
+def pairs_f1(n_ordered: np.ndarray, route_lengths: np.ndarray, test_lengths: np.ndarray) -> np.ndarray:
+    """
+    Pairs-F1 of every route: harmonic mean of the fractions of the ordered POI pairs of the recommended
+    and of the test route that appear in the same order in both (0 when no pair does).
+
+    Parameters:
+    - n_ordered: np.ndarray, number of pairs in the same order in both routes (see ordered_pair_counts).
+    - route_lengths: np.ndarray, number of POIs of each recommended route.
+    - test_lengths: np.ndarray, number of distinct POIs of each test route.
+    """
+    route_pairs = route_lengths * (route_lengths - 1) / 2
+    test_pairs = test_lengths * (test_lengths - 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pair_precision = n_ordered / route_pairs
+        pair_recall = n_ordered / test_pairs
+        f1 = 2 * pair_precision * pair_recall / (pair_precision + pair_recall)
+    return np.where(n_ordered > 0, f1, 0.0)
+
+
+def edit_distances(routes: np.ndarray, test_routes: np.ndarray, test_lengths: np.ndarray) -> np.ndarray:
+    """
+    Levenshtein distances between every prefix of the recommended routes and the test routes.
+
+    The dynamic programme runs one row (recommended position) at a time for all the users at once;
+    within a row, the insertion chain is solved with a cumulative minimum instead of a loop.
+
+    Parameters:
+    - routes: np.ndarray, (n_users x max_cutoff) POI codes of the recommended routes.
+    - test_routes: np.ndarray, (n_users x max_test_length) POI codes of the test routes (NO_TEST_POI padded).
+    - test_lengths: np.ndarray, number of POIs of each test route.
+
+    Returns:
+    - np.ndarray: (n_users x (max_cutoff + 1)) matrix whose column i holds the edit distance between the
+      first i recommended POIs and the test route.
+    """
+    n_users, max_cutoff = routes.shape
+    columns = np.arange(test_routes.shape[1] + 1)
+    users = np.arange(n_users)
+    distances = np.empty((n_users, max_cutoff + 1), dtype=np.int64)
+
+    row = np.tile(columns, (n_users, 1))
+    distances[:, 0] = test_lengths
+    for i in range(1, max_cutoff + 1):
+        # Deletion (from the row above) and substitution; insertions follow from the cumulative minimum
+        best = np.empty_like(row)
+        best[:, 0] = i
+        best[:, 1:] = np.minimum(row[:, 1:] + 1, row[:, :-1] + (routes[:, i - 1, None] != test_routes))
+        row = columns + np.minimum.accumulate(best - columns, axis=1)
+        distances[:, i] = row[users, test_lengths]
+    return distances
+
+
+class RouteEvaluator:
+    """
+    Scores recommended routes against the test trails of a city.
+
+    The test trails are loaded once. The test route of a user is the sequence of the distinct POIs of
+    all the user's test visits in timestamp order; its POIs are the relevant items (every test visit
+    counts as relevant, as with an evaluation threshold of 1). For each cutoff k the routes are scored with:
+    - P@k, R@k and NDCG@k: set-based ranking metrics over the first k POIs of the route.
+    - PairsF1@k: F1 of the POI pairs of the first k POIs that keep the order of the test route.
+    - ED@k: edit distance between the first k POIs of the route and the test route.
+    - RouteKm@k: length in km of the first k POIs of the route, skipping legs without coordinates.
+    Every metric is averaged over the users of the test file. A user without a route is scored as an
+    empty route, so it counts as 0 in P, R, NDCG, PairsF1 and RouteKm and its ED is its test route length.
+    """
+    def __init__(self, test_df: pd.DataFrame, poi_df: pd.DataFrame, cutoffs: List[int] = DEFAULT_CUTOFFS, distance_cache: pd.DataFrame = None):
+        """
+        Parameters:
+        - test_df: pd.DataFrame, test trails with 'user_id', 'venue_id' and 'timestamp' columns.
+        - poi_df: pd.DataFrame, POIs with 'venue_id', 'latitude' and 'longitude' columns.
+        - cutoffs: List[int], cutoffs of the metrics.
+        - distance_cache: pd.DataFrame, distance cache for the route lengths (haversine from poi_df if None).
+        """
+        self.cutoffs = sorted(set(cutoffs))
+        self.max_cutoff = self.cutoffs[-1]
+        self.poi_ids = pd.Index(pd.unique(np.concatenate([poi_df['venue_id'].to_numpy(), test_df['venue_id'].to_numpy()])))
+        n_pois = len(self.poi_ids)
+
+        # Coordinates by POI code, or positions in the distance cache
+        valid = dist.valid_coordinates_mask(poi_df)
+        located = self.poi_ids.get_indexer(poi_df['venue_id'])[valid]
+        self.has_coordinates = np.zeros(n_pois, dtype=bool)
+        self.has_coordinates[located] = True
+        self.latitude, self.longitude = np.zeros(n_pois), np.zeros(n_pois)
+        self.latitude[located] = poi_df['latitude'].to_numpy()[valid]
+        self.longitude[located] = poi_df['longitude'].to_numpy()[valid]
+        self.distance_matrix = None
+        if distance_cache is not None:
+            self.distance_matrix = distance_cache.to_numpy()
+            self.cache_positions = distance_cache.index.get_indexer(self.poi_ids)
+            self.has_coordinates = self.cache_positions >= 0
+
+        # Test routes: visits of each user in timestamp order, keeping the first visit of every POI
+        user_codes, self.users = pd.factorize(test_df['user_id'])
+        poi_codes = self.poi_ids.get_indexer(test_df['venue_id'])
+        order = np.lexsort((np.arange(len(test_df)), test_df['timestamp'].to_numpy(), user_codes))
+        user_codes, poi_codes = user_codes[order], poi_codes[order]
+        keys = user_codes.astype(np.int64) * n_pois + poi_codes
+        _, first = np.unique(keys, return_index=True)
+        first = np.sort(first)
+        user_codes, poi_codes, keys = user_codes[first], poi_codes[first], keys[first]
+
+        n_users = len(self.users)
+        self.test_lengths = np.bincount(user_codes, minlength=n_users)
+        ranks = np.arange(len(user_codes)) - (np.cumsum(self.test_lengths) - self.test_lengths)[user_codes]
+        self.test_routes = np.full((n_users, self.test_lengths.max(initial=0)), NO_TEST_POI, dtype=np.int64)
+        self.test_routes[user_codes, ranks] = poi_codes
+
+        # Relevant (user, POI) keys, sorted, with the position of the POI in the test route
+        order = np.argsort(keys)
+        self.relevant_keys, self.relevant_positions = keys[order], ranks[order]
+
+    def metric_names(self) -> List[str]:
+        return [f"{metric}@{k}" for metric in ["P", "R", "NDCG", "PairsF1", "ED", "RouteKm"] for k in self.cutoffs]
+
+    def _leg_lengths(self, routes: np.ndarray, route_lengths: np.ndarray) -> np.ndarray:
+        """
+        Returns the (n_users x max_cutoff - 1) distances in km between consecutive POIs of the routes
+        (0 beyond the end of a route or when a POI has no coordinates).
+        """
+        origins, destinations = routes[:, :-1], routes[:, 1:]
+        legs = np.zeros(origins.shape)
+        valid = (np.arange(1, routes.shape[1]) < route_lengths[:, None]) & (origins >= 0) & (destinations >= 0)
+        valid[valid] = self.has_coordinates[origins[valid]] & self.has_coordinates[destinations[valid]]
+        origins, destinations = origins[valid], destinations[valid]
+        if self.distance_matrix is not None:
+            legs[valid] = self.distance_matrix[self.cache_positions[origins], self.cache_positions[destinations]]
+        else:
+            legs[valid] = dist.haversine_from(self.latitude[origins], self.longitude[origins], self.latitude[destinations], self.longitude[destinations])
+        return legs
+
+    def _score(self, user_codes: np.ndarray, poi_codes: np.ndarray, ranks: np.ndarray) -> dict:
+        """
+        Scores routes given as aligned arrays of test user codes (-1 for users not in the test file),
+        POI codes (-1 for unknown POIs) and positions within the route.
+        """
+        n_users, n_pois = len(self.users), len(self.poi_ids)
+        keep = (user_codes >= 0) & (ranks < self.max_cutoff)
+        user_codes, poi_codes, ranks = user_codes[keep], poi_codes[keep], ranks[keep]
+
+        routes = np.full((n_users, self.max_cutoff), NO_POI, dtype=np.int64)
+        routes[user_codes, ranks] = poi_codes
+        route_lengths = np.bincount(user_codes, minlength=n_users)
+
+        # Position of every recommended POI in the test route of the user (-1 if it is not relevant)
+        keys = user_codes.astype(np.int64) * n_pois + poi_codes
+        found = np.searchsorted(self.relevant_keys, keys)
+        found_valid = (poi_codes >= 0) & (found < len(self.relevant_keys))
+        found_valid[found_valid] = self.relevant_keys[found[found_valid]] == keys[found_valid]
+        test_positions = np.full((n_users, self.max_cutoff), -1, dtype=np.int64)
+        test_positions[user_codes[found_valid], ranks[found_valid]] = self.relevant_positions[found[found_valid]]
+        hits = test_positions >= 0
+
+        n_ordered = ordered_pair_counts(test_positions)
+        edits = edit_distances(routes, self.test_routes, self.test_lengths)
+        route_km = np.cumsum(self._leg_lengths(routes, route_lengths), axis=1)
+
+        scores = {}
+        for metric, values in [
+            ("P", lambda k: precision_at(hits, k)),
+            ("R", lambda k: recall_at(hits, self.test_lengths, k)),
+            ("NDCG", lambda k: ndcg_at(hits, self.test_lengths, k)),
+            ("PairsF1", lambda k: pairs_f1(n_ordered[:, k - 1], np.minimum(route_lengths, k), self.test_lengths)),
+            ("ED", lambda k: edits[np.arange(n_users), np.minimum(route_lengths, k)]),
+            ("RouteKm", lambda k: route_km[:, k - 2] if k > 1 else np.zeros(n_users))
+        ]:
+            for k in self.cutoffs:
+                scores[f"{metric}@{k}"] = float(values(k).mean()) if n_users else 0.0
+        scores["Users"] = n_users
+        scores["UsersWithRoutes"] = int(np.count_nonzero(route_lengths))
+        return scores
+
+    def evaluate(self, users: list, routes: List[List[int]]) -> dict:
+        """
+        Scores routes held in memory (as returned by recommend_batch).
+
+        Parameters:
+        - users: list, the user ID of each route.
+        - routes: List[List[int]], the recommended POI IDs of each user, in route order.
+
+        Returns:
+        - dict: The value of every metric (see metric_names), plus the number of test users and of users with a route.
+        """
+        lengths = np.array([len(route) for route in routes], dtype=np.int64)
+        user_codes = np.repeat(self.users.get_indexer(pd.Index(users)), lengths)
+        pois = [poi for route in routes for poi in route]
+        poi_codes = self.poi_ids.get_indexer(pd.Index(pois)) if pois else np.zeros(0, dtype=np.int64)
+        ranks = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self._score(user_codes, poi_codes, ranks)
+
+    def evaluate_file(self, rec_file: str) -> dict:
+        """
+        Scores a recommendation file written by main.py (user, POI and score per line, routes in order).
+        """
+        if os.path.getsize(rec_file) == 0:
+            return self.evaluate([], [])
+        recs = pd.read_csv(rec_file, header=None, names=["user_id", "venue_id", "score"], sep="\t")
+        user_codes = self.users.get_indexer(recs['user_id'])
+        poi_codes = self.poi_ids.get_indexer(recs['venue_id'])
+        ranks = recs.groupby('user_id', sort=False).cumcount().to_numpy()
+        return self._score(user_codes, poi_codes, ranks)
+
+
+def write_results(file_path: str, results: dict):
+    with open(file_path, 'w') as f:
+        for metric, value in results.items():
+            f.write(f"{metric}\t{value}\n")
+
+
+_worker_evaluator = None
+
+
+def _init_worker(evaluator: RouteEvaluator):
+    global _worker_evaluator
+    _worker_evaluator = evaluator
+
+
+def _evaluate_file(rec_file: str) -> dict:
+    return _worker_evaluator.evaluate_file(rec_file)
+
+
+def evaluate_files(evaluator: RouteEvaluator, rec_files: List[str], workers: int = 1) -> List[dict]:
+    """
+    Scores several recommendation files, over a process pool if workers > 1.
+
+    Workers are forked when the platform allows it, so they inherit the loaded test routes.
+
+    Parameters:
+    - evaluator: RouteEvaluator, evaluator with the test trails loaded.
+    - rec_files: List[str], the recommendation files.
+    - workers: int, number of worker processes.
+
+    Returns:
+    - List[dict]: The results of each file, in the order of rec_files.
+    """
+    if workers <= 1 or len(rec_files) <= 1:
+        return [evaluator.evaluate_file(rec_file) for rec_file in rec_files]
+
+    context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else mp.get_context()
+    with context.Pool(min(workers, len(rec_files)), initializer=_init_worker, initargs=(evaluator,)) as pool:
+        return pool.map(_evaluate_file, rec_files, chunksize=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate route recommendation files against the test trails of a city.")
+    parser.add_argument("--test_file", type=str, help="Path to the test file.", default="NewYork_mapped_trails_weather2_minroutes_4_minPOIs_TestRouteTest.csv")
+    parser.add_argument("--feat_file", type=str, help="Path to the feature file.", default="NewYork_mapped_lat_lon.csv")
+    parser.add_argument("--rec_files", type=str, nargs="*", default=[], help="Recommendation files to evaluate.")
+    parser.add_argument("--rec_dir", type=str, default=None, help="Directory whose rec_* files are evaluated (in addition to --rec_files).")
+    parser.add_argument("--cutoffs", type=int, nargs="+", default=DEFAULT_CUTOFFS, help="Cutoffs of the metrics.")
+    parser.add_argument("--distance_cache_dir", type=str, default=None, help="Directory of the stored POI distance matrix (route lengths use the haversine distance if not set).")
+    parser.add_argument("--distance_mode", type=str, default=dist.PROJECTED, choices=dist.DISTANCE_MODES, help="Distance mode of the stored POI distance matrix of --distance_cache_dir.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes evaluating files.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Directory to write one result file per recommendation file to.")
+    parser.add_argument("--prefix", type=str, default="ev", help="Prefix of the result files.")
+    parser.add_argument("--summary_file", type=str, default=None, help="Path to write a table with the results of every file to.")
+    parser.add_argument("--overwrite", action="store_true", help="Evaluate again the files whose result file already exists.")
+    args = parser.parse_args()
+    dist.set_distance_mode(args.distance_mode)
+
+    rec_files = list(args.rec_files)
+    if args.rec_dir is not None:
+        rec_files += sorted(glob.glob(os.path.join(args.rec_dir, "rec_*")))
+    cutoffs_name = "-".join(str(k) for k in sorted(set(args.cutoffs)))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def result_path(rec_file: str) -> str:
+        name = os.path.splitext(os.path.basename(rec_file))[0]
+        return os.path.join(args.output_dir, f"{args.prefix}_{name}_C{cutoffs_name}.txt")
+
+    pending = [rec_file for rec_file in dict.fromkeys(rec_files) if args.overwrite or not os.path.isfile(result_path(rec_file))]
+    print(f"Evaluating {len(pending)} of {len(rec_files)} recommendation files")
+    if not pending and args.summary_file is None:
+        return
+
+    test_headers = ["trail_id", "user_id", "venue_id", "timestamp"]
+    feat_headers = ["venue_id", "latitude", "longitude", "category_lvlFs"]
+    test_data = pd.read_csv(args.test_file, header=None, names=test_headers, sep="\t")
+    feat_data = pd.read_csv(args.feat_file, header=None, names=feat_headers, sep="\t")
+    distance_cache = dist.load_distance_cache(args.feat_file, feat_data, args.distance_cache_dir) if args.distance_cache_dir is not None else None
+
+    evaluator = RouteEvaluator(test_data, feat_data, args.cutoffs, distance_cache)
+    for rec_file, results in zip(pending, evaluate_files(evaluator, pending, args.workers)):
+        write_results(result_path(rec_file), results)
+        print(f"Results saved to {result_path(rec_file)}")
+
+    if args.summary_file is not None:
+        rows = []
+        for rec_file in dict.fromkeys(rec_files):
+            results = pd.read_csv(result_path(rec_file), header=None, names=["metric", "value"], sep="\t")
+            rows.append(pd.Series(results['value'].to_numpy(), index=results['metric'], name=os.path.basename(rec_file)))
+        pd.DataFrame(rows).to_csv(args.summary_file, sep="\t", index_label="rec_file")
+        print(f"Summary saved to {args.summary_file}")
+
+if __name__ == "__main__":
+    main()
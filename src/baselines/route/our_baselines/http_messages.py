@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+# Reason phrases of the status codes used by the route service
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+# Largest request or response body accepted
+MAX_BODY_BYTES = 1 << 20
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple:
+    """
+    Reads one HTTP/1.1 message (request or response) with a Content-Length body.
+
+    Parameters:
+    - reader: asyncio.StreamReader, the connection to read from.
+
+    Returns:
+    - tuple: (start_line, headers, body), with the header names in lower case, or None if the
+      connection was closed before a new message started.
+
+    Raises:
+    - ValueError: If the message is malformed or its body is too large.
+    """
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    if length < 0 or length > MAX_BODY_BYTES:
+        raise ValueError(f"Invalid Content-Length {length}")
+    body = await reader.readexactly(length) if length else b""
+    return start_line.decode("latin-1").strip(), headers, body
+
+
+def encode_request(method: str, path: str, payload=None, host: str = "localhost") -> bytes:
+    """
+    Encodes an HTTP/1.1 request with an optional JSON body (keeping the connection alive).
+    """
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    return head.encode("latin-1") + body
+
+
+def encode_response(status: int, payload, keep_alive: bool = True) -> bytes:
+    """
+    Encodes an HTTP/1.1 response with a JSON body.
+    """
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
@@ -1,14 +1,162 @@
+import os
+import itertools
 import pandas as pd
 import argparse
-from Recommenders import VisitFilter
+from Recommenders import BasicRouteRecommender, VisitFilter
 from ClosestNNRouteRecommender import ClosestNNRouteRecommender
 from FeatureMarkovChainRecommender import FeatureMarkovRouteRecommender
 from POIMarkovChainRecommender import MarkovRouteRecommender
 from KNNRouteRecommender import KNNRouteRecommender
 from BaselineSinglePOIRecommender import BaselineSinglePOIRecommender
 from WeightedTransitionsRouteRecommender import WeightedTransitionsRouteRecommender
-from enum import Enum
+from VariableOrderMarkovRecommender import VariableOrderMarkovRouteRecommender
 from POIMarkovChainRecommender import TieBreaker
+import distances as dist
+import parallel
+import persistence
+import profiling
+import evaluation
+import trails
+
+RECOMMENDERS = [
+    "ClosestNNRouteRecommender",
+    "MarkovRouteRecommender",
+    "FeatureMarkovRouteRecommender",
+    "KNNRouteRecommender",
+    "BaselineSinglePOIRecommender",
+    "WeightedTransitionsRouteRecommender",
+    "VariableOrderMarkovRouteRecommender"
+]
+
+RECOMMENDER_CLASSES = {
+    cls.__name__: cls for cls in [ClosestNNRouteRecommender, MarkovRouteRecommender, FeatureMarkovRouteRecommender,
+                                  KNNRouteRecommender, BaselineSinglePOIRecommender, WeightedTransitionsRouteRecommender,
+                                  VariableOrderMarkovRouteRecommender]
+}
+
+# Recomendadores que usan la matriz de distancias completa
+DISTANCE_CACHE_RECOMMENDERS = ["ClosestNNRouteRecommender", "MarkovRouteRecommender", "FeatureMarkovRouteRecommender"]
+
+
+def build_recommender(name: str, feat_data: pd.DataFrame, training_data: pd.DataFrame, args, n_neigh: int, distance_cache: pd.DataFrame):
+    """
+    Instantiates (and fits) a route recommender by name.
+    """
+    if name == "ClosestNNRouteRecommender":
+        return ClosestNNRouteRecommender(feat_data, training_data, distance_cache)
+    elif name == "MarkovRouteRecommender":
+        return MarkovRouteRecommender(feat_data, training_data, distance_cache)
+    elif name == "FeatureMarkovRouteRecommender":
+        return FeatureMarkovRouteRecommender(feat_data, training_data, "category_lvlFs", distance_cache)
+    elif name == "KNNRouteRecommender":
+        return KNNRouteRecommender(feat_data, training_data, n_neigh, pad_neighbours=args.pad_neighbours)
+    elif name == "BaselineSinglePOIRecommender":
+        return BaselineSinglePOIRecommender(feat_data, training_data)
+    elif name == "WeightedTransitionsRouteRecommender":
+        n_distance_neighbours = None if args.n_distance_neighbours < 0 else args.n_distance_neighbours
+        return WeightedTransitionsRouteRecommender(feat_data, training_data, n_distance_neighbours)
+    elif name == "VariableOrderMarkovRouteRecommender":
+        return VariableOrderMarkovRouteRecommender(feat_data, training_data, args.max_order, args.min_context_count, args.memory_budget_mb)
+    else:
+        raise ValueError(f"Unsupported recommender: {name}")
+
+
+def model_path(args, name: str, n_neigh: int, data_hash: str) -> str:
+    """
+    Returns the directory of a saved model in --model_dir, keyed by the fitting parameters and the dataset.
+    """
+    key = name
+    if name == "KNNRouteRecommender":
+        key += f"_k{n_neigh}" + ("_pad" if args.pad_neighbours else "")
+    elif name == "WeightedTransitionsRouteRecommender":
+        key += f"_nd{args.n_distance_neighbours}"
+    elif name == "VariableOrderMarkovRouteRecommender":
+        key += f"_o{args.max_order}_c{args.min_context_count}_m{args.memory_budget_mb:g}"
+    return os.path.join(args.model_dir, f"{key}_{data_hash[:16]}")
+
+
+def load_or_build_recommender(name: str, feat_data: pd.DataFrame, training_data: pd.DataFrame, args, n_neigh: int, distance_cache: pd.DataFrame, data_hash: str):
+    """
+    Loads the recommender from --model_dir if it was saved there, otherwise fits it (and saves it if --model_dir is set).
+    """
+    if args.model_dir is None:
+        return build_recommender(name, feat_data, training_data, args, n_neigh, distance_cache)
+
+    path = model_path(args, name, n_neigh, data_hash)
+    profiler = BasicRouteRecommender.profiler
+    if persistence.read_manifest(path) is not None:
+        try:
+            recommender = RECOMMENDER_CLASSES[name].load(path, feat_data, training_data, distance_cache)
+            print(f"Loaded model from {path}")
+            if profiler is not None:
+                profiler.record_cache("main.model_dir", True)
+            return recommender
+        except ValueError as e:
+            print(f"Refitting {name}: {e}")
+
+    if profiler is not None:
+        profiler.record_cache("main.model_dir", False)
+    recommender = build_recommender(name, feat_data, training_data, args, n_neigh, distance_cache)
+    recommender.save(path)
+    print(f"Model saved to {path}")
+    return recommender
+
+
+def load_or_update_recommender(name: str, feat_data: pd.DataFrame, training_data: pd.DataFrame, update_data: pd.DataFrame, args, n_neigh: int,
+                               distance_cache: pd.DataFrame, data_hash: str, updated_hash: str):
+    """
+    Returns the recommender fitted on training_data plus the trails of --update_file: recommenders that support
+    incremental updates are fitted (or loaded) on training_data and updated, the rest are fitted on all the trails.
+    """
+    all_data = pd.concat([training_data, update_data], ignore_index=True)
+    if not RECOMMENDER_CLASSES[name].INCREMENTAL_UPDATE:
+        return load_or_build_recommender(name, feat_data, all_data, args, n_neigh, distance_cache, updated_hash)
+
+    if args.model_dir is not None:
+        path = model_path(args, name, n_neigh, updated_hash)
+        if persistence.read_manifest(path) is not None:
+            try:
+                recommender = RECOMMENDER_CLASSES[name].load(path, feat_data, all_data, distance_cache)
+                print(f"Loaded model from {path}")
+                return recommender
+            except ValueError as e:
+                print(f"Updating {name}: {e}")
+
+    recommender = load_or_build_recommender(name, feat_data, training_data, args, n_neigh, distance_cache, data_hash)
+    recommender.update(update_data)
+    print(f"Updated {name} with {update_data['trail_id'].nunique()} trails")
+    if args.model_dir is not None:
+        path = model_path(args, name, n_neigh, updated_hash)
+        recommender.save(path)
+        print(f"Model saved to {path}")
+    return recommender
+
+
+def output_path(args, recommender: str, filter_visits: str, tiebreaker: str, n_neigh: int, single_run: bool) -> str:
+    """
+    Returns the output file of one configuration: --output_file for a single configuration,
+    otherwise --output_pattern filled with the configuration values.
+    """
+    if single_run and args.output_pattern is None:
+        return args.output_file
+    if args.output_pattern is None:
+        raise ValueError("--output_pattern is required when several configurations are run at once.")
+
+    return args.output_pattern.format(
+        recommender=recommender,
+        filter_visits=filter_visits,
+        tiebreaker=tiebreaker,
+        n_neigh=n_neigh,
+        neighs=f"neighs{n_neigh}" if recommender == "KNNRouteRecommender" else ""
+    )
+
+
+def write_recommendations(file_path: str, users: list, recommendations: list):
+    with open(file_path, 'w') as f:
+        for user, user_recommendations in zip(users, recommendations):
+            for poi in user_recommendations:
+                f.write(f"{user}\t{poi}\t1\n")
+
 
 def main():
     # Definir los argumentos
@@ -16,19 +164,33 @@ def main():
     parser.add_argument("--training_file", type=str, help="Path to the training file.", default="NewYork_mapped_trails_weather2_minroutes_4_minPOIs_TestRouteTraining.csv")
     parser.add_argument("--test_file", type=str, help="Path to the test file.", default="NewYork_mapped_trails_weather2_minroutes_4_minPOIs_TestRouteTest.csv")
     parser.add_argument("--feat_file", type=str, help="Path to the feature file.", default="NewYork_mapped_lat_lon.csv")
-    parser.add_argument("--output_file", type=str, help="Path to the output file.", default="salida.txt")
-    parser.add_argument("--recommender", type=str, choices=[
-        "ClosestNNRouteRecommender", 
-        "MarkovRouteRecommender", 
-        "FeatureMarkovRouteRecommender",
-        "KNNRouteRecommender",
-        "BaselineSinglePOIRecommender",
-        "WeightedTransitionsRouteRecommender"
-    ], help="Type of recommender to use.", default="WeightedTransitionsRouteRecommender")
+    parser.add_argument("--output_file", type=str, help="Path to the output file (single configuration).", default="salida.txt")
+    parser.add_argument("--output_pattern", type=str, default=None, help="Output path pattern for several configurations, with the fields {recommender}, {filter_visits}, {tiebreaker}, {n_neigh} and {neighs} ('neighs<n>' for KNNRouteRecommender, empty otherwise).")
+    parser.add_argument("--recommender", type=str, nargs="+", choices=RECOMMENDERS, help="Type(s) of recommender to use.", default=["WeightedTransitionsRouteRecommender"])
     parser.add_argument("--n_items", type=int, default=10, help="Number of items to recommend.")
-    parser.add_argument("--n_neigh", type=int, default=100, help="Number of neighbours (for KNNRouteRecommender) .")
-    parser.add_argument("--filter_visits", type=str, default="ALLOW", choices=["ALLOW", "EXCLUDE"], help="Visit filter.")
-    parser.add_argument("--tiebreaker", type=str, default="DISTANCE", choices=["POPULARITY", "DISTANCE"], help="Tie-breaking strategy for Markov recommenders.")
+    parser.add_argument("--n_neigh", type=int, nargs="+", default=[100], help="Number(s) of neighbours (for KNNRouteRecommender) .")
+    parser.add_argument("--pad_neighbours", action="store_true", help="Fill the neighbourhoods of KNNRouteRecommender with zero-similarity users, as the original implementation did (routes can otherwise end earlier).")
+    parser.add_argument("--filter_visits", type=str, nargs="+", default=["ALLOW"], choices=["ALLOW", "EXCLUDE"], help="Visit filter(s).")
+    parser.add_argument("--tiebreaker", type=str, nargs="+", default=["DISTANCE"], choices=["POPULARITY", "DISTANCE"], help="Tie-breaking strateg(y/ies) for Markov recommenders.")
+    parser.add_argument("--n_distance_neighbours", type=int, default=-1, help="Nearest POIs linked by the distance component of WeightedTransitionsRouteRecommender (-1, the default, links every POI as the original implementation did).")
+    parser.add_argument("--max_order", type=int, default=3, help="Maximum context length of VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--min_context_count", type=int, default=2, help="Minimum count of the contexts of two or more POIs kept by VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--memory_budget_mb", type=float, default=256, help="Approximate memory budget (MB) for building VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--beam_width", type=int, default=1, help="Beam width for route generation (1 keeps the greedy routes; only Markov, KNN and WeightedTransitions recommenders).")
+    parser.add_argument("--beam_budget_ms", type=float, default=None, help="Wall-clock budget in milliseconds per route for the beam search (after it, the best route is completed greedily).")
+    parser.add_argument("--distance_cache_dir", type=str, default=None, help="Directory to store/reuse the POI distance matrix (memory-mapped, keyed by the feature file content).")
+    parser.add_argument("--walk_restart", type=float, default=None, help="Restart probability of the personalised random walk with restart scoring the routes of WeightedTransitionsRouteRecommender (default: greedy routes).")
+    parser.add_argument("--walk_tolerance", type=float, default=1e-6, help="Convergence tolerance (L1 change of the scores) of the random walk power iteration.")
+    parser.add_argument("--walk_max_iterations", type=int, default=100, help="Maximum number of power iterations of the random walk.")
+    parser.add_argument("--distance_mode", type=str, default=dist.PROJECTED, choices=dist.DISTANCE_MODES, help="Distance between POIs: Euclidean on coordinates projected once to float32 metres (error bound in distances.Projection) or exact haversine.")
+    parser.add_argument("--trail_cache_dir", type=str, default=None, help="Directory to store/reuse the columnar store of the training trails (memory-mapped, keyed by the training file content).")
+    parser.add_argument("--update_file", type=str, default=None, help="Path to a file with new training trails, applied incrementally to the recommenders that support it (the rest are fitted on all the trails).")
+    parser.add_argument("--model_dir", type=str, default=None, help="Directory to save fitted models to and reuse them from in later runs.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes generating routes (fitted models are placed in shared memory).")
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate output files that already exist (only with --output_pattern).")
+    parser.add_argument("--evaluate", action="store_true", help="Score the routes against the test file in memory and print the metrics instead of writing recommendation files.")
+    parser.add_argument("--cutoffs", type=int, nargs="+", default=evaluation.DEFAULT_CUTOFFS, help="Cutoffs of the metrics of --evaluate.")
+    parser.add_argument("--profile", type=str, default=None, help="Path to write a JSON profiling report to (stage timings, query and step latency histograms, candidates scanned per step and cache hit rates).")
 
     # Parsear los argumentos
     args = parser.parse_args()
@@ -36,67 +198,164 @@ def main():
     print(f"Test file {args.test_file}")
     print(f"Feat file {args.feat_file}")
     print(f"Output file {args.output_file}")
+    print(f"Output pattern {args.output_pattern}")
     print(f"Recommender selected {args.recommender}")
     print(f"Number of rec items {args.n_items}")
     print(f"Number of neighbours {args.n_neigh}")
 
     print(f"Allow previous visits {args.filter_visits}")
     print(f"Tie beaker {args.tiebreaker}")
+    print(f"Distance mode {args.distance_mode}")
+    print(f"Distance cache dir {args.distance_cache_dir}")
+    print(f"Trail cache dir {args.trail_cache_dir}")
+    print(f"Update file {args.update_file}")
+    print(f"Model dir {args.model_dir}")
+    print(f"Workers {args.workers}")
+    print(f"Beam width {args.beam_width}")
+    print(f"Walk restart {args.walk_restart}")
+    print(f"Profile {args.profile}")
+    print(f"Evaluate {args.evaluate}")
+
+    # Modo de distancia global: caches, grafo de distancias y desempates por distancia
+    dist.set_distance_mode(args.distance_mode)
 
-    # Map filter_visits argument to VisitFilter enum
-    filter_visits = VisitFilter.ALLOW_PREVIOUS_VISITS if args.filter_visits == "ALLOW" else VisitFilter.EXCLUDE_PREVIOUS_VISITS
+    # Con --profile todos los recomendadores registran sus tiempos en el mismo profiler
+    profiler = profiling.Profiler() if args.profile is not None else None
+    BasicRouteRecommender.profiler = profiler
 
-    # Map tiebreaker argument to TieBreaker enum
-    tiebreaker = TieBreaker.POPULARITY if args.tiebreaker == "POPULARITY" else TieBreaker.DISTANCE
+    # Map filter_visits / tiebreaker arguments to their enums
+    visit_filters = {"ALLOW": VisitFilter.ALLOW_PREVIOUS_VISITS, "EXCLUDE": VisitFilter.EXCLUDE_PREVIOUS_VISITS}
+    tiebreakers = {"POPULARITY": TieBreaker.POPULARITY, "DISTANCE": TieBreaker.DISTANCE}
+
+    # Todas las configuraciones: (recomendador, n_neigh) se entrena una vez; filter_visits y tiebreaker solo afectan a la consulta
+    single_run = len(args.recommender) * len(args.filter_visits) * len(args.tiebreaker) * len(args.n_neigh) == 1
+    pending = {}
+    for recommender_name in dict.fromkeys(args.recommender):
+        neighs = sorted(set(args.n_neigh)) if recommender_name == "KNNRouteRecommender" else [None]
+        for n_neigh, filter_visits, tiebreaker in itertools.product(neighs, dict.fromkeys(args.filter_visits), dict.fromkeys(args.tiebreaker)):
+            # Con --evaluate no se escriben ficheros
+            file_path = None if args.evaluate else output_path(args, recommender_name, filter_visits, tiebreaker, n_neigh, single_run)
+            if file_path is not None and not single_run and not args.overwrite and os.path.isfile(file_path):
+                print(f"Skipping existing {file_path}")
+                continue
+            pending.setdefault(recommender_name, []).append((n_neigh, filter_visits, tiebreaker, file_path))
+
+    if not pending:
+        print("Nothing to do")
+        return
 
     # Leer los ficheros con cabeceras definidas a fuego
     train_headers = ["trail_id", "user_id", "venue_id", "timestamp"]
     test_headers = ["trail_id", "user_id", "venue_id", "timestamp"]
     feat_headers = ["venue_id", "latitude", "longitude", "category_lvlFs"]
 
-    training_data = pd.read_csv(args.training_file, header=None, names=train_headers, sep="\t")
-    test_data = pd.read_csv(args.test_file, header=None, names=test_headers, sep="\t")
-    feat_data = pd.read_csv(args.feat_file, header=None, names=feat_headers, sep="\t")
-
-    # Instanciar el recomendador
-    if args.recommender == "ClosestNNRouteRecommender":
-        recommender = ClosestNNRouteRecommender(feat_data, training_data)
-    elif args.recommender == "MarkovRouteRecommender":
-        recommender = MarkovRouteRecommender(feat_data, training_data)
-    elif args.recommender == "FeatureMarkovRouteRecommender":
-        recommender = FeatureMarkovRouteRecommender(feat_data, training_data, "category_lvlFs")
-    elif args.recommender == "KNNRouteRecommender":
-        recommender = KNNRouteRecommender(feat_data, training_data, args.n_neigh)
-    elif args.recommender == "BaselineSinglePOIRecommender":
-        recommender = BaselineSinglePOIRecommender(feat_data, training_data)
-    elif args.recommender == "WeightedTransitionsRouteRecommender":
-        recommender = WeightedTransitionsRouteRecommender(feat_data, training_data)
-    else:
-        raise ValueError(f"Unsupported recommender: {args.recommender}")
+    with profiling.stage(profiler, "main.read_data"):
+        training_data = pd.read_csv(args.training_file, header=None, names=train_headers, sep="\t")
+        test_data = pd.read_csv(args.test_file, header=None, names=test_headers, sep="\t")
+        feat_data = pd.read_csv(args.feat_file, header=None, names=feat_headers, sep="\t")
+        update_data = pd.read_csv(args.update_file, header=None, names=train_headers, sep="\t") if args.update_file is not None else None
 
-    # Procesar cada usuario del fichero de test
-    with open(args.output_file, 'w') as f:
-        for user in test_data["user_id"].unique():
-            try:
-                user_data = test_data[test_data["user_id"] == user]
-                starting_poi = user_data.loc[user_data["timestamp"].idxmin(), "venue_id"]
-                recommendations = recommender.recommend_from_poi(
-                    user=user,
+    # Trayectorias de entrenamiento en formato columnar, compartidas por todos los recomendadores (y entre ejecuciones)
+    if args.trail_cache_dir is not None:
+        with profiling.stage(profiler, "main.trail_store"):
+            trails.load_trail_store(args.training_file, training_data, args.trail_cache_dir)
+
+    # Matriz de distancias compartida por todos los recomendadores que la usan (y entre ejecuciones si hay directorio)
+    distance_cache = None
+    shared_blocks = []
+    if any(name in DISTANCE_CACHE_RECOMMENDERS for name in pending):
+        with profiling.stage(profiler, "main.distance_cache"):
+            if args.distance_cache_dir is not None:
+                distance_cache = dist.load_distance_cache(args.feat_file, feat_data, args.distance_cache_dir)
+            else:
+                distance_cache = dist.calculate_distance_cache(feat_data)
+                if args.workers > 1:
+                    distance_cache = parallel.share_dataframe(distance_cache, shared_blocks)
+
+    data_hash = persistence.dataset_hash(feat_data, training_data) if args.model_dir is not None else None
+    updated_hash = None
+    if args.model_dir is not None and update_data is not None:
+        updated_hash = persistence.dataset_hash(feat_data, pd.concat([training_data, update_data], ignore_index=True))
+
+    # POI inicial de cada usuario del fichero de test (el de menor timestamp), en orden de aparicion
+    first_visits = test_data.loc[test_data.groupby("user_id", sort=False)["timestamp"].idxmin()]
+    users = first_visits["user_id"].tolist()
+    starting_pois = first_visits["venue_id"].tolist()
+
+    evaluator = None
+    if args.evaluate:
+        with profiling.stage(profiler, "main.load_evaluator"):
+            evaluator = evaluation.RouteEvaluator(test_data, feat_data, args.cutoffs, distance_cache)
+        evaluation_results = {}
+
+    for recommender_name, configurations in pending.items():
+        # Instanciar el recomendador una sola vez (KNN con el mayor numero de vecinos pedido)
+        n_neighs = [n_neigh for n_neigh, _, _, _ in configurations if n_neigh is not None]
+        with profiling.stage(profiler, f"main.fit.{recommender_name}"):
+            if update_data is None:
+                recommender = load_or_build_recommender(recommender_name, feat_data, training_data, args, max(n_neighs, default=None), distance_cache, data_hash)
+            else:
+                recommender = load_or_update_recommender(recommender_name, feat_data, training_data, update_data, args, max(n_neighs, default=None),
+                                                         distance_cache, data_hash, updated_hash)
+        recommender_blocks = parallel.share_arrays(recommender) if args.workers > 1 else []
+        if args.beam_width > 1:
+            if recommender.BEAM_SEARCH:
+                recommender.beam_width = args.beam_width
+                recommender.beam_time_budget = args.beam_budget_ms / 1000 if args.beam_budget_ms is not None else None
+            else:
+                print(f"{recommender_name} does not support beam search, using its greedy routes")
+        if args.walk_restart is not None:
+            if isinstance(recommender, WeightedTransitionsRouteRecommender):
+                recommender.walk_restart = args.walk_restart
+                recommender.walk_tolerance = args.walk_tolerance
+                recommender.walk_max_iterations = args.walk_max_iterations
+                if args.beam_width > 1:
+                    print(f"{recommender_name} ignores --beam_width with --walk_restart: its routes follow the random walk scores")
+            else:
+                print(f"{recommender_name} does not support the random walk with restart, using its own routes")
+
+        for n_neigh, filter_visits, tiebreaker, file_path in configurations:
+            configuration = f"{recommender_name} PrevVisits {filter_visits} TieBreaker {tiebreaker}" + (f" neighs {n_neigh}" if n_neigh is not None else "")
+            print(f"Running {configuration}")
+            if n_neigh is not None:
+                # The neighbours are sorted by similarity: a smaller k uses a prefix of them
+                recommender.k = n_neigh
+
+            with profiling.stage(profiler, f"main.recommend.{recommender_name}"):
+                recommendations = parallel.recommend_batch_parallel(
+                    recommender,
+                    users=users,
+                    starting_pois=starting_pois,
                     n_items=args.n_items,
-                    starting_poi=starting_poi,
-                    filter_visits=filter_visits,
-                    tiebreaker=tiebreaker
+                    filter_visits=visit_filters[filter_visits],
+                    tiebreaker=tiebreakers[tiebreaker],
+                    workers=args.workers
                 )
 
+            if evaluator is not None:
+                # Evaluate the routes in memory
+                with profiling.stage(profiler, "main.evaluate"):
+                    results = evaluator.evaluate(users, recommendations)
+                evaluation_results[configuration] = results
+                print("  ".join(f"{metric} {results[metric]:.4f}" for metric in evaluator.metric_names()))
+            else:
+                # Write recommendations to the output file
+                with profiling.stage(profiler, "main.write_output"):
+                    write_recommendations(file_path, users, recommendations)
+                print(f"Recommendations saved to {file_path}")
+
+        parallel.release(recommender_blocks)
 
+    parallel.release(shared_blocks)
 
-                # Write recommendations to the output file
-                for poi in recommendations:
-                    f.write(f"{user}\t{poi}\t1\n")
-            except Exception as e:
-                print(f"Error processing user {user}: {e}")
+    if evaluator is not None:
+        # Tabla final: una fila por configuracion
+        with pd.option_context("display.max_columns", None, "display.width", None, "display.float_format", "{:.4f}".format):
+            print(pd.DataFrame.from_dict(evaluation_results, orient="index")[evaluator.metric_names()])
 
-    print(f"Recommendations saved to {args.output_file}")
+    if profiler is not None:
+        profiler.write(args.profile)
+        print(f"Profile saved to {args.profile}")
 
 if __name__ == "__main__":
     main()
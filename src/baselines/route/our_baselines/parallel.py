@@ -0,0 +1,173 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import List
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from Recommenders import BasicRouteRecommender, VisitFilter, TieBreaker
+from vocabulary import PoiVocabulary
+
+# Arrays smaller than this are cheaper to copy than to share
+MIN_SHARED_BYTES = 1 << 16
+
+
+class SharedArray(np.ndarray):
+    """
+    NumPy array backed by a multiprocessing.shared_memory block.
+
+    The array owning the block pickles as a reference to it (name, shape and dtype), so sending a
+    recommender to a spawned worker attaches to the same memory instead of copying the data. Arrays
+    derived from it (slices, results of operations) pickle by value as usual.
+    """
+    def __array_finalize__(self, obj):
+        self._shm = None
+
+    def __reduce__(self):
+        if self._shm is None:
+            return np.asarray(self).__reduce__()
+        return (_attach_shared_array, (self._shm.name, self.shape, self.dtype.str))
+
+
+def _wrap_shared_memory(shm: shared_memory.SharedMemory, shape: tuple, dtype) -> SharedArray:
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf).view(SharedArray)
+    array._shm = shm
+    return array
+
+
+def _attach_shared_array(name: str, shape: tuple, dtype: str) -> SharedArray:
+    return _wrap_shared_memory(shared_memory.SharedMemory(name=name), shape, np.dtype(dtype))
+
+
+def to_shared_array(array: np.ndarray, handles: List[shared_memory.SharedMemory]) -> SharedArray:
+    """
+    Copies an array into a new shared memory block.
+
+    Parameters:
+    - array: np.ndarray, the array to copy.
+    - handles: List[SharedMemory], list the new block is appended to (to unlink it later).
+
+    Returns:
+    - SharedArray: An array with the same content, backed by the shared block.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    handles.append(shm)
+    shared = _wrap_shared_memory(shm, array.shape, array.dtype)
+    shared[...] = array
+    return shared
+
+
+def _should_share(array) -> bool:
+    return (isinstance(array, np.ndarray) and not isinstance(array, SharedArray) and not isinstance(array, np.memmap)
+            and array.dtype != object and array.flags.owndata and array.nbytes >= MIN_SHARED_BYTES)
+
+
+def share_dataframe(df: pd.DataFrame, handles: List[shared_memory.SharedMemory]) -> pd.DataFrame:
+    """
+    Returns a copy of a single-dtype DataFrame (e.g. a distance cache) whose values live in shared memory.
+    """
+    values = to_shared_array(df.to_numpy(), handles)
+    return pd.DataFrame(values, index=df.index, columns=df.columns, copy=False)
+
+
+def share_arrays(recommender: BasicRouteRecommender) -> List[shared_memory.SharedMemory]:
+    """
+    Moves the large NumPy arrays of a fitted recommender (the arrays of its scipy sparse matrices and
+    of its vocabulary included) into shared memory, so that worker processes map them instead of
+    holding private copies.
+
+    Views of other arrays (e.g. of a memory-mapped distance cache) are left untouched.
+
+    Parameters:
+    - recommender: BasicRouteRecommender, a fitted recommender (modified in place).
+
+    Returns:
+    - List[SharedMemory]: The shared blocks created; unlink them once the recommender is no longer used.
+    """
+    handles = []
+    _share_attributes(recommender, handles)
+    return handles
+
+
+def _share_attributes(owner, handles: List[shared_memory.SharedMemory]):
+    """
+    Moves the large arrays among the attributes of an object into shared memory (see share_arrays).
+    """
+    for name, value in vars(owner).items():
+        if _should_share(value):
+            setattr(owner, name, to_shared_array(value, handles))
+        elif sparse.issparse(value) and value.format in ('csr', 'csc'):
+            for component in ['data', 'indices', 'indptr']:
+                if _should_share(getattr(value, component)):
+                    setattr(value, component, to_shared_array(getattr(value, component), handles))
+        elif isinstance(value, PoiVocabulary):
+            # Popularity, coordinates, projected x/y and the other per-POI arrays
+            _share_attributes(value, handles)
+
+
+def release(handles: List[shared_memory.SharedMemory]):
+    """
+    Unlinks shared blocks; the memory is freed once every process has dropped its mapping.
+    """
+    for shm in handles:
+        shm.unlink()
+
+
+_worker_recommender = None
+
+
+def _init_worker(recommender: BasicRouteRecommender):
+    global _worker_recommender
+    _worker_recommender = recommender
+
+
+def _recommend_chunk(task: tuple) -> tuple:
+    users, starting_pois, n_items, filter_visits, tiebreaker = task
+    # The worker profiler (a copy of the parent's) only returns the records of this chunk
+    profiler = BasicRouteRecommender.profiler
+    if profiler is not None:
+        profiler.reset()
+    return _worker_recommender.recommend_batch(users, starting_pois, n_items, filter_visits, tiebreaker), profiler
+
+
+def recommend_batch_parallel(recommender: BasicRouteRecommender, users: List[int], starting_pois: List[int], n_items: int,
+                             filter_visits: VisitFilter, tiebreaker: TieBreaker, workers: int, chunks_per_worker: int = 4) -> List[List[int]]:
+    """
+    Runs recommend_batch over a process pool, sharding the users in contiguous chunks.
+
+    Workers are forked when the platform allows it, so they inherit the fitted recommender without
+    pickling it; otherwise the recommender is pickled once per worker and its SharedArray attributes
+    attach to the same shared memory. Results are returned in the order of users, exactly as the
+    serial recommend_batch would return them, and the profiling records of the workers are merged
+    into BasicRouteRecommender.profiler.
+
+    Parameters:
+    - recommender: BasicRouteRecommender, a fitted recommender (ideally after share_arrays).
+    - users: List[int], the user IDs to recommend POIs for.
+    - starting_pois: List[int], the starting POI of each user (aligned with users).
+    - n_items: int, the number of POIs to recommend per user.
+    - filter_visits: VisitFilter, whether to exclude previously visited POIs.
+    - tiebreaker: TieBreaker, strategy for resolving ties.
+    - workers: int, number of worker processes.
+    - chunks_per_worker: int, number of user chunks per worker (for load balancing).
+
+    Returns:
+    - List[List[int]]: The recommended POI IDs of each user, in the order of users.
+    """
+    if workers <= 1 or len(users) == 0:
+        return recommender.recommend_batch(users, starting_pois, n_items, filter_visits, tiebreaker)
+
+    n_chunks = min(len(users), workers * chunks_per_worker)
+    bounds = np.linspace(0, len(users), n_chunks + 1).astype(int)
+    tasks = [
+        (list(users[start:stop]), list(starting_pois[start:stop]), n_items, filter_visits, tiebreaker)
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+    context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else mp.get_context()
+    with context.Pool(workers, initializer=_init_worker, initargs=(recommender,)) as pool:
+        chunks = pool.map(_recommend_chunk, tasks, chunksize=1)
+
+    for _, profiler in chunks:
+        if profiler is not None:
+            BasicRouteRecommender.profiler.merge(profiler)
+    return [route for chunk, _ in chunks for route in chunk]
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout of saved models changes
+MODEL_FORMAT_VERSION = 5
+
+ARRAYS_FILE = "arrays.npz"
+MANIFEST_FILE = "manifest.json"
+
+
+def dataset_hash(poi_df: pd.DataFrame, trail_df: pd.DataFrame) -> str:
+    """
+    Computes a SHA-1 digest of the content (values and column names) of the POI and trail DataFrames.
+
+    Parameters:
+    - poi_df: pd.DataFrame, DataFrame containing POI information.
+    - trail_df: pd.DataFrame, DataFrame containing user trail information.
+
+    Returns:
+    - str: Hexadecimal digest identifying the dataset a model was fitted on.
+    """
+    digest = hashlib.sha1()
+    for df in [poi_df, trail_df]:
+        digest.update(json.dumps([str(column) for column in df.columns]).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def to_storable_array(values) -> tuple:
+    """
+    Converts an array to one np.load can read without pickle.
+
+    Object arrays are only supported when every element is a string; they are stored as
+    fixed-width unicode arrays.
+
+    Returns:
+    - tuple: (array, is_object), where is_object tells whether to restore the object dtype.
+    """
+    array = np.asarray(values)
+    if array.dtype != object:
+        return array, False
+    if not all(isinstance(value, str) for value in array.ravel()):
+        raise TypeError("Only object arrays of strings can be saved")
+    return array.astype(str), True
+
+
+def from_storable_array(array: np.ndarray, is_object: bool) -> np.ndarray:
+    return array.astype(object) if is_object else array
+
+
+def save_arrays(file_path: str, arrays: dict):
+    """
+    Writes arrays to an uncompressed .npz file (so that load_arrays can memory-map them), atomically.
+
+    Parameters:
+    - file_path: str, path of the .npz file.
+    - arrays: dict, mapping from array name to np.ndarray.
+    """
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, file_path)
+
+
+def load_arrays(file_path: str, mmap: bool = True) -> dict:
+    """
+    Reads the arrays of an uncompressed .npz file.
+
+    With mmap, every member is mapped read-only in place (np.load ignores mmap_mode for .npz
+    files): the offset of its data is read from the zip local header and the .npy header.
+
+    Parameters:
+    - file_path: str, path of the .npz file.
+    - mmap: bool, whether to memory-map the arrays instead of reading them.
+
+    Returns:
+    - dict: Mapping from array name to np.ndarray (np.memmap with mmap).
+    """
+    if not mmap:
+        with np.load(file_path, allow_pickle=False) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    arrays = {}
+    with zipfile.ZipFile(file_path) as archive, open(file_path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} is compressed and cannot be memory-mapped")
+
+            # Local file header: 30 fixed bytes, then the file name and the extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype, order='F' if fortran_order else 'C')
+            else:
+                arrays[name] = np.memmap(file_path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+def write_manifest(directory: str, manifest: dict):
+    """
+    Writes the JSON manifest of a saved model, atomically.
+    """
+    file_path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, file_path)
+
+
+def read_manifest(directory: str) -> dict:
+    """
+    Reads the JSON manifest of a saved model, or returns None if there is no saved model.
+    """
+    file_path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path) as f:
+        return json.load(f)
@@ -0,0 +1,162 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+# Bump when the structure of the report changes
+REPORT_FORMAT_VERSION = 1
+
+# Bucket b > 0 of a histogram counts the values in [2 ** (b - 1), 2 ** b); bucket 0 the values below 1
+N_BUCKETS = 48
+
+# Shared no-op context manager returned by stage when profiling is off
+NO_STAGE = nullcontext()
+
+
+class Histogram:
+    """
+    Histogram of non-negative values in power-of-two buckets, cheap to update and to merge.
+    """
+    def __init__(self):
+        self.buckets = np.zeros(N_BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.buckets[min(int(value).bit_length(), N_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        self.buckets += other.buckets
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns an upper bound of the q-quantile: the upper edge of its bucket (at most the maximum).
+        """
+        if self.count == 0:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(self.buckets), q * self.count))
+        return float(min(2 ** bucket, self.max))
+
+    def report(self) -> dict:
+        non_empty = np.flatnonzero(self.buckets)
+        return {
+            "count": self.count,
+            "mean": float(self.total / self.count) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": float(self.max),
+            # (upper edge, count) of the non-empty buckets
+            "buckets": [[2 ** int(bucket), int(self.buckets[bucket])] for bucket in non_empty]
+        }
+
+
+class Profiler:
+    """
+    Collects the instrumentation of the route recommenders and of main.py: the time spent in named
+    stages (fit sub-steps, data loading, output...), latency histograms of queries and route steps
+    (in microseconds), histograms of the candidates scanned at every step, and cache hit counters.
+
+    Recommenders report to the profiler set in BasicRouteRecommender.profiler; when it is None the
+    instrumentation reduces to a few attribute checks.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.latencies = {}
+        self.candidates = {}
+        self.caches = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager adding the wall-clock time of its block to the stage name.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            calls_seconds = self.stages.setdefault(name, [0, 0.0])
+            calls_seconds[0] += 1
+            calls_seconds[1] += time.perf_counter() - started
+
+    def record_latency(self, name: str, seconds: float):
+        """
+        Adds a latency (in seconds) to the histogram name.
+        """
+        histogram = self.latencies.get(name)
+        if histogram is None:
+            histogram = self.latencies[name] = Histogram()
+        histogram.add(seconds * 1e6)
+
+    def record_step(self, name: str, seconds: float, n_candidates: int):
+        """
+        Records one step of a route: its latency and the number of candidate POIs it scanned.
+        """
+        self.record_latency(name, seconds)
+        histogram = self.candidates.get(name)
+        if histogram is None:
+            histogram = self.candidates[name] = Histogram()
+        histogram.add(n_candidates)
+
+    def record_cache(self, name: str, hit: bool):
+        """
+        Counts a hit (or a miss) of the cache name.
+        """
+        hits_misses = self.caches.setdefault(name, [0, 0])
+        hits_misses[0 if hit else 1] += 1
+
+    def merge(self, other: "Profiler"):
+        """
+        Adds the records of another profiler (e.g. of a worker process) to this one.
+        """
+        for name, (calls, seconds) in other.stages.items():
+            calls_seconds = self.stages.setdefault(name, [0, 0.0])
+            calls_seconds[0] += calls
+            calls_seconds[1] += seconds
+        for mine, theirs in [(self.latencies, other.latencies), (self.candidates, other.candidates)]:
+            for name, histogram in theirs.items():
+                mine.setdefault(name, Histogram()).merge(histogram)
+        for name, (hits, misses) in other.caches.items():
+            hits_misses = self.caches.setdefault(name, [0, 0])
+            hits_misses[0] += hits
+            hits_misses[1] += misses
+
+    def report(self) -> dict:
+        """
+        Returns the records as a JSON-serialisable dict.
+        """
+        return {
+            "format_version": REPORT_FORMAT_VERSION,
+            "stages": {
+                name: {"calls": calls, "seconds": seconds, "mean_ms": seconds * 1000 / calls}
+                for name, (calls, seconds) in sorted(self.stages.items())
+            },
+            "latencies_us": {name: histogram.report() for name, histogram in sorted(self.latencies.items())},
+            "candidates": {name: histogram.report() for name, histogram in sorted(self.candidates.items())},
+            "caches": {
+                name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                for name, (hits, misses) in sorted(self.caches.items())
+            }
+        }
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def stage(profiler: Profiler, name: str):
+    """
+    Returns profiler.stage(name), or a no-op context manager if profiler is None.
+    """
+    return NO_STAGE if profiler is None else profiler.stage(name)
@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing as mp
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from Recommenders import VisitFilter, TieBreaker
+import distances as dist
+import http_messages as http
+import persistence
+from main import RECOMMENDERS, DISTANCE_CACHE_RECOMMENDERS, load_or_build_recommender
+
+VISIT_FILTERS = {"ALLOW": VisitFilter.ALLOW_PREVIOUS_VISITS, "EXCLUDE": VisitFilter.EXCLUDE_PREVIOUS_VISITS}
+TIEBREAKERS = {"POPULARITY": TieBreaker.POPULARITY, "DISTANCE": TieBreaker.DISTANCE}
+
+# Number of latest latencies used for the percentiles, and window (in seconds) of the QPS counter
+LATENCY_WINDOW = 10000
+QPS_WINDOW_SECONDS = 10.0
+
+
+_worker_recommenders = None
+
+
+def _init_worker(recommenders: dict):
+    global _worker_recommenders
+    _worker_recommenders = recommenders
+
+
+def _recommend(name: str, user, starting_poi, n_items: int, filter_visits: str, tiebreaker: str) -> list:
+    route = _worker_recommenders[name].recommend_from_poi(user, n_items, starting_poi, VISIT_FILTERS[filter_visits], TIEBREAKERS[tiebreaker])
+    return [poi.item() if isinstance(poi, np.generic) else poi for poi in route]
+
+
+def _ready() -> bool:
+    return _worker_recommenders is not None
+
+
+class ServiceStats:
+    """
+    Request counters of the service: latency percentiles over the latest LATENCY_WINDOW requests
+    and throughput over the last QPS_WINDOW_SECONDS.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.completions = deque()
+        self.requests = 0
+        self.errors = 0
+        self.coalesced = 0
+
+    def record(self, latency: float, ok: bool):
+        now = time.monotonic()
+        self.requests += 1
+        self.errors += not ok
+        self.latencies.append(latency)
+        self.completions.append(now)
+        while self.completions and self.completions[0] < now - QPS_WINDOW_SECONDS:
+            self.completions.popleft()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        while self.completions and self.completions[0] < now - QPS_WINDOW_SECONDS:
+            self.completions.popleft()
+        window = min(QPS_WINDOW_SECONDS, now - self.started)
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "qps": len(self.completions) / window if window > 0 else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "uptime_s": now - self.started
+        }
+
+
+class RouteService:
+    """
+    Asyncio HTTP/JSON front end of fitted route recommenders.
+
+    Endpoints:
+    - POST /recommend: body {"user", "starting_poi", "recommender" (optional with a single model),
+      "n_items" (10), "filter_visits" ("ALLOW"), "tiebreaker" ("DISTANCE")}; answers
+      {"recommendations": [...]} with the route of recommend_from_poi.
+    - GET /stats: request counters (see ServiceStats).
+    - GET /health: the names of the loaded recommenders.
+
+    Routes are computed in the executor so the event loop keeps serving while they run. Identical
+    requests that arrive while one is being computed wait for that computation instead of starting
+    their own.
+    """
+    def __init__(self, recommender_names: list, executor: concurrent.futures.Executor):
+        """
+        Parameters:
+        - recommender_names: list, names of the recommenders loaded in the executor workers.
+        - executor: concurrent.futures.Executor, executor whose workers were initialised with _init_worker.
+        """
+        self.recommender_names = recommender_names
+        self.executor = executor
+        self.in_flight = {}
+        self.stats = ServiceStats()
+
+    def _request_key(self, request: dict) -> tuple:
+        """
+        Validates a /recommend request and returns the arguments of _recommend.
+
+        Raises:
+        - ValueError: If a field is missing or invalid.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("The request body must be a JSON object")
+        name = request.get("recommender", self.recommender_names[0] if len(self.recommender_names) == 1 else None)
+        if name not in self.recommender_names:
+            raise ValueError(f"Unknown recommender {name}; loaded: {self.recommender_names}")
+        for field in ["user", "starting_poi"]:
+            if not isinstance(request.get(field), (int, str)):
+                raise ValueError(f"Missing or invalid field {field}")
+        n_items = request.get("n_items", 10)
+        filter_visits = request.get("filter_visits", "ALLOW")
+        tiebreaker = request.get("tiebreaker", "DISTANCE")
+        if not isinstance(n_items, int) or n_items < 1:
+            raise ValueError(f"Invalid n_items {n_items}")
+        if filter_visits not in VISIT_FILTERS:
+            raise ValueError(f"Invalid filter_visits {filter_visits}")
+        if tiebreaker not in TIEBREAKERS:
+            raise ValueError(f"Invalid tiebreaker {tiebreaker}")
+        return name, request["user"], request["starting_poi"], n_items, filter_visits, tiebreaker
+
+    async def recommend(self, request: dict) -> list:
+        """
+        Computes the route of a /recommend request, sharing the computation of identical concurrent requests.
+        """
+        key = self._request_key(request)
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, _recommend, *key)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.stats.coalesced += 1
+
+        # A client that goes away must not cancel the computation the others wait for
+        return await asyncio.shield(future)
+
+    async def _respond(self, method: str, path: str, body: bytes) -> tuple:
+        """
+        Returns the (status, payload) of a request.
+        """
+        path = path.split("?", 1)[0]
+        if path == "/recommend":
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            started = time.perf_counter()
+            try:
+                route = await self.recommend(json.loads(body or b"null"))
+                status, payload = 200, {"recommendations": route}
+            except (ValueError, KeyError) as e:
+                status, payload = 400, {"error": f"{type(e).__name__}: {e}"}
+            except Exception as e:
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            self.stats.record(time.perf_counter() - started, status == 200)
+            return status, payload
+        if path == "/stats" and method == "GET":
+            return 200, self.stats.snapshot()
+        if path == "/health" and method == "GET":
+            return 200, {"recommenders": self.recommender_names}
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves the requests of one (keep-alive) connection, one at a time.
+        """
+        try:
+            while True:
+                try:
+                    message = await http.read_message(reader)
+                except (ValueError, asyncio.IncompleteReadError) as e:
+                    writer.write(http.encode_response(400, {"error": str(e)}, keep_alive=False))
+                    break
+                if message is None:
+                    break
+
+                start_line, headers, body = message
+                parts = start_line.split()
+                if len(parts) != 3:
+                    writer.write(http.encode_response(400, {"error": "Malformed request line"}, keep_alive=False))
+                    break
+
+                method, path, version = parts
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                status, payload = await self._respond(method, path, body)
+                writer.write(http.encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def create_executor(recommenders: dict, kind: str, workers: int) -> concurrent.futures.Executor:
+    """
+    Creates the executor running the route computations, with the recommenders loaded in its workers.
+
+    Process workers are forked (when the platform allows it) and started right away, so they
+    inherit the fitted models without pickling them.
+
+    Parameters:
+    - recommenders: dict, fitted recommenders by name.
+    - kind: str, "process" or "thread".
+    - workers: int, number of workers.
+    """
+    if kind == "thread":
+        _init_worker(recommenders)
+        return concurrent.futures.ThreadPoolExecutor(workers)
+
+    context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else mp.get_context()
+    executor = concurrent.futures.ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(recommenders,))
+    for future in [executor.submit(_ready) for _ in range(workers)]:
+        future.result()
+    return executor
+
+
+async def serve(service: RouteService, host: str, port: int):
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Serving {service.recommender_names} on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fitted route recommenders over HTTP/JSON.")
+    parser.add_argument("--training_file", type=str, help="Path to the training file.", default="NewYork_mapped_trails_weather2_minroutes_4_minPOIs_TestRouteTraining.csv")
+    parser.add_argument("--feat_file", type=str, help="Path to the feature file.", default="NewYork_mapped_lat_lon.csv")
+    parser.add_argument("--recommender", type=str, nargs="+", choices=RECOMMENDERS, help="Recommender(s) to serve.", default=["WeightedTransitionsRouteRecommender"])
+    parser.add_argument("--n_neigh", type=int, default=100, help="Number of neighbours (for KNNRouteRecommender).")
+    parser.add_argument("--pad_neighbours", action="store_true", help="Fill the neighbourhoods of KNNRouteRecommender with zero-similarity users, as the original implementation did.")
+    parser.add_argument("--n_distance_neighbours", type=int, default=-1, help="Nearest POIs linked by the distance component of WeightedTransitionsRouteRecommender (-1, the default, links every POI as the original implementation did).")
+    parser.add_argument("--max_order", type=int, default=3, help="Maximum context length of VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--min_context_count", type=int, default=2, help="Minimum count of the contexts of two or more POIs kept by VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--memory_budget_mb", type=float, default=256, help="Approximate memory budget (MB) for building VariableOrderMarkovRouteRecommender.")
+    parser.add_argument("--distance_cache_dir", type=str, default=None, help="Directory to store/reuse the POI distance matrix.")
+    parser.add_argument("--distance_mode", type=str, default=dist.PROJECTED, choices=dist.DISTANCE_MODES, help="Distance between POIs: Euclidean on coordinates projected once to float32 metres (error bound in distances.Projection) or exact haversine.")
+    parser.add_argument("--model_dir", type=str, default=None, help="Directory to load fitted models from (and save them to).")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument("--executor", type=str, default="process", choices=["process", "thread"], help="Executor running the route computations.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of executor workers.")
+    args = parser.parse_args()
+    dist.set_distance_mode(args.distance_mode)
+
+    train_headers = ["trail_id", "user_id", "venue_id", "timestamp"]
+    feat_headers = ["venue_id", "latitude", "longitude", "category_lvlFs"]
+    training_data = pd.read_csv(args.training_file, header=None, names=train_headers, sep="\t")
+    feat_data = pd.read_csv(args.feat_file, header=None, names=feat_headers, sep="\t")
+
+    distance_cache = None
+    if any(name in DISTANCE_CACHE_RECOMMENDERS for name in args.recommender):
+        if args.distance_cache_dir is not None:
+            distance_cache = dist.load_distance_cache(args.feat_file, feat_data, args.distance_cache_dir)
+        else:
+            distance_cache = dist.calculate_distance_cache(feat_data)
+    data_hash = persistence.dataset_hash(feat_data, training_data) if args.model_dir is not None else None
+
+    recommenders = {
+        name: load_or_build_recommender(name, feat_data, training_data, args, args.n_neigh, distance_cache, data_hash)
+        for name in dict.fromkeys(args.recommender)
+    }
+
+    executor = create_executor(recommenders, args.executor, args.workers)
+    try:
+        asyncio.run(serve(RouteService(list(recommenders), executor), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import pandas as pd
+import http_messages as http
+
+
+class Connection:
+    """
+    Keep-alive connection to the route service, used by one request at a time.
+    """
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, payload=None) -> tuple:
+        """
+        Sends a request (reconnecting if needed) and returns the (status, payload) of the response.
+        """
+        if self.writer is None or self.writer.is_closing():
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            self.writer.write(http.encode_request(method, path, payload, self.host))
+            await self.writer.drain()
+            message = await http.read_message(self.reader)
+            if message is None:
+                raise ConnectionError("Connection closed by the service")
+        except Exception:
+            self.close()
+            raise
+
+        start_line, headers, body = message
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return int(start_line.split()[1]), json.loads(body) if body else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def replay(requests: list, host: str, port: int, rate: float, duration: float, connections: int) -> dict:
+    """
+    Sends the requests to the service at a fixed rate (cycling through them until duration ends).
+
+    Requests are scheduled open-loop: request i is due i / rate seconds after the start whether or
+    not the previous ones were answered, and its latency counts from that moment, so time spent
+    waiting for a free connection (or for the service) is included.
+
+    Parameters:
+    - requests: list, the /recommend request bodies.
+    - host: str, address of the service.
+    - port: int, port of the service.
+    - rate: float, target requests per second.
+    - duration: float, seconds to send requests for (None to send each request once).
+    - connections: int, maximum number of concurrent connections.
+
+    Returns:
+    - dict: The client-side report and the /stats of the service after the run.
+    """
+    n_requests = len(requests) if duration is None else int(duration * rate)
+    pool = asyncio.Queue()
+    for _ in range(connections):
+        pool.put_nowait(Connection(host, port))
+
+    latencies, statuses = np.full(n_requests, np.nan), np.zeros(n_requests, dtype=np.int32)
+    started = time.perf_counter()
+
+    async def send(i: int):
+        due = started + i / rate
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        connection = await pool.get()
+        try:
+            statuses[i], _ = await connection.request("POST", "/recommend", requests[i % len(requests)])
+        except (ConnectionError, OSError, ValueError, asyncio.IncompleteReadError):
+            statuses[i] = -1
+        finally:
+            pool.put_nowait(connection)
+        latencies[i] = time.perf_counter() - due
+
+    await asyncio.gather(*(send(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - started
+
+    connection = await pool.get()
+    try:
+        _, service_stats = await connection.request("GET", "/stats")
+    finally:
+        connection.close()
+    while not pool.empty():
+        pool.get_nowait().close()
+
+    latencies_ms = latencies * 1000
+    return {
+        "requests": n_requests,
+        "ok": int(np.count_nonzero(statuses == 200)),
+        "errors": int(np.count_nonzero(statuses != 200)),
+        "target_qps": rate,
+        "achieved_qps": n_requests / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": float(np.nanpercentile(latencies_ms, 50)) if n_requests else None,
+        "p99_ms": float(np.nanpercentile(latencies_ms, 99)) if n_requests else None,
+        "max_ms": float(np.nanmax(latencies_ms)) if n_requests else None,
+        "service": service_stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the starting POIs of a test file against the route service at a target rate.")
+    parser.add_argument("--test_file", type=str, help="Path to the test file.", default="NewYork_mapped_trails_weather2_minroutes_4_minPOIs_TestRouteTest.csv")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address of the service.")
+    parser.add_argument("--port", type=int, default=8080, help="Port of the service.")
+    parser.add_argument("--rate", type=float, default=100, help="Target requests per second.")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to send requests for, cycling through the test users (default: each user once).")
+    parser.add_argument("--connections", type=int, default=16, help="Maximum number of concurrent connections.")
+    parser.add_argument("--recommender", type=str, default=None, help="Recommender to query (optional if the service loads a single one).")
+    parser.add_argument("--n_items", type=int, default=10, help="Number of items to recommend.")
+    parser.add_argument("--filter_visits", type=str, default="ALLOW", choices=["ALLOW", "EXCLUDE"], help="Visit filter.")
+    parser.add_argument("--tiebreaker", type=str, default="DISTANCE", choices=["POPULARITY", "DISTANCE"], help="Tie-breaking strategy.")
+    parser.add_argument("--output_file", type=str, default=None, help="Path to write the JSON report to (printed otherwise).")
+    args = parser.parse_args()
+
+    # Same queries as main.py: the first POI (lowest timestamp) of every test user
+    test_headers = ["trail_id", "user_id", "venue_id", "timestamp"]
+    test_data = pd.read_csv(args.test_file, header=None, names=test_headers, sep="\t")
+    first_visits = test_data.loc[test_data.groupby("user_id", sort=False)["timestamp"].idxmin()]
+
+    requests = []
+    for user, starting_poi in zip(first_visits["user_id"].tolist(), first_visits["venue_id"].tolist()):
+        request = {"user": user, "starting_poi": starting_poi, "n_items": args.n_items,
+                   "filter_visits": args.filter_visits, "tiebreaker": args.tiebreaker}
+        if args.recommender is not None:
+            request["recommender"] = args.recommender
+        requests.append(request)
+
+    report = asyncio.run(replay(requests, args.host, args.port, args.rate, args.duration, args.connections))
+    report = json.dumps(report, indent=2)
+    if args.output_file is not None:
+        with open(args.output_file, 'w') as f:
+            f.write(report)
+    print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import hashlib
+import os
+import weakref
+import numpy as np
+import pandas as pd
+import distances as dist
+import persistence
+import utils as ut
+
+# Bump when the on-disk layout of stored trails changes
+TRAIL_STORE_FORMAT_VERSION = 1
+
+# Columns a store is built from (see fingerprint)
+KEY_COLUMNS = ['trail_id', 'user_id', 'venue_id', 'timestamp']
+
+# Stores of the trail DataFrames in use, keyed by id(trail_df):
+# (weak reference to the DataFrame, its fingerprint when the stores were built, {dedupe: TrailStore})
+_STORES = {}
+
+
+class TrailStore:
+    """
+    Columnar (ragged-array) copy of a trail DataFrame.
+
+    Trails are ordered by trail id; the POIs of trail t, in the order of its rows, are stored in
+    positions offsets[t]:offsets[t + 1] of pois (int32 venue IDs when they fit, int64 offsets).
+    Every trail also has its user, its start timestamp (of its first row) and a count: 1, or the
+    number of identical trails it stands for after dedupe.
+    """
+    # Arrays that fully describe the store (saved by save)
+    ARRAYS = ('trail_ids', 'offsets', 'pois', 'users', 'timestamps', 'counts')
+
+    def __init__(self, trail_ids: np.ndarray, offsets: np.ndarray, pois: np.ndarray, users: np.ndarray,
+                 timestamps: np.ndarray, counts: np.ndarray):
+        self.trail_ids = trail_ids
+        self.offsets = offsets
+        self.pois = pois
+        self.users = users
+        self.timestamps = timestamps
+        self.counts = counts
+
+    @classmethod
+    def from_frame(cls, trail_df: pd.DataFrame) -> "TrailStore":
+        """
+        Builds the store of a DataFrame with 'trail_id', 'user_id', 'venue_id' and 'timestamp' columns.
+        """
+        order = np.argsort(trail_df['trail_id'].to_numpy(), kind='stable')
+        trail_ids = trail_df['trail_id'].to_numpy()[order]
+        starts = np.flatnonzero(np.concatenate([[True], trail_ids[1:] != trail_ids[:-1]])) if len(order) else np.zeros(0, dtype=np.int64)
+
+        offsets = np.empty(len(starts) + 1, dtype=np.int64)
+        offsets[:-1] = starts
+        offsets[-1] = len(order)
+
+        pois = trail_df['venue_id'].to_numpy()[order]
+        int32 = np.iinfo(np.int32)
+        if pois.dtype.kind in 'iu' and (len(pois) == 0 or (pois.min() >= int32.min and pois.max() <= int32.max)):
+            pois = pois.astype(np.int32)
+
+        first_rows = order[starts]
+        return cls(
+            trail_ids[starts], offsets, pois,
+            trail_df['user_id'].to_numpy()[first_rows],
+            trail_df['timestamp'].to_numpy()[first_rows],
+            np.ones(len(starts), dtype=np.int64)
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "TrailStore":
+        """
+        Rebuilds a store from its ARRAYS (as written by save).
+        """
+        return cls(*(arrays[name] for name in cls.ARRAYS))
+
+    def save(self, file_path: str):
+        """
+        Writes the store to an uncompressed .npz file (memory-mappable by load), atomically.
+        """
+        persistence.save_arrays(file_path, {name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, file_path: str, mmap: bool = True) -> "TrailStore":
+        """
+        Reads a store written by save (memory-mapped with mmap).
+        """
+        return cls.from_arrays(persistence.load_arrays(file_path, mmap))
+
+    def __len__(self) -> int:
+        return len(self.trail_ids)
+
+    def lengths(self) -> np.ndarray:
+        """
+        Returns the number of POIs of every trail.
+        """
+        return np.diff(self.offsets)
+
+    def visit_weights(self) -> np.ndarray:
+        """
+        Returns the count of the trail of every visit, aligned with pois.
+        """
+        return np.repeat(self.counts, self.lengths())
+
+    def dedupe(self) -> "TrailStore":
+        """
+        Merges the trails with the same sequence of POIs into their first occurrence, whose count
+        becomes the sum of theirs (its trail id, user and timestamp are kept).
+
+        Trails are compared in one vectorised pass per distinct trail length. A deduplicated store
+        gives the same weighted transitions and popularity, but not the trails of every user.
+
+        Returns:
+        - TrailStore: The store of the distinct trails, in the order of their first occurrence.
+        """
+        lengths = self.lengths()
+        representatives = np.arange(len(self))
+        for length in np.unique(lengths):
+            trails = np.flatnonzero(lengths == length)
+            if len(trails) < 2:
+                continue
+            sequences = self.pois[self.offsets[trails][:, None] + np.arange(length)]
+            _, first, inverse = np.unique(sequences, axis=0, return_index=True, return_inverse=True)
+            representatives[trails] = trails[first[inverse.ravel()]]
+
+        kept = np.flatnonzero(representatives == np.arange(len(self)))
+        counts = np.bincount(representatives, weights=self.counts, minlength=len(self))[kept].astype(np.int64)
+        kept_lengths, positions = ut.row_positions(self.offsets, kept)
+        offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+        np.cumsum(kept_lengths, out=offsets[1:])
+        return TrailStore(self.trail_ids[kept], offsets, self.pois[positions], self.users[kept], self.timestamps[kept], counts)
+
+    def transitions(self, values: np.ndarray = None, keep: np.ndarray = None) -> tuple:
+        """
+        Extracts the consecutive (from, to) pairs of every trail, in trail order.
+
+        Parameters:
+        - values: np.ndarray, values aligned with pois forming the transitions (the POIs if None).
+        - keep: np.ndarray, boolean mask aligned with pois of the visits to keep (the others are
+          skipped, so the visits around them become consecutive).
+
+        Returns:
+        - tuple: (from_values, to_values, weights), three aligned np.ndarrays with one entry per
+          transition; weights is the count of its trail.
+        """
+        values = self.pois if values is None else values
+        trail_index = np.repeat(np.arange(len(self)), self.lengths())
+        if keep is not None:
+            values, trail_index = values[keep], trail_index[keep]
+
+        same_trail = trail_index[:-1] == trail_index[1:]
+        return values[:-1][same_trail], values[1:][same_trail], self.counts[trail_index[:-1][same_trail]]
+
+
+def fingerprint(trail_df: pd.DataFrame) -> tuple:
+    """
+    Returns the number of rows of a trail DataFrame and a hash of its KEY_COLUMNS, which change
+    whenever the DataFrame is modified in a way that changes its store.
+    """
+    hashes = pd.util.hash_pandas_object(trail_df[KEY_COLUMNS], index=False).to_numpy()
+    return len(trail_df), hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def store_of(trail_df: pd.DataFrame, dedupe: bool = False) -> TrailStore:
+    """
+    Returns the store of a trail DataFrame, built on first use and shared while the DataFrame lives.
+
+    The stores are validated against the fingerprint of trail_df on every call (one hashing pass over
+    its key columns), so a DataFrame modified in place gets new stores instead of stale ones.
+
+    Parameters:
+    - trail_df: pd.DataFrame, the trails.
+    - dedupe: bool, whether to return the deduplicated store (see TrailStore.dedupe).
+
+    Returns:
+    - TrailStore: The store of trail_df.
+    """
+    key = id(trail_df)
+    current = fingerprint(trail_df)
+    entry = _STORES.get(key)
+    if entry is None or entry[0]() is not trail_df:
+        weakref.finalize(trail_df, _STORES.pop, key, None)
+    if entry is None or entry[0]() is not trail_df or entry[1] != current:
+        entry = _STORES[key] = (weakref.ref(trail_df), current, {})
+
+    stores = entry[2]
+    if False not in stores:
+        stores[False] = TrailStore.from_frame(trail_df)
+    if dedupe not in stores:
+        stores[dedupe] = stores[False].dedupe()
+    return stores[dedupe]
+
+
+def register(trail_df: pd.DataFrame, store: TrailStore):
+    """
+    Sets the store of a trail DataFrame (e.g. one read by load_trail_store) so store_of does not rebuild it.
+    """
+    if id(trail_df) not in _STORES:
+        weakref.finalize(trail_df, _STORES.pop, id(trail_df), None)
+    _STORES[id(trail_df)] = (weakref.ref(trail_df), fingerprint(trail_df), {False: store})
+
+
+def load_trail_store(trail_file: str, trail_df: pd.DataFrame, cache_dir: str) -> TrailStore:
+    """
+    Returns the store of the trails in trail_file, memory-mapped from cache_dir.
+
+    The store is kept as an uncompressed .npz file keyed by the content hash of trail_file; if
+    it does not exist yet it is built from trail_df and written atomically. The store is also
+    registered for trail_df, so the recommenders fitted on it share it.
+
+    Parameters:
+    - trail_file: str, path to the file trail_df was read from.
+    - trail_df: pd.DataFrame, the trails of trail_file.
+    - cache_dir: str, directory where the stores are kept.
+
+    Returns:
+    - TrailStore: The store of trail_df.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    file_path = os.path.join(cache_dir, f"trails_v{TRAIL_STORE_FORMAT_VERSION}_{dist.file_content_hash(trail_file)}.npz")
+    if not os.path.exists(file_path):
+        TrailStore.from_frame(trail_df).save(file_path)
+    store = TrailStore.load(file_path)
+    register(trail_df, store)
+    return store
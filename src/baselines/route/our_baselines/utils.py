@@ -1,4 +1,5 @@
 import math
+import numpy as np
 import pandas as pd
 
 def haversine(lat1:float, lon1:float, lat2:float, lon2:float):
@@ -20,6 +21,88 @@ def haversine(lat1:float, lon1:float, lat2:float, lon2:float):
     c = 2 * math.asin(math.sqrt(a))
     return rad * c
 
+def row_positions(offsets: np.ndarray, rows: np.ndarray) -> tuple:
+    """
+    Returns the positions of the values of several rows of CSR-style arrays (the values of row i are
+    in positions offsets[i]:offsets[i + 1]).
+
+    Parameters:
+    - offsets: np.ndarray, row offsets (one more than the number of rows).
+    - rows: np.ndarray, the rows to gather.
+
+    Returns:
+    - tuple: (lengths, positions), the number of values of each row and their positions, concatenated in the order of rows.
+    """
+    starts = offsets[rows].astype(np.int64)
+    lengths = offsets[rows + 1].astype(np.int64) - starts
+    positions = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return lengths, positions
+
+def row_ranks(offsets: np.ndarray, values: np.ndarray, rows: np.ndarray, query_rows: np.ndarray, query_values: np.ndarray) -> np.ndarray:
+    """
+    Returns the position of several values within rows of CSR-style arrays whose rows hold distinct
+    values smaller than the number of rows (e.g. ordered successor tables over the vocabulary).
+
+    Parameters:
+    - offsets: np.ndarray, row offsets (one more than the number of rows).
+    - values: np.ndarray, the values aligned with the offsets.
+    - rows: np.ndarray, the rows to search.
+    - query_rows: np.ndarray, position in rows of the row of each query.
+    - query_values: np.ndarray, the value of each query.
+
+    Returns:
+    - np.ndarray: The position of each query value within its row, or len(values) if the row does not contain it.
+    """
+    num_rows = len(offsets) - 1
+    lengths, positions = row_positions(offsets, rows)
+    keys = np.repeat(np.arange(len(rows), dtype=np.int64), lengths) * num_rows + values[positions]
+    order = np.argsort(keys, kind='stable')
+    queries = query_rows.astype(np.int64) * num_rows + query_values
+
+    ranks = np.full(len(queries), len(values), dtype=np.int64)
+    if len(keys) == 0:
+        return ranks
+    found = order[np.minimum(np.searchsorted(keys, queries, sorter=order), len(keys) - 1)]
+    matched = keys[found] == queries
+    ranks[matched] = (positions - np.repeat(offsets[rows].astype(np.int64), lengths))[found[matched]]
+    return ranks
+
+def replace_rows(offsets: np.ndarray, arrays: list, rows: np.ndarray, new_lengths: np.ndarray, new_arrays: list) -> tuple:
+    """
+    Replaces the values of several rows of CSR-style arrays.
+
+    Parameters:
+    - offsets: np.ndarray, row offsets (one more than the number of rows).
+    - arrays: list, the value arrays aligned with the offsets.
+    - rows: np.ndarray, distinct rows to replace.
+    - new_lengths: np.ndarray, new number of values of each replaced row.
+    - new_arrays: list, new values of the replaced rows (concatenated in the order of rows), one per array.
+
+    Returns:
+    - tuple: (offsets, arrays), new offsets and value arrays (the inputs are not modified).
+    """
+    n_rows = len(offsets) - 1
+    lengths = np.diff(offsets)
+    replaced = np.zeros(n_rows, dtype=bool)
+    replaced[rows] = True
+    value_rows = np.repeat(np.arange(n_rows), lengths)
+    keep = ~replaced[value_rows]
+
+    # Kept values are already grouped by row: a stable sort places the new ones after them
+    order = np.argsort(np.concatenate([value_rows[keep], np.repeat(rows, new_lengths)]), kind='stable')
+
+    lengths[rows] = new_lengths
+    new_offsets = np.zeros(n_rows + 1, dtype=offsets.dtype)
+    np.cumsum(lengths, out=new_offsets[1:])
+    return new_offsets, [np.concatenate([values[keep], new_values.astype(values.dtype)])[order] for values, new_values in zip(arrays, new_arrays)]
+
+def append_empty_rows(offsets: np.ndarray, n_rows: int) -> np.ndarray:
+    """
+    Returns the offsets of CSR-style arrays with n_rows empty rows added at the end.
+    """
+    return np.concatenate([offsets, np.full(n_rows, offsets[-1], dtype=offsets.dtype)])
+
+
 #NOT USED
 def read_poi_file(file_path: str, simple=True) -> tuple:
     """
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import distances as dist
+import trails
+
+
+class PoiVocabulary:
+    """
+    Shared POI vocabulary: maps every venue ID to a contiguous int32 index and stores the POI
+    attributes as NumPy arrays aligned with that index.
+
+    POIs are indexed in order of first appearance in poi_df, followed by the venue IDs that only
+    appear in trail_df (sorted). For POIs of poi_df the attributes come from their first row.
+    """
+    # Arrays that fully describe the vocabulary (saved by BasicRouteRecommender.save)
+    ARRAYS = ('poi_ids', 'in_poi_df', 'popularity', 'latitude', 'longitude', 'has_coordinates', 'categories', 'category_labels')
+
+    def __init__(self, poi_df: pd.DataFrame, trail_df: pd.DataFrame, feature_column: str = 'category_lvlFs'):
+        """
+        Parameters:
+        - poi_df: pd.DataFrame, DataFrame with 'venue_id', 'latitude' and 'longitude' columns (and optionally feature_column).
+        - trail_df: pd.DataFrame, DataFrame with a 'venue_id' column.
+        - feature_column: str, column of poi_df holding the POI category.
+        """
+        first_rows = poi_df.drop_duplicates('venue_id')
+        poi_ids = pd.Index(first_rows['venue_id'])
+        poi_ids = poi_ids.append(pd.Index(trail_df['venue_id'].unique()).difference(poi_ids))
+        n_pois, n_features = len(poi_ids), len(first_rows)
+
+        self.poi_ids = poi_ids.to_numpy()
+
+        # Whether the POI has a row in poi_df
+        self.in_poi_df = np.zeros(n_pois, dtype=bool)
+        self.in_poi_df[:n_features] = True
+
+        # Number of visits in trail_df (from the deduplicated trails, weighted by their counts)
+        store = trails.store_of(trail_df, dedupe=True)
+        poi_codes = poi_ids.get_indexer(store.pois)
+        self.popularity = np.bincount(poi_codes, weights=store.visit_weights(), minlength=n_pois).astype(np.int64)
+
+        # Raw coordinates (NaN for POIs without a row in poi_df) and validity mask
+        self.latitude = np.full(n_pois, np.nan)
+        self.longitude = np.full(n_pois, np.nan)
+        self.latitude[:n_features] = first_rows['latitude'].to_numpy(dtype=np.float64)
+        self.longitude[:n_features] = first_rows['longitude'].to_numpy(dtype=np.float64)
+        self.has_coordinates = np.zeros(n_pois, dtype=bool)
+        self.has_coordinates[:n_features] = dist.valid_coordinates_mask(first_rows)
+
+        # Category codes into category_labels (-1 for POIs without category)
+        self.categories = np.full(n_pois, -1, dtype=np.int32)
+        self.category_labels = np.zeros(0, dtype=object)
+        if feature_column in first_rows.columns:
+            codes, labels = pd.factorize(first_rows[feature_column])
+            self.categories[:n_features] = codes
+            self.category_labels = np.asarray(labels)
+
+        self._build_index()
+
+    def _build_index(self):
+        self.poi_index = {poi: idx for idx, poi in enumerate(self.poi_ids.tolist())}
+        self._pandas_index = pd.Index(self.poi_ids)
+
+        # Projected coordinates in float32 metres, for the PROJECTED distance mode (not saved)
+        self.projection = dist.Projection(self.latitude[self.has_coordinates], self.longitude[self.has_coordinates])
+        self.x, self.y = self.projection.project(self.latitude, self.longitude)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        """
+        Rebuilds a vocabulary from its ARRAYS (as stored by BasicRouteRecommender.save).
+        """
+        vocabulary = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(vocabulary, name, arrays[name])
+        vocabulary._build_index()
+        return vocabulary
+
+    def extend(self, pois) -> int:
+        """
+        Appends the venue IDs that are not in the vocabulary yet (sorted), as POIs without a row in poi_df.
+
+        Returns:
+        - int: Number of POIs added.
+        """
+        new_pois = pd.Index(pd.unique(np.asarray(pois))).difference(self._pandas_index)
+        n_new = len(new_pois)
+        if n_new == 0:
+            return 0
+
+        self.poi_ids = np.concatenate([self.poi_ids, new_pois.to_numpy().astype(self.poi_ids.dtype)])
+        self.in_poi_df = np.concatenate([self.in_poi_df, np.zeros(n_new, dtype=bool)])
+        self.popularity = np.concatenate([self.popularity, np.zeros(n_new, dtype=np.int64)])
+        self.latitude = np.concatenate([self.latitude, np.full(n_new, np.nan)])
+        self.longitude = np.concatenate([self.longitude, np.full(n_new, np.nan)])
+        self.has_coordinates = np.concatenate([self.has_coordinates, np.zeros(n_new, dtype=bool)])
+        self.categories = np.concatenate([self.categories, np.full(n_new, -1, dtype=np.int32)])
+        self._build_index()
+        return n_new
+
+    def __len__(self) -> int:
+        return len(self.poi_ids)
+
+    def index_of(self, poi) -> int:
+        """
+        Returns the index of a venue ID, or -1 if it is not in the vocabulary.
+        """
+        return self.poi_index.get(poi, -1)
+
+    def indices(self, pois) -> np.ndarray:
+        """
+        Returns the int32 indices of several venue IDs (-1 for those not in the vocabulary).
+        """
+        return self._pandas_index.get_indexer(pois).astype(np.int32)
+
+    def distances_from(self, origin: int, candidates: np.ndarray) -> np.ndarray:
+        """
+        Distances (in km, in the current distance mode) between the raw coordinates of POI origin and of each candidate.
+        """
+        return self.pair_distances(origin, candidates)
+
+    def pair_distances(self, origins, destinations) -> np.ndarray:
+        """
+        Distances (in km, in the current distance mode) between aligned (or broadcast) origin and destination POIs.
+        """
+        if dist.distance_mode == dist.PROJECTED:
+            distances = np.hypot(self.x[destinations] - self.x[origins], self.y[destinations] - self.y[origins])
+            distances *= np.float32(1e-3)
+            return distances
+        return dist.haversine_from(self.latitude[origins], self.longitude[origins], self.latitude[destinations], self.longitude[destinations])
+
+    def popularity_order(self, candidates: np.ndarray) -> np.ndarray:
+        """
+        Returns the permutation sorting candidate indices by decreasing popularity, keeping their given order on ties.
+        """
+        return np.lexsort((np.arange(len(candidates)), -self.popularity[candidates]))
+
+    def distance_order(self, candidates: np.ndarray, distances: np.ndarray) -> np.ndarray:
+        """
+        Returns the permutation sorting candidate indices by increasing distance, keeping their given
+        order on ties. Candidates without valid coordinates go last.
+        """
+        return np.lexsort((np.arange(len(candidates)), distances, ~self.has_coordinates[candidates]))
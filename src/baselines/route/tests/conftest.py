@@ -0,0 +1,55 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+ROUTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROUTE_DIR, "our_baselines"))
+sys.path.insert(0, os.path.join(ROUTE_DIR, "benchmark"))
+
+from synthetic_city import generate_city
+import distances as dist
+
+
+@pytest.fixture
+def haversine_mode(monkeypatch):
+    """
+    Runs a test in the HAVERSINE distance mode (restoring the previous mode afterwards).
+    """
+    monkeypatch.setattr(dist, "distance_mode", dist.HAVERSINE)
+
+
+@pytest.fixture(scope="session")
+def tie_city() -> tuple:
+    """
+    Small synthetic city with its coordinates snapped to a 0.01 degree grid, so many POI pairs are at
+    exactly the same distance and many close distances merge when rounded to float32.
+
+    Returns:
+    - tuple: (poi_df, train_df, test_df) with the columns read by main.py.
+    """
+    poi_df, train_df, test_df = generate_city(150, 25, 220, mean_trail_length=4.0, n_categories=8, n_districts=6,
+                                              invalid_fraction=0.02, seed=7)
+    located = poi_df['latitude'] != -1
+    poi_df.loc[located, 'latitude'] = poi_df.loc[located, 'latitude'].round(2)
+    poi_df.loc[located, 'longitude'] = poi_df.loc[located, 'longitude'].round(2)
+    return poi_df, train_df, test_df
+
+
+def start_pois(test_df: pd.DataFrame) -> list:
+    """
+    Returns the (user, first visited POI) pairs of the test users, as main.py queries them.
+    """
+    first_visits = test_df.loc[test_df.groupby('user_id', sort=False)['timestamp'].idxmin()]
+    return list(zip(first_visits['user_id'].tolist(), first_visits['venue_id'].tolist()))
+
+
+def located_first(poi_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Moves the POIs without coordinates after the others (with a fresh index). The original
+    WeightedTransitions loop mixed index labels and positions, which only skipped pairs when a POI
+    without coordinates came before located ones.
+    """
+    located = poi_df['latitude'] != -1
+    return pd.concat([poi_df[located], poi_df[~located]], ignore_index=True)
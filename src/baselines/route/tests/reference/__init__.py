@@ -0,0 +1,4 @@
+"""
+Route recommenders of the original implementation, kept verbatim apart from package-relative imports,
+so the tests can check that the vectorised recommenders still produce the same routes.
+"""
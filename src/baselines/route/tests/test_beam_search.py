@@ -0,0 +1,40 @@
+import itertools
+import pytest
+from KNNRouteRecommender import KNNRouteRecommender
+from POIMarkovChainRecommender import MarkovRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+from WeightedTransitionsRouteRecommender import WeightedTransitionsRouteRecommender
+
+RECOMMENDERS = {
+    "Markov": lambda poi_df, train_df: MarkovRouteRecommender(poi_df, train_df),
+    "KNN": lambda poi_df, train_df: KNNRouteRecommender(poi_df, train_df, 5),
+    "WeightedTransitions": lambda poi_df, train_df: WeightedTransitionsRouteRecommender(poi_df, train_df),
+}
+
+
+@pytest.fixture(scope="module")
+def queries(tie_city) -> list:
+    """
+    Every (user, POI) pair of the test visits, so routes start from many POIs.
+    """
+    _, _, test_df = tie_city
+    pairs = test_df[['user_id', 'venue_id']].drop_duplicates()
+    return list(zip(pairs['user_id'].tolist(), pairs['venue_id'].tolist()))
+
+
+@pytest.mark.parametrize("name,filter_visits,tiebreaker", [
+    (name, filter_visits, tiebreaker) for name, (filter_visits, tiebreaker) in itertools.product(RECOMMENDERS, itertools.product(VisitFilter, TieBreaker))
+])
+def test_width_one_matches_recommend_from_poi(tie_city, queries, name, filter_visits, tiebreaker):
+    poi_df, train_df, _ = tie_city
+    recommender = RECOMMENDERS[name](poi_df, train_df)
+    compared = 0
+    for user, starting_poi in queries:
+        try:
+            expected = recommender.recommend_from_poi(user, 20, starting_poi, filter_visits, tiebreaker)
+        except ValueError:
+            # Starting POIs outside poi_df (Markov) or distance ties from them (KNN)
+            continue
+        assert recommender.recommend_beam_search(user, 20, starting_poi, filter_visits, tiebreaker, beam_width=1) == expected
+        compared += 1
+    assert compared >= 0.9 * len(queries)
@@ -0,0 +1,101 @@
+import numpy as np
+import utils as ut
+import distances as dist
+from ClosestNNRouteRecommender import ClosestNNRouteRecommender
+from FeatureMarkovChainRecommender import FeatureMarkovRouteRecommender
+from POIMarkovChainRecommender import MarkovRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+
+
+def reference_matrix(latitudes, longitudes) -> np.ndarray:
+    """
+    Distance matrix of the original per-pair loops: utils.haversine over the upper triangle, mirrored.
+    """
+    n = len(latitudes)
+    matrix = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            matrix[i, j] = matrix[j, i] = ut.haversine(latitudes[i], longitudes[i], latitudes[j], longitudes[j])
+    return matrix
+
+
+def test_pairwise_haversine_within_tolerance():
+    rng = np.random.default_rng(0)
+    latitudes = np.concatenate([40.7 + rng.random(150) * 0.2, rng.uniform(-80, 80, 50)])
+    longitudes = np.concatenate([-74.0 + rng.random(150) * 0.2, rng.uniform(-180, 180, 50)])
+    expected = reference_matrix(latitudes, longitudes)
+
+    distances = dist.pairwise_haversine(latitudes, longitudes, block_size=64)
+    assert distances.dtype == np.float32
+    assert np.all(np.abs(distances - expected) <= dist.DISTANCE_RTOL * expected + dist.DISTANCE_ATOL_KM)
+
+
+def test_haversine_pairs_match_utils(tie_city):
+    poi_df = tie_city[0]
+    latitudes, longitudes = poi_df['latitude'].to_numpy(), poi_df['longitude'].to_numpy()
+    first, second = np.triu_indices(len(poi_df), 1)
+    expected = [ut.haversine(latitudes[i], longitudes[i], latitudes[j], longitudes[j]) for i, j in zip(first, second)]
+    np.testing.assert_array_equal(dist.haversine_pairs(latitudes, longitudes, first, second), expected)
+
+
+def test_tie_bound_covers_the_tolerance():
+    exact = np.array([1.0, 1.0 + 2e-6, 1.0 + 5e-6])
+    stored = (exact * (1 + np.array([dist.DISTANCE_RTOL, -dist.DISTANCE_RTOL, 0]))).astype(np.float32)
+    assert stored[1] <= dist.tie_bound(stored.min())
+    assert stored[2] > dist.tie_bound(stored.min())
+
+
+def test_float32_ties_are_rechecked(haversine_mode, tie_city):
+    poi_df, train_df, test_df = tie_city
+    recommender = ClosestNNRouteRecommender(poi_df, train_df)
+    cache = recommender.distance_cache
+    latitudes = poi_df.set_index('venue_id').loc[cache.index, 'latitude'].to_numpy()
+    longitudes = poi_df.set_index('venue_id').loc[cache.index, 'longitude'].to_numpy()
+    expected = reference_matrix(latitudes, longitudes)
+
+    # The fixture has distinct distances that float32 merges, or the test would not exercise the re-check
+    merged = (cache.to_numpy()[:, :, None] == cache.to_numpy()[:, None, :]) & (expected[:, :, None] != expected[:, None, :])
+    assert merged.any()
+
+    for user, starting_poi in [(0, poi) for poi in cache.index[:40]]:
+        route = recommender.recommend_from_poi(user, 10, starting_poi, VisitFilter.ALLOW_PREVIOUS_VISITS, TieBreaker.DISTANCE)
+        positions = cache.index.get_indexer(route)
+        for step in range(1, len(positions)):
+            candidates = np.setdiff1d(np.arange(len(cache)), positions[:step])
+            distances = expected[positions[step - 1], candidates]
+            # The next POI is the first (in column order) at the exact minimum distance
+            assert positions[step] == candidates[np.argmax(distances == distances.min())]
+
+
+def test_markov_distance_order_is_exact(haversine_mode, tie_city):
+    poi_df, train_df, _ = tie_city
+    recommender = MarkovRouteRecommender(poi_df, train_df)
+    vocabulary = recommender.vocabulary
+    latitudes, longitudes = vocabulary.latitude, vocabulary.longitude
+
+    for row in np.flatnonzero(vocabulary.has_coordinates):
+        successors = recommender.successors_by_distance[recommender.successor_offsets[row]:recommender.successor_offsets[row + 1]]
+        successors = successors[vocabulary.has_coordinates[successors]]
+        low, high = np.minimum(row, successors), np.maximum(row, successors)
+        distances = [ut.haversine(latitudes[i], longitudes[i], latitudes[j], longitudes[j]) for i, j in zip(low, high)]
+        np.testing.assert_array_equal(successors, successors[np.lexsort((successors, distances))])
+
+
+def test_feature_markov_closest_is_exact(haversine_mode, tie_city):
+    poi_df, train_df, _ = tie_city
+    recommender = FeatureMarkovRouteRecommender(poi_df, train_df, "category_lvlFs")
+    vocabulary = recommender.vocabulary
+    latitudes, longitudes = vocabulary.latitude, vocabulary.longitude
+    located = np.flatnonzero(recommender.cache_positions >= 0)
+
+    for origin in located:
+        excluded = np.zeros(len(vocabulary), dtype=bool)
+        excluded[origin] = True
+        for feature in range(len(vocabulary.category_labels)):
+            pois = located[(vocabulary.categories[located] == feature) & ~excluded[located]]
+            if len(pois) == 0:
+                continue
+            low, high = np.minimum(origin, pois), np.maximum(origin, pois)
+            distances = np.array([ut.haversine(latitudes[i], longitudes[i], latitudes[j], longitudes[j]) for i, j in zip(low, high)])
+            # The closest POI is the first (in vocabulary order) at the exact minimum distance
+            assert recommender._closest_in_feature(feature, origin, excluded) == (distances.min(), pois[np.argmax(distances == distances.min())])
@@ -0,0 +1,62 @@
+import importlib.util
+import os
+import numpy as np
+import pytest
+from conftest import ROUTE_DIR
+import evaluation as ev
+
+
+def load_reference_metrics():
+    """
+    Imports Utils/metrics.py of the rp3beta baseline (a module named metrics, outside sys.path).
+    """
+    path = os.path.join(ROUTE_DIR, "..", "classic", "rp3beta", "Utils", "metrics.py")
+    spec = importlib.util.spec_from_file_location("rp3beta_metrics", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+metrics = load_reference_metrics()
+
+
+@pytest.fixture(scope="module")
+def evaluated(tie_city):
+    """
+    Test routes of the fixture city and random routes for most of its test users: some shorter than the
+    cutoffs, some empty, and some users without a route at all.
+    """
+    poi_df, _, test_df = tie_city
+    evaluator = ev.RouteEvaluator(test_df, poi_df, [1, 3, 5, 10])
+    rng = np.random.default_rng(3)
+    users, routes = [], []
+    for code, user in enumerate(evaluator.users[:-5]):
+        test_pois = evaluator.poi_ids[evaluator.test_routes[code][:evaluator.test_lengths[code]]]
+        pool = np.unique(np.concatenate([test_pois, rng.choice(poi_df['venue_id'].to_numpy(), 10, replace=False)]))
+        users.append(user)
+        routes.append(rng.permutation(pool)[:rng.integers(0, 12)].tolist())
+    return evaluator, dict(zip(users, routes)), evaluator.evaluate(users, routes)
+
+
+@pytest.mark.parametrize("k", [1, 3, 5, 10])
+def test_ranking_metrics_match_utils_metrics(evaluated, k):
+    evaluator, routes, scores = evaluated
+    precisions, recalls, ndcgs = [], [], []
+    for code, user in enumerate(evaluator.users):
+        pos_items = evaluator.poi_ids[evaluator.test_routes[code][:evaluator.test_lengths[code]]].to_numpy()
+        route = np.array(routes.get(user, [])[:k])
+        # Utils/metrics.py scores lists of k recommendations: missing positions are misses
+        is_relevant = np.zeros(k, dtype=bool)
+        is_relevant[:len(route)] = np.isin(route, pos_items)
+
+        precisions.append(metrics.precision(is_relevant))
+        recalls.append(metrics.recall(is_relevant, pos_items))
+        # Ideal DCG cut at k (metrics.ndcg places every relevant POI, see ndcg_at)
+        ideal = metrics.dcg(np.ones(min(len(pos_items), k), dtype=np.float32))
+        ndcgs.append(metrics.dcg(is_relevant.astype(np.float32)) / ideal)
+        if len(pos_items) <= k:
+            assert ndcgs[-1] == pytest.approx(metrics.ndcg(route, pos_items, at=k), rel=1e-6)
+
+    assert scores[f"P@{k}"] == pytest.approx(np.mean(precisions), rel=1e-6)
+    assert scores[f"R@{k}"] == pytest.approx(np.mean(recalls), rel=1e-6)
+    assert scores[f"NDCG@{k}"] == pytest.approx(np.mean(ndcgs), rel=1e-6)
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from conftest import start_pois
+from KNNRouteRecommender import KNNRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+
+# User 10 shares POI 2 with user 20, who shares POI 3 with user 30 (similarity 0 with user 10)
+TRAILS = pd.DataFrame({
+    'trail_id': [1, 1, 2, 2, 3, 3],
+    'user_id': [10, 10, 20, 20, 30, 30],
+    'venue_id': [1, 2, 2, 3, 3, 4],
+    'timestamp': [0, 1, 0, 1, 0, 1],
+})
+POIS = pd.DataFrame({
+    'venue_id': [1, 2, 3, 4],
+    'latitude': [40.70, 40.71, 40.72, 40.73],
+    'longitude': [-74.00, -74.01, -74.02, -74.03],
+})
+
+
+def test_zero_similarity_users_are_not_neighbours():
+    recommender = KNNRouteRecommender(POIS, TRAILS, k=2)
+    route = recommender.recommend_from_poi(10, 4, 2, VisitFilter.ALLOW_PREVIOUS_VISITS, TieBreaker.DISTANCE)
+    assert route == [2, 3]
+
+
+def test_pad_neighbours_keeps_routes_going():
+    recommender = KNNRouteRecommender(POIS, TRAILS, k=2, pad_neighbours=True)
+    neighbor_ranks, similarities = recommender._neighbors(recommender.user_uidx_map[10])
+    assert neighbor_ranks.tolist() == [-1, 0, 1]
+    assert similarities[1] == 0
+
+    for recommend in [recommender.recommend_from_poi, recommender.recommend_beam_search]:
+        route = recommend(10, 4, 2, VisitFilter.ALLOW_PREVIOUS_VISITS, TieBreaker.DISTANCE)
+        assert route == [2, 3, 4]
+
+
+@pytest.mark.parametrize("tiebreaker", list(TieBreaker))
+def test_exclude_previous_visits(tie_city, tiebreaker):
+    poi_df, train_df, test_df = tie_city
+    recommender = KNNRouteRecommender(poi_df, train_df, k=5)
+    for user, starting_poi in start_pois(test_df):
+        route = recommender.recommend_from_poi(user, 20, starting_poi, VisitFilter.EXCLUDE_PREVIOUS_VISITS, tiebreaker)
+        assert not set(route[1:]) & recommender.visited_pois(user)
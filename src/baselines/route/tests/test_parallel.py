@@ -0,0 +1,23 @@
+from conftest import start_pois
+import parallel
+from POIMarkovChainRecommender import MarkovRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+
+
+def test_share_arrays_shares_the_vocabulary(tie_city, monkeypatch):
+    poi_df, train_df, test_df = tie_city
+    recommender = MarkovRouteRecommender(poi_df, train_df)
+    users, starting_pois = map(list, zip(*start_pois(test_df)))
+    expected = recommender.recommend_batch(users, starting_pois, 10, VisitFilter.EXCLUDE_PREVIOUS_VISITS, TieBreaker.DISTANCE)
+
+    monkeypatch.setattr(parallel, "MIN_SHARED_BYTES", 0)
+    handles = parallel.share_arrays(recommender)
+    try:
+        for name in ['popularity', 'latitude', 'longitude', 'has_coordinates', 'x', 'y']:
+            assert isinstance(getattr(recommender.vocabulary, name), parallel.SharedArray)
+
+        routes = parallel.recommend_batch_parallel(recommender, users, starting_pois, 10, VisitFilter.EXCLUDE_PREVIOUS_VISITS,
+                                                   TieBreaker.DISTANCE, workers=2)
+        assert routes == expected
+    finally:
+        parallel.release(handles)
@@ -0,0 +1,79 @@
+import itertools
+import json
+import os
+import pytest
+from conftest import start_pois
+import distances as dist
+import persistence
+from BaselineSinglePOIRecommender import BaselineSinglePOIRecommender
+from ClosestNNRouteRecommender import ClosestNNRouteRecommender
+from FeatureMarkovChainRecommender import FeatureMarkovRouteRecommender
+from KNNRouteRecommender import KNNRouteRecommender
+from POIMarkovChainRecommender import MarkovRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+from VariableOrderMarkovRecommender import VariableOrderMarkovRouteRecommender
+from WeightedTransitionsRouteRecommender import WeightedTransitionsRouteRecommender
+
+RECOMMENDERS = {
+    "BaselineSinglePOI": lambda poi_df, train_df: BaselineSinglePOIRecommender(poi_df, train_df),
+    "ClosestNN": lambda poi_df, train_df: ClosestNNRouteRecommender(poi_df, train_df),
+    "Markov": lambda poi_df, train_df: MarkovRouteRecommender(poi_df, train_df),
+    "FeatureMarkov": lambda poi_df, train_df: FeatureMarkovRouteRecommender(poi_df, train_df, "category_lvlFs"),
+    "KNN": lambda poi_df, train_df: KNNRouteRecommender(poi_df, train_df, 5),
+    "WeightedTransitions": lambda poi_df, train_df: WeightedTransitionsRouteRecommender(poi_df, train_df),
+    "VariableOrderMarkov": lambda poi_df, train_df: VariableOrderMarkovRouteRecommender(poi_df, train_df),
+}
+
+
+def all_routes(recommender, test_df) -> list:
+    """
+    Routes of every test query in every configuration (the type of the error for the queries that raise).
+    """
+    routes = []
+    for (user, starting_poi), (filter_visits, tiebreaker) in itertools.product(start_pois(test_df), itertools.product(VisitFilter, TieBreaker)):
+        try:
+            routes.append(recommender.recommend_from_poi(user, 20, starting_poi, filter_visits, tiebreaker))
+        except (KeyError, ValueError) as error:
+            routes.append(type(error))
+    return routes
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("name", list(RECOMMENDERS))
+def test_loaded_model_gives_the_same_routes(tie_city, tmp_path, name, mmap):
+    poi_df, train_df, test_df = tie_city
+    recommender = RECOMMENDERS[name](poi_df, train_df)
+    recommender.save(str(tmp_path))
+    loaded = type(recommender).load(str(tmp_path), poi_df, train_df, mmap=mmap)
+    assert all_routes(loaded, test_df) == all_routes(recommender, test_df)
+
+
+@pytest.fixture
+def saved_model(tie_city, tmp_path) -> str:
+    poi_df, train_df, _ = tie_city
+    MarkovRouteRecommender(poi_df, train_df).save(str(tmp_path))
+    return str(tmp_path)
+
+
+def test_load_refuses_another_dataset(tie_city, saved_model):
+    poi_df, train_df, _ = tie_city
+    with pytest.raises(ValueError, match="different dataset"):
+        MarkovRouteRecommender.load(saved_model, poi_df, train_df.iloc[:-1])
+
+
+def test_load_refuses_another_format_version(tie_city, saved_model):
+    poi_df, train_df, _ = tie_city
+    manifest = persistence.read_manifest(saved_model)
+    manifest['format_version'] = persistence.MODEL_FORMAT_VERSION - 1
+    with open(os.path.join(saved_model, persistence.MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError, match="model format"):
+        MarkovRouteRecommender.load(saved_model, poi_df, train_df)
+
+
+def test_load_refuses_another_distance_mode(tie_city, saved_model, monkeypatch):
+    poi_df, train_df, _ = tie_city
+    other_mode = dist.HAVERSINE if dist.distance_mode == dist.PROJECTED else dist.PROJECTED
+    monkeypatch.setattr(dist, "distance_mode", other_mode)
+    with pytest.raises(ValueError, match="distance mode"):
+        MarkovRouteRecommender.load(saved_model, poi_df, train_df)
@@ -0,0 +1,115 @@
+import itertools
+import pandas as pd
+import pytest
+from conftest import located_first, start_pois
+from BaselineSinglePOIRecommender import BaselineSinglePOIRecommender
+from ClosestNNRouteRecommender import ClosestNNRouteRecommender
+from FeatureMarkovChainRecommender import FeatureMarkovRouteRecommender
+from KNNRouteRecommender import KNNRouteRecommender
+from POIMarkovChainRecommender import MarkovRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+from reference import BaselineSinglePOIRecommender as reference_baseline
+from reference import ClosestNNRouteRecommender as reference_closest
+from reference import FeatureMarkovChainRecommender as reference_feature_markov
+from reference import KNNRouteRecommender as reference_knn
+from reference import POIMarkovChainRecommender as reference_markov
+from reference.Recommenders import TieBreaker as ReferenceTieBreaker, VisitFilter as ReferenceVisitFilter
+
+CONFIGURATIONS = list(itertools.product(VisitFilter, TieBreaker))
+
+# The original Markov model divides the rows of POIs without transitions by 0
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered in divide:RuntimeWarning")
+
+RECOMMENDERS = {
+    "BaselineSinglePOI": (lambda poi_df, train_df: BaselineSinglePOIRecommender(poi_df, train_df),
+                          lambda poi_df, train_df: reference_baseline.BaselineSinglePOIRecommender(poi_df, train_df)),
+    "ClosestNN": (lambda poi_df, train_df: ClosestNNRouteRecommender(poi_df, train_df),
+                  lambda poi_df, train_df: reference_closest.ClosestNNRouteRecommender(poi_df, train_df)),
+    "Markov": (lambda poi_df, train_df: MarkovRouteRecommender(poi_df, train_df),
+               lambda poi_df, train_df: reference_markov.MarkovRouteRecommender(poi_df, train_df)),
+    # Every user of the fixture overlaps with at least 5 others, so the zero-similarity neighbours the
+    # original could add (see KNNRouteRecommender) do not arise
+    "KNN": (lambda poi_df, train_df: KNNRouteRecommender(poi_df, train_df, 5),
+            lambda poi_df, train_df: reference_knn.KNNRouteRecommender(poi_df, train_df, 5)),
+}
+
+
+@pytest.fixture(scope="module")
+def city(tie_city):
+    poi_df, train_df, test_df = tie_city
+    return located_first(poi_df), train_df, test_df
+
+
+@pytest.fixture(scope="module")
+def fitted(city):
+    """
+    Both versions of every recommender, fitted once per module (lazily, by name).
+    """
+    poi_df, train_df, _ = city
+    cache = {}
+
+    def get(name: str) -> tuple:
+        if name not in cache:
+            build, build_reference = RECOMMENDERS[name]
+            cache[name] = build(poi_df, train_df), build_reference(poi_df, train_df)
+        return cache[name]
+    return get
+
+
+def assert_same_routes(recommender, reference_recommender, queries, filter_visits, tiebreaker, n_items=20):
+    """
+    Checks that both recommenders give the same route for every query the original could answer.
+    """
+    compared = 0
+    for user, starting_poi in queries:
+        try:
+            expected = reference_recommender.recommend_from_poi(
+                user, n_items, starting_poi, ReferenceVisitFilter[filter_visits.name], ReferenceTieBreaker[tiebreaker.name]
+            )
+        except (KeyError, ValueError):
+            # The original looked POIs without coordinates up in its distance cache
+            continue
+        assert recommender.recommend_from_poi(user, n_items, starting_poi, filter_visits, tiebreaker) == expected
+        compared += 1
+    assert compared >= 0.9 * len(queries)
+
+
+# The original KNN recommender ignored EXCLUDE_PREVIOUS_VISITS (its visited set only held the route),
+# so only its ALLOW_PREVIOUS_VISITS routes are compared (test_knn checks the filter)
+ROUTE_CASES = [(name, filter_visits, tiebreaker) for name in ["BaselineSinglePOI", "ClosestNN", "Markov", "KNN"]
+               for filter_visits, tiebreaker in CONFIGURATIONS
+               if name != "KNN" or filter_visits == VisitFilter.ALLOW_PREVIOUS_VISITS]
+
+
+@pytest.mark.parametrize("name,filter_visits,tiebreaker", ROUTE_CASES)
+def test_routes_match_reference(haversine_mode, city, fitted, name, filter_visits, tiebreaker):
+    _, _, test_df = city
+    recommender, reference_recommender = fitted(name)
+    assert_same_routes(recommender, reference_recommender, start_pois(test_df), filter_visits, tiebreaker)
+
+
+@pytest.fixture(scope="module")
+def poi_ordered_city(city):
+    """
+    The city with the visits of every trail in poi_df order and without repeated POIs. The original
+    FeatureMarkov model read the POIs of a trail in that order (it filtered poi_df with isin), so it
+    counts the same transitions as the current one, which follows the trail order with repetitions.
+    """
+    poi_df, train_df, test_df = city
+    positions = train_df['venue_id'].map(dict(zip(poi_df['venue_id'], range(len(poi_df)))))
+    train_df = train_df.assign(position=positions).sort_values(['trail_id', 'position'], kind='stable')
+    train_df = train_df.drop_duplicates(['trail_id', 'venue_id']).drop(columns='position').reset_index(drop=True)
+    return poi_df, train_df, test_df
+
+
+@pytest.mark.parametrize("filter_visits,tiebreaker", CONFIGURATIONS)
+def test_feature_markov_routes_match_reference(haversine_mode, monkeypatch, poi_ordered_city, filter_visits, tiebreaker):
+    poi_df, train_df, test_df = poi_ordered_city
+    recommender = FeatureMarkovRouteRecommender(poi_df, train_df, "category_lvlFs")
+    reference_recommender = reference_feature_markov.FeatureMarkovRouteRecommender(poi_df, train_df, "category_lvlFs")
+
+    # The original ordered tied candidates with pandas' default (unstable) quicksort; ties now keep
+    # poi_df order, which is what a stable sort gives
+    sort_values = pd.DataFrame.sort_values
+    monkeypatch.setattr(pd.DataFrame, "sort_values", lambda frame, *args, **kwargs: sort_values(frame, *args, **kwargs, kind='stable'))
+    assert_same_routes(recommender, reference_recommender, start_pois(test_df), filter_visits, tiebreaker)
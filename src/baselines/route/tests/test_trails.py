@@ -0,0 +1,41 @@
+import pandas as pd
+import trails
+from POIMarkovChainRecommender import MarkovRouteRecommender
+
+TRAILS = pd.DataFrame({
+    'trail_id': [1, 1, 2, 2, 3, 3],
+    'user_id': [10, 10, 20, 20, 10, 10],
+    'venue_id': [1, 2, 2, 3, 3, 4],
+    'timestamp': [100, 200, 100, 200, 50, 60],
+})
+POIS = pd.DataFrame({
+    'venue_id': [1, 2, 3, 4, 5],
+    'latitude': [40.70, 40.71, 40.72, 40.73, 40.74],
+    'longitude': [-74.00, -74.01, -74.02, -74.03, -74.04],
+    'category_lvlFs': ['a', 'b', 'a', 'b', 'a'],
+})
+
+
+def test_store_follows_in_place_changes():
+    trail_df = TRAILS.copy()
+    store = trails.store_of(trail_df)
+    assert trails.store_of(trail_df) is store
+    assert trails.store_of(trail_df, dedupe=True) is trails.store_of(trail_df, dedupe=True)
+
+    trail_df.loc[0, 'venue_id'] = 5
+    rebuilt = trails.store_of(trail_df)
+    assert rebuilt is not store
+    assert rebuilt.pois.tolist() == [5, 2, 2, 3, 3, 4]
+    assert trails.store_of(trail_df, dedupe=True).pois.tolist() == [5, 2, 2, 3, 3, 4]
+
+
+def test_last_visited_poi_follows_row_order():
+    recommender = MarkovRouteRecommender(POIS, TRAILS)
+    # User 10's last row is in trail 3, although trail 1 starts later
+    assert recommender.last_visited_poi(10) == 4
+    assert recommender.last_visited_poi(20) == 3
+    assert recommender.last_visited_poi(30) is None
+
+    recommender.update(pd.DataFrame({'trail_id': [4, 4], 'user_id': [30, 30], 'venue_id': [2, 5], 'timestamp': [0, 1]}))
+    assert recommender.last_visited_poi(10) == 4
+    assert recommender.last_visited_poi(30) == 5
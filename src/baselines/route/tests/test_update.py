@@ -0,0 +1,52 @@
+import itertools
+import numpy as np
+import pytest
+from conftest import start_pois
+from KNNRouteRecommender import KNNRouteRecommender
+from POIMarkovChainRecommender import MarkovRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+from WeightedTransitionsRouteRecommender import WeightedTransitionsRouteRecommender
+
+RECOMMENDERS = {
+    "Markov": lambda poi_df, train_df: MarkovRouteRecommender(poi_df, train_df),
+    "KNN": lambda poi_df, train_df: KNNRouteRecommender(poi_df, train_df, 5),
+    "WeightedTransitions": lambda poi_df, train_df: WeightedTransitionsRouteRecommender(poi_df, train_df),
+}
+
+
+@pytest.fixture(scope="module")
+def split_city(tie_city) -> tuple:
+    """
+    The fixture city with its training trails split in two: the new trails are the fifth with the
+    largest ids (update places them after the old ones), and the last five belong to a new user.
+
+    Returns:
+    - tuple: (poi_df, train_df, test_df, old_trails, new_trails).
+    """
+    poi_df, train_df, test_df = tie_city
+    trail_ids = np.sort(train_df['trail_id'].unique())
+    train_df = train_df.copy()
+    train_df.loc[train_df['trail_id'].isin(trail_ids[-5:]), 'user_id'] = train_df['user_id'].max() + 1
+    is_new = train_df['trail_id'].isin(trail_ids[-len(trail_ids) // 5:])
+    return poi_df, train_df, test_df, train_df[~is_new], train_df[is_new]
+
+
+@pytest.mark.parametrize("name,filter_visits,tiebreaker", [
+    (name, filter_visits, tiebreaker) for name, (filter_visits, tiebreaker) in itertools.product(RECOMMENDERS, itertools.product(VisitFilter, TieBreaker))
+])
+def test_update_matches_refit(split_city, name, filter_visits, tiebreaker):
+    poi_df, train_df, test_df, old_trails, new_trails = split_city
+    updated = RECOMMENDERS[name](poi_df, old_trails)
+    updated.update(new_trails)
+    refitted = RECOMMENDERS[name](poi_df, train_df)
+
+    compared = 0
+    for user, starting_poi in start_pois(test_df):
+        try:
+            expected = refitted.recommend_from_poi(user, 20, starting_poi, filter_visits, tiebreaker)
+        except ValueError:
+            # Starting POIs outside poi_df (Markov) or distance ties from them (KNN)
+            continue
+        assert updated.recommend_from_poi(user, 20, starting_poi, filter_visits, tiebreaker) == expected
+        compared += 1
+    assert compared >= 0.9 * len(start_pois(test_df))
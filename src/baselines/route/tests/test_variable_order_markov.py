@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+from Recommenders import TieBreaker, VisitFilter
+from VariableOrderMarkovRecommender import VariableOrderMarkovRouteRecommender
+
+
+def test_root_counts_are_visit_counts(tie_city):
+    poi_df, train_df, _ = tie_city
+    recommender = VariableOrderMarkovRouteRecommender(poi_df, train_df)
+    root = slice(recommender.successor_offsets[0], recommender.successor_offsets[1])
+
+    visits = recommender.vocabulary.indices(train_df['venue_id'].to_numpy())
+    expected = np.bincount(visits, minlength=len(recommender.vocabulary))
+    counts = np.zeros(len(recommender.vocabulary), dtype=np.int64)
+    counts[recommender.successor_pois[root]] = recommender.successor_counts[root]
+    np.testing.assert_array_equal(counts, expected)
+
+
+def test_distance_ties_from_a_poi_without_coordinates():
+    # POI 1 has invalid coordinates (-1, -1), from which POI 3 would look closer than POI 2
+    poi_df = pd.DataFrame({'venue_id': [1, 2, 3], 'latitude': [-1, 40.0, -1.5], 'longitude': [-1, -74.0, -1.5]})
+    trail_df = pd.DataFrame({'trail_id': [1, 1, 2, 2], 'user_id': [10, 10, 20, 20], 'venue_id': [1, 2, 1, 3], 'timestamp': [0, 1, 0, 1]})
+    recommender = VariableOrderMarkovRouteRecommender(poi_df, trail_df)
+    route = recommender.recommend_from_poi(10, 2, 1, VisitFilter.ALLOW_PREVIOUS_VISITS, TieBreaker.DISTANCE)
+    assert route == [1, 2]
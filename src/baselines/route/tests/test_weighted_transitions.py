@@ -0,0 +1,71 @@
+import itertools
+import pytest
+from conftest import located_first, start_pois
+from WeightedTransitionsRouteRecommender import WeightedTransitionsRouteRecommender
+from Recommenders import TieBreaker, VisitFilter
+from reference import WeightedTransitionsRouteRecommender as reference
+from reference.Recommenders import TieBreaker as ReferenceTieBreaker, VisitFilter as ReferenceVisitFilter
+
+
+@pytest.fixture(scope="module")
+def city(tie_city):
+    poi_df, train_df, test_df = tie_city
+    return located_first(poi_df), train_df, test_df
+
+
+@pytest.fixture(scope="module")
+def reference_recommender(city):
+    poi_df, train_df, _ = city
+    return reference.WeightedTransitionsRouteRecommender(poi_df, train_df)
+
+
+def test_distance_weights_match_reference(haversine_mode, city, reference_recommender):
+    poi_df, train_df, _ = city
+    recommender = WeightedTransitionsRouteRecommender(poi_df, train_df, n_distance_neighbours=None)
+    poi_ids = recommender.vocabulary.poi_ids
+
+    weights = recommender.distance_weights.tocoo()
+    actual = {(poi_ids[i], poi_ids[j]): value for i, j, value in zip(weights.row, weights.col, weights.data)}
+    expected = {(poi, neighbour): value for poi, neighbours in reference_recommender.distance_weights.items()
+                for neighbour, value in neighbours.items()}
+    # Bit-identical, as weights 1 ulp apart already flip ties between neighbours
+    assert actual == expected
+
+
+@pytest.mark.parametrize("filter_visits,tiebreaker", list(itertools.product(VisitFilter, TieBreaker)))
+def test_routes_match_reference(haversine_mode, city, reference_recommender, filter_visits, tiebreaker):
+    poi_df, train_df, test_df = city
+    recommender = WeightedTransitionsRouteRecommender(poi_df, train_df, n_distance_neighbours=None)
+
+    for user, starting_poi in start_pois(test_df):
+        expected = reference_recommender.recommend_from_poi(
+            user, 20, starting_poi, ReferenceVisitFilter[filter_visits.name], ReferenceTieBreaker[tiebreaker.name]
+        )
+        assert recommender.recommend_from_poi(user, 20, starting_poi, filter_visits, tiebreaker) == expected
+
+
+@pytest.mark.parametrize("tiebreaker", list(TieBreaker))
+def test_recommend_from_poi_follows_the_walk(tie_city, tiebreaker):
+    poi_df, train_df, test_df = tie_city
+    recommender = WeightedTransitionsRouteRecommender(poi_df, train_df)
+    users, starting_pois = map(list, zip(*start_pois(test_df)))
+    greedy = recommender.recommend_batch(users, starting_pois, 10, VisitFilter.EXCLUDE_PREVIOUS_VISITS, tiebreaker)
+
+    recommender.walk_restart = 0.15
+    routes = recommender.recommend_batch(users, starting_pois, 10, VisitFilter.EXCLUDE_PREVIOUS_VISITS, tiebreaker)
+    assert routes != greedy
+    assert [recommender.recommend_from_poi(user, 10, poi, VisitFilter.EXCLUDE_PREVIOUS_VISITS, tiebreaker)
+            for user, poi in zip(users, starting_pois)] == routes
+
+
+def test_walk_operator_is_rebuilt_after_update(tie_city):
+    poi_df, train_df, _ = tie_city
+    trail_ids = train_df['trail_id'].unique()
+    old_trails = train_df[train_df['trail_id'].isin(trail_ids[:-20])]
+    recommender = WeightedTransitionsRouteRecommender(poi_df, old_trails)
+    operator = recommender._walk_operator()
+    assert recommender._walk_operator() is operator
+
+    recommender.update(train_df[~train_df['trail_id'].isin(old_trails['trail_id'])])
+    expected = WeightedTransitionsRouteRecommender(poi_df, train_df)._walk_operator()
+    assert (abs(recommender._walk_operator() - expected) > 1e-6).nnz == 0